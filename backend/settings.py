@@ -62,14 +62,18 @@ CORS_ALLOWED_ORIGINS = [
 ]
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.RequestTimingMiddleware',  # Outermost of ours, so its total covers the rest
+    'core.middleware.DatabaseLimitsMiddleware',  # Statement timeout / query budget per view class
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For serving static files in production
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RequestProfilerMiddleware',  # Staff-only, on demand; needs request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -99,7 +103,7 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 if os.getenv('POSTGRES_DB'):
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'core.db_backends.postgresql',  # Django's backend plus connect-time metrics
             'NAME': os.getenv('POSTGRES_DB'),
             'USER': os.getenv('POSTGRES_USER'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
@@ -110,11 +114,129 @@ if os.getenv('POSTGRES_DB'):
 else:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'ENGINE': 'core.db_backends.sqlite3',  # Django's backend plus connect-time metrics
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
         }
     }
 
+# SQLite production profile (single-box deployments without Postgres).
+# Every new connection gets these pragmas (core/sqlite_profile.py): WAL lets
+# readers run alongside the single writer, busy_timeout makes a blocked writer
+# wait instead of failing with "database is locked", and write-heavy views
+# take the write lock up front with BEGIN IMMEDIATE. Set SQLITE_PRODUCTION_PROFILE=False
+# to get SQLite's defaults back.
+SQLITE_PRODUCTION_PROFILE = os.getenv('SQLITE_PRODUCTION_PROFILE', 'True') == 'True'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # Durable across app crashes; with WAL a power loss can only drop the last commits
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'cache_size': -int(os.getenv('SQLITE_CACHE_KB', '20000')),  # Negative = KiB, not pages
+    'temp_store': 'MEMORY',
+} if SQLITE_PRODUCTION_PROFILE else {}
+
+# Connection reuse. Persistent connections (CONN_MAX_AGE seconds) skip TCP/TLS/auth
+# setup on every request; health checks drop connections that died while idle.
+# With DB_POOL=True on Postgres (needs Django 5.1+ and psycopg[pool]) each process
+# keeps a native psycopg3 pool instead, sized from the gunicorn thread count.
+GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', '3'))
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '1'))
+DB_CONNECT_SLOW_MS = int(os.getenv('DB_CONNECT_SLOW_MS', '200'))
+
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+if os.getenv('POSTGRES_DB') and os.getenv('DB_POOL', 'False') == 'True':
+    import django
+    try:
+        import psycopg_pool  # noqa: F401
+        pool_supported = django.VERSION >= (5, 1)
+    except ImportError:
+        pool_supported = False
+
+    if pool_supported:
+        # One pool per worker process: a connection per thread plus one for background
+        # threads (the expiry sweeper). Total server connections = workers x max_size.
+        DATABASES['default']['CONN_MAX_AGE'] = 0  # Django requires 0 with a pool
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', str(GUNICORN_THREADS + 1))),
+                'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+            },
+        }
+    else:
+        import logging
+        logging.getLogger(__name__).warning(
+            'DB_POOL=True needs Django 5.1+ and psycopg[pool]; using persistent connections instead.'
+        )
+
+# Optional read replica for staff and reporting views (see core/db_router.py).
+# Postgres: set POSTGRES_REPLICA_HOST (other settings default to the primary's).
+# Local testing: set SQLITE_REPLICA_PATH to a second SQLite file made by copying
+# db.sqlite3 after migrating (re-copy it to simulate replication catching up).
+if os.getenv('POSTGRES_DB') and os.getenv('POSTGRES_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('POSTGRES_REPLICA_DB', DATABASES['default']['NAME']),
+        'USER': os.getenv('POSTGRES_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('POSTGRES_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.getenv('POSTGRES_REPLICA_HOST'),
+        'PORT': os.getenv('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif not os.getenv('POSTGRES_DB') and os.getenv('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'core.db_backends.sqlite3',
+        'NAME': os.getenv('SQLITE_REPLICA_PATH'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# After a request writes, the same browser reads from the primary for this long
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
+# Per-request timing breakdown (DB, Stripe, email, PDF, render; see core/timing.py).
+# Staff responses get a Server-Timing header; requests at or above
+# REQUEST_TIMING_LOG_MS are logged to core.performance (0 = every request).
+REQUEST_TIMING_ENABLED = os.getenv('REQUEST_TIMING_ENABLED', 'True') == 'True'
+REQUEST_TIMING_LOG_MS = int(os.getenv('REQUEST_TIMING_LOG_MS', '500'))
+
+# Prometheus metrics at /metrics (see core/metrics.py). Served to staff and to
+# METRICS_ALLOWED_IPS (comma-separated; 'unix' matches requests proxied over
+# gunicorn's unix socket, so only list it if nginx restricts /metrics). With
+# several processes set METRICS_DIR (gunicorn.conf.py does) so a scrape
+# covers all workers; each flushes there every METRICS_FLUSH_SECONDS.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+# Tracing (see core/tracing.py): OpenTelemetry-compatible spans exported as
+# OTLP/JSON lines. TRACING_EXPORTER: '' (off), 'file' (TRACING_FILE) or
+# 'console'. TRACING_SAMPLE_RATE is per request; a traceparent header's
+# sampled flag wins. TRACING_SLOW_MS > 0 keeps only traces at least that slow.
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', '')
+TRACING_FILE = os.getenv('TRACING_FILE', str(BASE_DIR / 'logs' / 'traces.jsonl'))
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', '0.1'))
+TRACING_SLOW_MS = int(os.getenv('TRACING_SLOW_MS', '0'))
+TRACING_MAX_SPANS = int(os.getenv('TRACING_MAX_SPANS', '1000'))
+
+
+# Cache: OTP rate limits, resend cooldowns, the sweeper lock and the payment
+# circuit breaker keep state here, so every gunicorn worker must see the same
+# cache. The default database cache needs `python manage.py createcachetable`
+# once; Redis or Memcached work too. A per-process cache (LocMemCache) fails
+# `manage.py check` while the circuit breaker is enabled.
+CACHE_BACKEND = os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', 'oncoone_cache' if CACHE_BACKEND.endswith('DatabaseCache') else ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -192,6 +314,9 @@ if 'smtp' in EMAIL_BACKEND:
     EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
     EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 
+# Outbox: a batch claimed by a send_queued_emails run that died is retried after this long
+OUTBOX_CLAIM_SECONDS = int(os.getenv('OUTBOX_CLAIM_SECONDS', '600'))
+
 # For development allow CORS from localhost dev server; in production lock this down
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 
@@ -212,13 +337,45 @@ if not DEBUG:
         import warnings
         warnings.warn('⚠️  STRIPE API KEYS NOT CONFIGURED! Payment processing will fail.', RuntimeWarning)
 
+# Stripe network behaviour: keep timeouts short so a degraded Stripe cannot hold workers
+STRIPE_TIMEOUT_SECONDS = int(os.getenv('STRIPE_TIMEOUT_SECONDS', '10'))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', '0'))
+
+# Circuit breaker around Stripe calls (state is shared between workers via CACHES)
+CIRCUIT_BREAKER = {
+    'ENABLED': os.getenv('CIRCUIT_BREAKER_ENABLED', 'True') == 'True',
+    'FAILURE_RATE': float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', '0.5')),
+    'MIN_CALLS': int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', '10')),
+    'SLOW_CALL_MS': float(os.getenv('CIRCUIT_BREAKER_SLOW_CALL_MS', '5000')),
+    'WINDOW_SECONDS': int(os.getenv('CIRCUIT_BREAKER_WINDOW_SECONDS', '60')),
+    'OPEN_SECONDS': int(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '30')),
+    # Per-operation overrides, e.g. {'stripe_confirm_payment': {'SLOW_CALL_MS': 8000}}
+    'OPERATIONS': {},
+}
+
+# Payment gateway backend (dotted path). Use core.fake_gateway.FakePaymentGateway
+# for offline load testing and benchmarks - never in production.
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'core.stripe_processor.StripePaymentProcessor')
+
+# Behaviour of the fake gateway (ignored by the Stripe gateway)
+FAKE_PAYMENT_GATEWAY = {
+    'LATENCY_MS': float(os.getenv('FAKE_GATEWAY_LATENCY_MS', '0')),
+    'LATENCY_JITTER_MS': float(os.getenv('FAKE_GATEWAY_LATENCY_JITTER_MS', '0')),
+    'DECLINE_RATE': float(os.getenv('FAKE_GATEWAY_DECLINE_RATE', '0')),
+    'THREE_DS_RATE': float(os.getenv('FAKE_GATEWAY_THREE_DS_RATE', '0')),
+    'SEED': os.getenv('FAKE_GATEWAY_SEED', '0'),
+}
+
 # OTP Security Settings
 OTP_EXPIRY_MINUTES = int(os.getenv('OTP_EXPIRY_MINUTES', '10'))
 OTP_MAX_ATTEMPTS = int(os.getenv('OTP_MAX_ATTEMPTS', '3'))
 OTP_LENGTH = 6
+OTP_RESEND_COOLDOWN_SECONDS = int(os.getenv('OTP_RESEND_COOLDOWN_SECONDS', '60'))
 
 # Payment Security & Validation
 PAYMENT_TIMEOUT_MINUTES = int(os.getenv('PAYMENT_TIMEOUT_MINUTES', '30'))
+# Run the expiry sweeper inside each web process every N seconds (0 = disabled, use cron instead)
+PAYMENT_SWEEPER_INTERVAL_SECONDS = int(os.getenv('PAYMENT_SWEEPER_INTERVAL_SECONDS', '0'))
 from decimal import Decimal
 MIN_PAYMENT_AMOUNT = Decimal(os.getenv('MIN_PAYMENT_AMOUNT', '1.00'))
 MAX_PAYMENT_AMOUNT = Decimal(os.getenv('MAX_PAYMENT_AMOUNT', '10000.00'))
@@ -247,66 +404,150 @@ CSRF_TRUSTED_ORIGINS = [
     h.strip() for h in os.getenv('CSRF_TRUSTED_ORIGINS', '').split(',') if h.strip()
 ]
 
-# Logging Configuration
-if DEBUG:
-    # Development: Console logging only
-    LOGGING = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'formatters': {
-            'verbose': {
-                'format': '[{levelname}] {asctime} {module} - {message}',
-                'style': '{',
-                'datefmt': '%Y-%m-%d %H:%M:%S',
-            },
+# Slow-query / N+1 log (opt-in; see core/query_log.py). Queries slower than
+# QUERY_LOG_SLOW_MS (a QUERY_LOG_SAMPLE_RATE share of them) and query shapes
+# repeated QUERY_LOG_N_PLUS_ONE_THRESHOLD times in one request are written to
+# QUERY_LOG_FILE, with the core call site and, if QUERY_LOG_EXPLAIN, the plan.
+# Staff can read the aggregate at /api/admin/query-report/.
+QUERY_LOG_ENABLED = os.getenv('QUERY_LOG_ENABLED', 'False') == 'True'
+QUERY_LOG_FILE = os.getenv('QUERY_LOG_FILE', str(BASE_DIR / 'logs' / 'queries.log'))
+QUERY_LOG_SLOW_MS = float(os.getenv('QUERY_LOG_SLOW_MS', '100'))
+QUERY_LOG_SAMPLE_RATE = float(os.getenv('QUERY_LOG_SAMPLE_RATE', '1.0'))
+QUERY_LOG_N_PLUS_ONE_THRESHOLD = int(os.getenv('QUERY_LOG_N_PLUS_ONE_THRESHOLD', '10'))
+QUERY_LOG_EXPLAIN = os.getenv('QUERY_LOG_EXPLAIN', 'False') == 'True'
+
+# On-demand profiler (see core/profiling.py): staff add ?_profile=sample (or
+# cprofile) or an X-Profile header to a request; the folded stacks, cProfile
+# stats and top allocation sites are saved in PROFILER_DIR.
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'True') == 'True'
+PROFILER_DIR = os.getenv('PROFILER_DIR', str(BASE_DIR / 'logs' / 'profiles'))
+PROFILER_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILER_SAMPLE_INTERVAL_MS', '2'))
+PROFILER_ALLOCATION_SITES = int(os.getenv('PROFILER_ALLOCATION_SITES', '25'))
+
+# Per-request database limits (see core/db_limits.py). Each request gets a
+# class - by URL prefix, or @db_limits('export') on the view - with a statement
+# timeout (Postgres statement_timeout; emulated on SQLite) and a query budget.
+# Going over the budget is logged; set DB_QUERY_BUDGET_ACTION=raise on staging
+# to make it an error. A budget or timeout of None means no limit.
+DB_LIMITS_ENABLED = os.getenv('DB_LIMITS_ENABLED', 'True') == 'True'
+DB_LIMIT_CLASSES = {
+    # Public payment portal, student pages and the registration form
+    'portal': {
+        'STATEMENT_TIMEOUT_MS': int(os.getenv('DB_PORTAL_STATEMENT_TIMEOUT_MS', '3000')),
+        'QUERY_BUDGET': int(os.getenv('DB_PORTAL_QUERY_BUDGET', '100')),
+    },
+    # Staff pages and APIs
+    'staff': {
+        'STATEMENT_TIMEOUT_MS': int(os.getenv('DB_STAFF_STATEMENT_TIMEOUT_MS', '15000')),
+        'QUERY_BUDGET': int(os.getenv('DB_STAFF_QUERY_BUDGET', '1000')),
+    },
+    # Imports, file downloads and invoice generation
+    'export': {
+        'STATEMENT_TIMEOUT_MS': int(os.getenv('DB_EXPORT_STATEMENT_TIMEOUT_MS', '120000')),
+        'QUERY_BUDGET': None,
+    },
+}
+DB_LIMIT_PATH_CLASSES = (
+    ('/api/admin/', 'staff'),
+    ('/portal/', 'staff'),
+    ('/admin/', 'staff'),
+    ('/metrics', 'staff'),
+)
+DB_QUERY_BUDGET_ACTION = os.getenv('DB_QUERY_BUDGET_ACTION', 'log')  # 'log' or 'raise'
+
+# Logging Configuration (see core/structured_logging.py)
+# LOG_FORMAT: 'text' or 'json' (one object per line; default in production).
+# LOG_TO_FILES adds rotating sinks for core.payment (logs/payment.log) and
+# core.security (logs/security.log). LOG_SAMPLE_RATES keeps a fraction of the
+# INFO lines of busy loggers, e.g. "core.payment=0.1,core.performance=0.25".
+# With LOG_QUEUE_ENABLED, records are written by a background thread.
+# OTP codes and Stripe secrets are redacted by both formatters.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text' if DEBUG else 'json')
+LOG_TO_FILES = os.getenv('LOG_TO_FILES', str(not DEBUG)) == 'True'
+LOG_DIR = os.getenv('LOG_DIR', str(BASE_DIR / 'logs'))
+LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv('LOG_FILE_BACKUP_COUNT', '5'))
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+LOG_QUEUE_ENABLED = os.getenv('LOG_QUEUE_ENABLED', 'True') == 'True'
+
+
+def _log_file(path):
+    return {
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': path,
+        'maxBytes': LOG_FILE_MAX_BYTES,
+        'backupCount': LOG_FILE_BACKUP_COUNT,
+        'encoding': 'utf-8',
+        'delay': True,
+        'formatter': 'json',
+    }
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {
+            '()': 'core.structured_logging.TextFormatter',
+            'format': '[{levelname}] {asctime} {module} - {message}',
+            'style': '{',
+            'datefmt': '%Y-%m-%d %H:%M:%S',
         },
-        'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-                'formatter': 'verbose',
-            },
+        'json': {
+            '()': 'core.structured_logging.JSONFormatter',
         },
-        'loggers': {
-            'core': {
-                'handlers': ['console'],
-                'level': 'INFO',
-                'propagate': False,
-            },
-            'stripe': {
-                'handlers': ['console'],
-                'level': 'WARNING',
-                'propagate': False,
-            },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'core.structured_logging.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
         },
-    }
-else:
-    # Production: Console only (Gunicorn handles logging)
-    LOGGING = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'formatters': {
-            'verbose': {
-                'format': '[{levelname}] {asctime} {module} - {message}',
-                'style': '{',
-                'datefmt': '%Y-%m-%d %H:%M:%S',
-            },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'verbose',
         },
-        'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-                'formatter': 'verbose',
-            },
+        **({
+            'payment_file': _log_file(os.path.join(LOG_DIR, 'payment.log')),
+            'security_file': _log_file(os.path.join(LOG_DIR, 'security.log')),
+        } if LOG_TO_FILES else {}),
+        'query_file': _log_file(QUERY_LOG_FILE),
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'filters': ['sampling'],
+            'level': 'INFO',
+            'propagate': False,
         },
-        'loggers': {
-            'core': {
-                'handlers': ['console'],
-                'level': 'INFO',
-                'propagate': False,
-            },
-            'stripe': {
-                'handlers': ['console'],
-                'level': 'WARNING',
-                'propagate': False,
-            },
+        'core.payment': {
+            'handlers': ['console', 'payment_file'] if LOG_TO_FILES else ['console'],
+            'filters': ['sampling'],
+            'level': 'INFO',
+            'propagate': False,
         },
-    }
+        'core.security': {
+            'handlers': ['console', 'security_file'] if LOG_TO_FILES else ['console'],
+            'filters': ['sampling'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core.performance': {
+            'handlers': ['console'],
+            'filters': ['sampling'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core.queries': {
+            'handlers': ['query_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'stripe': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
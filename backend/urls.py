@@ -42,6 +42,7 @@ urlpatterns = [
     path('portal/courses/', core_views.admin_courses_page, name='admin-courses-page'),
     path('admin/', admin.site.urls),
     path('api/register/', core_views.register_view, name='api-register'),
+    path('metrics', core_views.metrics_view, name='metrics'),
     path('api/', include('core.urls')),
 ]
 
@@ -1,11 +1,26 @@
 from django.contrib import admin
 from django.http import HttpResponse
 from django.utils.html import format_html
-from .models import Registration, StudentCourseEnrollment, Course, Payment, PaymentInvoice
+from .db_router import use_replica
+from .models import Registration, StudentCourseEnrollment, Course, Payment, PaymentInvoice, QueuedEmail
+
+
+class ReplicaChangelistMixin:
+	"""Serve changelist pages (GET only; POST runs actions) from the read replica"""
+	
+	def changelist_view(self, request, extra_context=None):
+		if request.method != 'GET':
+			return super().changelist_view(request, extra_context)
+		with use_replica():
+			response = super().changelist_view(request, extra_context)
+			# The result list is a lazy queryset; render while still routed to the replica
+			if hasattr(response, 'render'):
+				response.render()
+			return response
 
 
 @admin.register(Registration)
-class RegistrationAdmin(admin.ModelAdmin):
+class RegistrationAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
 	list_display = ('registration_number', 'name', 'email', 'contact', 'student_password', 'created_at')
 	list_filter = ('created_at', 'updated_at')
 	search_fields = ('name', 'email', 'contact', 'registration_number')
@@ -35,7 +50,7 @@ class CourseAdmin(admin.ModelAdmin):
 
 
 @admin.register(StudentCourseEnrollment)
-class StudentCourseEnrollmentAdmin(admin.ModelAdmin):
+class StudentCourseEnrollmentAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
 	list_display = ('registration', 'course', 'course_name', 'has_prerequisite', 'enrollment_status', 'enrolled_at')
 	list_filter = ('course', 'has_prerequisite', 'enrollment_status', 'enrolled_at')
 	search_fields = ('registration__email', 'registration__name', 'registration__registration_number', 'course__course_name', 'course_name')
@@ -58,7 +73,7 @@ class StudentCourseEnrollmentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('invoice_number', 'student_id', 'course_name', 'payment_amount_cad', 'status_display', 'completed_at')
     list_filter = ('status', 'created_at', 'payment_method')
     search_fields = ('student_id', 'invoice_number', 'course_name', 'registration__email')
@@ -206,3 +221,11 @@ class PaymentInvoiceAdmin(admin.ModelAdmin):
     search_fields = ('payment__invoice_number',)
     readonly_fields = ('payment', 'generated_at')
 
+
+
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'to')
+    readonly_fields = ('created_at', 'sent_at', 'last_error', 'claim_token', 'claimed_at')
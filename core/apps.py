@@ -1,5 +1,25 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import checks  # noqa: F401 - registers the system checks
+
+        # Log records are written by a background thread (core/structured_logging.py)
+        if getattr(settings, 'LOG_QUEUE_ENABLED', False):
+            from .structured_logging import start_queue_listener
+            start_queue_listener(['core', 'core.payment', 'core.security', 'core.performance', 'core.queries', 'stripe'])
+
+        # SQLite production pragmas on every new connection (no-op on Postgres)
+        from django.db.backends.signals import connection_created
+        from .sqlite_profile import apply_pragmas
+        connection_created.connect(apply_pragmas, dispatch_uid='core.sqlite_profile.apply_pragmas')
+
+        # Optional in-process expiry sweeper (off by default; cron can run sweep_expired instead)
+        interval = getattr(settings, 'PAYMENT_SWEEPER_INTERVAL_SECONDS', 0)
+        if interval:
+            from .sweeper import start_periodic_sweeper
+            start_periodic_sweeper(interval)
@@ -0,0 +1,177 @@
+"""
+Batch Runner for OncoOne Education maintenance commands
+Walks a queryset in primary-key order, one bounded batch at a time, writes
+each batch with chunked bulk_update inside its own transaction, and persists
+a checkpoint so an interrupted run resumes where it stopped
+Version: 1.0
+"""
+
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from .models import BatchCheckpoint
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f'{seconds}s'
+    if seconds < 3600:
+        return f'{seconds // 60}m{seconds % 60:02d}s'
+    return f'{seconds // 3600}h{(seconds % 3600) // 60:02d}m'
+
+
+class BatchRunner:
+    """
+    Run a job over a queryset in keyset batches
+
+    Each batch is read with `pk > last_id ORDER BY pk LIMIT batch_size`, so
+    every read is an index range scan no matter how far the job has got, and
+    a queryset that shrinks as rows are fixed is still walked exactly once.
+    The batch's writes and the checkpoint update commit together; after a
+    crash the job restarts from the last committed batch.
+
+    Example:
+        runner = BatchRunner('fill_passwords', Registration.objects.filter(student_password=''))
+        runner.run(fill_passwords, update_fields=['student_password'])
+    """
+
+    def __init__(
+        self,
+        job: str,
+        queryset,
+        batch_size: int = 1000,
+        dry_run: bool = False,
+        resume: bool = True,
+        log: Optional[Callable[[str], None]] = None,
+    ):
+        self.job = job
+        self.queryset = queryset.order_by('pk')
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.resume = resume
+        self.log = log or print
+
+    def _load_checkpoint(self) -> BatchCheckpoint:
+        if self.dry_run:
+            return BatchCheckpoint(job=self.job)
+        if not self.resume:
+            BatchCheckpoint.objects.filter(job=self.job).delete()
+        checkpoint, created = BatchCheckpoint.objects.get_or_create(job=self.job)
+        if not created and checkpoint.last_id:
+            self.log(f'Resuming {self.job} after id {checkpoint.last_id} ({checkpoint.processed} rows already processed)')
+        return checkpoint
+
+    def batches(self, after_id: int = 0) -> Iterable[List]:
+        """Yield lists of at most batch_size rows with pk > after_id"""
+        last_id = after_id
+        while True:
+            batch = list(self.queryset.filter(pk__gt=last_id)[:self.batch_size].iterator())
+            if not batch:
+                return
+            last_id = batch[-1].pk
+            yield batch
+
+    def bulk_update(self, objs: List, fields: List[str]) -> int:
+        """bulk_update in chunks of batch_size (one UPDATE ... CASE statement per chunk)"""
+        if not objs:
+            return 0
+        model = type(objs[0])
+        for start in range(0, len(objs), self.batch_size):
+            model.objects.bulk_update(objs[start:start + self.batch_size], fields)
+        return len(objs)
+
+    def run(
+        self,
+        process: Callable[[List], List],
+        update_fields: Optional[List[str]] = None,
+        apply: Optional[Callable[[List], int]] = None,
+    ) -> Dict[str, int]:
+        """
+        Process every batch and report progress after each one
+
+        Args:
+            process: Receives a batch and returns the rows it changed
+            update_fields: Fields written with bulk_update for the changed rows
+            apply: Custom writer for the changed rows (e.g. a delete); returns rows written
+
+        Returns:
+            dict: processed and changed row counts, and elapsed seconds
+        """
+        checkpoint = self._load_checkpoint()
+        total = self.queryset.filter(pk__gt=checkpoint.last_id).count()
+        started = time.monotonic()
+        processed = changed = 0
+
+        for batch in self.batches(checkpoint.last_id):
+            changed_rows = process(batch)
+
+            with transaction.atomic():
+                if not self.dry_run and changed_rows:
+                    if apply is not None:
+                        written = apply(changed_rows)
+                    else:
+                        written = self.bulk_update(changed_rows, update_fields)
+                else:
+                    written = len(changed_rows)
+
+                processed += len(batch)
+                changed += written
+                checkpoint.last_id = batch[-1].pk
+                checkpoint.processed += len(batch)
+                checkpoint.changed += written
+                if not self.dry_run:
+                    checkpoint.save(update_fields=['last_id', 'processed', 'changed', 'updated_at'])
+
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            eta = (total - processed) / rate if rate and total > processed else 0
+            self.log(
+                f'{self.job}: {processed}/{total} rows, {changed} changed '
+                f'({rate:,.0f} rows/s, ETA {_format_duration(eta)})'
+            )
+
+        if not self.dry_run:
+            # A finished job starts from the beginning next time
+            BatchCheckpoint.objects.filter(job=self.job).delete()
+
+        elapsed = time.monotonic() - started
+        return {'processed': processed, 'changed': changed, 'seconds': round(elapsed, 2)}
+
+
+class BatchCommand(BaseCommand):
+    """Management command base with the shared batch options and a confirmation prompt"""
+
+    # Shown before a run that writes; None skips the prompt
+    confirm_message = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per batch and per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+        parser.add_argument('--restart', action='store_true', help='Ignore a saved checkpoint and start from the first row')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive', help='Do not prompt for confirmation')
+
+    def confirm(self, options) -> bool:
+        if options['dry_run'] or not options['interactive'] or not self.confirm_message:
+            return True
+        self.stdout.write(self.confirm_message)
+        return input('Continue? (yes/no): ').strip().lower() in ('yes', 'y')
+
+    def runner(self, job: str, queryset, options) -> BatchRunner:
+        return BatchRunner(
+            job,
+            queryset,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            resume=not options['restart'],
+            log=self.stdout.write,
+        )
+
+    def report(self, result: Dict[str, int], options, verb: str = 'Updated'):
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{verb}: {result['changed']} | Processed: {result['processed']} | {result['seconds']}s"
+        ))
@@ -0,0 +1,292 @@
+"""
+Endpoint Benchmarks for OncoOne Education
+Drives the hot registration, portal, admin and checkout views through the
+Django test client against seeded data and reports latency percentiles,
+queries per request and peak memory per endpoint
+Version: 1.0
+
+Run through `python manage.py benchmark_endpoints`; benchmark_environment()
+provides the throwaway test database, the fake payment gateway and the locmem
+email backend (also used by `loadtest_checkout`).
+"""
+
+import io
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from .models import PaymentOTP, Registration, StudentCourseEnrollment
+
+PROOF_SIZE_BYTES = 300 * 1024
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 (inclusive method, so a handful of samples still works)"""
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    if len(values) == 1:
+        return {'p50': values[0], 'p95': values[0], 'p99': values[0]}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+@contextmanager
+def benchmark_environment(file_database=False, gateway_latency_ms=0, gateway_jitter_ms=0):
+    """
+    Run the block against a throwaway test database (like `manage.py test`)
+    with the fake gateway, locmem email, a temporary MEDIA_ROOT and INFO
+    logging off (it would be timed along with the views)
+
+    file_database: on SQLite, use a WAL file instead of the shared in-memory
+    test database, which cannot take concurrent writers from several threads.
+    """
+    setup_test_environment()
+    with tempfile.TemporaryDirectory() as workdir:
+        if file_database and connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        logging.disable(logging.INFO)
+        try:
+            with override_settings(
+                PAYMENT_GATEWAY='core.fake_gateway.FakePaymentGateway',
+                FAKE_PAYMENT_GATEWAY={
+                    'LATENCY_MS': gateway_latency_ms,
+                    'LATENCY_JITTER_MS': gateway_jitter_ms,
+                    'DECLINE_RATE': 0,
+                    'THREE_DS_RATE': 0,
+                },
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                MEDIA_ROOT=os.path.join(workdir, 'media'),
+                ADMIN_EMAIL='admin@example.com',
+            ):
+                yield
+        finally:
+            logging.disable(logging.NOTSET)
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+
+def seed_students(count: int, payments_per_student: int = 5):
+    """Seed `count` students (two enrollments each) with generate_load_data"""
+    call_command(
+        'generate_load_data',
+        registrations=count,
+        enrollments=count * 2,
+        payments=count * payments_per_student,
+        proof_ratio=0,
+        stdout=io.StringIO(),
+    )
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts statements (cheaper than capturing SQL)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class EndpointBenchmark:
+    """
+    Seed data, then time each scenario: `warmup` untimed requests, `iterations`
+    timed ones (each also counted for queries), then `memory_iterations` more
+    under tracemalloc for the peak allocation (kept apart so tracing does not
+    slow the timed requests).
+    """
+
+    def __init__(self, students=2000, iterations=30, warmup=3, memory_iterations=3, listing_iterations=5, log=None):
+        self.students = students
+        self.iterations = iterations
+        self.warmup = warmup
+        self.memory_iterations = memory_iterations
+        # The admin listings return every row, so they get fewer runs
+        self.listing_iterations = min(listing_iterations, iterations)
+        self.log = log or (lambda message: None)
+
+    def setup(self):
+        self.log(f'Seeding {self.students} students...')
+        seed_students(self.students)
+        self.sample = list(
+            Registration.objects.filter(email__endswith='@loadtest.invalid')
+            .order_by('id')
+            .values_list('id', 'registration_number', 'email', 'name')
+        )
+        # Enrollments for checkouts, spread over students so no payment is reused
+        self.checkout_enrollments = list(
+            StudentCourseEnrollment.objects.filter(registration__email__endswith='@loadtest.invalid')
+            .order_by('registration_id', 'id')
+            .values_list('id', 'registration_id', 'registration__email', 'registration__name')
+        )
+        self.course_name = StudentCourseEnrollment.objects.values_list('course_name', flat=True).first()
+        self.pending_payments = []
+        self.counter = 0
+
+        self.client = Client()
+        self.staff_client = Client()
+        staff = User.objects.create_user('benchmark-staff', password=None, is_staff=True)
+        self.staff_client.force_login(staff)
+
+    def next_index(self):
+        self.counter += 1
+        return self.counter
+
+    def student(self):
+        return self.sample[(self.next_index() * 7919) % len(self.sample)]
+
+    # Scenarios: each call makes exactly one request
+
+    def register_with_proof(self):
+        n = self.next_index()
+        proof = SimpleUploadedFile(f'certificate_{n}.pdf', b'%PDF-1.4\n' + b'0' * PROOF_SIZE_BYTES, 'application/pdf')
+        return self.client.post('/api/register/', {
+            'name': f'Benchmark Student {n}',
+            'email': f'benchmark{n}@loadtest.invalid',
+            'contact': '555-0100',
+            'course': self.course_name,
+            'hasQualification': 'yes',
+            'proof': proof,
+        })
+
+    def verify_student(self):
+        _id, registration_number, _email, _name = self.student()
+        return self.client.post(
+            '/api/payment/verify-student/',
+            json.dumps({'student_id': registration_number}),
+            content_type='application/json',
+        )
+
+    def select_course(self):
+        student_id = self.student()[0]
+        return self.client.get(f'/api/payment/select-course/{student_id}/')
+
+    def dashboard(self):
+        student_id = self.student()[0]
+        session = self.client.session
+        session['student_id'] = student_id
+        session.save()
+        return self.client.get(f'/api/student/dashboard/{student_id}/')
+
+    def registrations_list(self):
+        return self.staff_client.get('/api/admin/registrations/')
+
+    def admin_payments_list(self):
+        return self.staff_client.get('/api/admin/payments/')
+
+    def create_payment(self):
+        enrollment_id, student_id, email, name = self.checkout_enrollments[
+            self.next_index() % len(self.checkout_enrollments)
+        ]
+        response = self.client.post('/api/payment/create-and-send-otp/', json.dumps({
+            'student_id': student_id,
+            'enrollment_id': enrollment_id,
+            'payment_method_id': 'pm_card_visa',
+            'payment_amount': '100.00',
+            'tax_amount': '5.00',
+            'total_amount': '105.00',
+            'card_holder': name,
+            'card_type': 'visa',
+            'card_last_four': '4242',
+            'email': email,
+        }), content_type='application/json')
+        if response.status_code == 200:
+            self.pending_payments.append(response.json()['payment_id'])
+        return response
+
+    def verify_otp(self):
+        payment_id = self.pending_payments.pop(0)
+        otp_code = PaymentOTP.objects.values_list('otp_code', flat=True).get(payment_id=payment_id)
+        return self.client.post(
+            '/api/payment/verify-otp/',
+            json.dumps({'payment_id': payment_id, 'otp_code': otp_code}),
+            content_type='application/json',
+        )
+
+    def scenarios(self):
+        """(name, request function, timed iterations) in run order; checkout create runs before verify"""
+        return [
+            ('register_view', self.register_with_proof, self.iterations),
+            ('payment_verify_student', self.verify_student, self.iterations),
+            ('payment_select_course', self.select_course, self.iterations),
+            ('student_dashboard', self.dashboard, self.iterations),
+            ('registrations_list', self.registrations_list, self.listing_iterations),
+            ('admin_payments_list', self.admin_payments_list, self.listing_iterations),
+            ('create_payment_and_send_otp', self.create_payment, self.iterations),
+            ('verify_payment_otp', self.verify_otp, self.iterations),
+        ]
+
+    def measure(self, request: Callable, iterations: int) -> Dict:
+        errors = 0
+        for _ in range(self.warmup):
+            request()
+
+        latencies, queries = [], []
+        for _ in range(iterations):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = request()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+
+        peak = 0
+        tracemalloc.start()
+        try:
+            for _ in range(self.memory_iterations):
+                tracemalloc.reset_peak()
+                response = request()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                errors += response.status_code >= 400
+        finally:
+            tracemalloc.stop()
+
+        spread = percentiles(latencies)
+        return {
+            'samples': len(latencies),
+            'p50_ms': round(spread['p50'], 2),
+            'p95_ms': round(spread['p95'], 2),
+            'p99_ms': round(spread['p99'], 2),
+            'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            'max_ms': round(max(latencies), 2) if latencies else 0.0,
+            'queries_median': float(statistics.median(queries)) if queries else 0.0,
+            'queries_max': max(queries) if queries else 0,
+            'peak_memory_kb': round(peak / 1024, 1),
+            'errors': errors,
+        }
+
+    def run(self, only=None) -> Dict[str, Dict]:
+        """Run every scenario (or those named in `only`); returns results keyed by scenario"""
+        self.setup()
+        results = {}
+        for name, request, iterations in self.scenarios():
+            if only and name not in only:
+                # Verify needs the payments create makes
+                if not (name == 'create_payment_and_send_otp' and 'verify_payment_otp' in only):
+                    continue
+            self.log(f'{name}: {iterations} requests...')
+            results[name] = self.measure(request, iterations)
+        if only:
+            results = {name: result for name, result in results.items() if name in only}
+        return results
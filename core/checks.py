@@ -0,0 +1,30 @@
+"""
+System Checks for OncoOne Education
+Run by `manage.py check` (and before runserver/migrate)
+Version: 1.0
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends that keep a separate copy of the cache in every process
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """The circuit breaker only protects every worker when its state is in a shared cache"""
+    breaker = getattr(settings, 'CIRCUIT_BREAKER', {}) or {}
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if not breaker.get('ENABLED', True) or backend not in PER_PROCESS_CACHES:
+        return []
+    return [Error(
+        f'The circuit breaker is enabled but the default cache ({backend}) is per process, '
+        f'so each worker would trip on its own.',
+        hint='Use a shared cache (the default DatabaseCache after `manage.py createcachetable`, '
+             'Redis or Memcached), or set CIRCUIT_BREAKER_ENABLED=False.',
+        id='core.E001',
+    )]
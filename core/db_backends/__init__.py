@@ -0,0 +1,57 @@
+"""
+Database Backend Wrappers for OncoOne Education
+Thin subclasses of Django's Postgres and SQLite backends that time every new
+connection (or pool checkout), so slow connection setup shows up in metrics
+Version: 1.0
+
+Enable by pointing ENGINE at core.db_backends.postgresql / core.db_backends.sqlite3.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+from django.conf import settings
+
+logger = logging.getLogger('core.security')
+
+_lock = threading.Lock()
+_stats = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+
+
+def record_connect(alias: str, duration_ms: float) -> None:
+    """Add one connection acquisition to the per-alias counters"""
+    from core import metrics
+
+    metrics.inc('oncoone_db_connections_total', alias=alias)
+    metrics.observe('oncoone_db_connect_duration_seconds', duration_ms / 1000, alias=alias)
+    with _lock:
+        stats = _stats[alias]
+        stats['count'] += 1
+        stats['total_ms'] += duration_ms
+        stats['max_ms'] = max(stats['max_ms'], duration_ms)
+
+    slow_ms = getattr(settings, 'DB_CONNECT_SLOW_MS', 200)
+    if duration_ms >= slow_ms:
+        logger.warning(f'Database connection to {alias!r} took {duration_ms:.0f}ms')
+
+
+def connection_stats() -> Dict[str, Dict[str, float]]:
+    """Snapshot of connection acquisitions in this process: count, total/avg/max milliseconds"""
+    with _lock:
+        return {
+            alias: {**stats, 'avg_ms': stats['total_ms'] / stats['count'] if stats['count'] else 0.0}
+            for alias, stats in _stats.items()
+        }
+
+
+@contextmanager
+def timed_connect(alias: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_connect(alias, (time.perf_counter() - started) * 1000)
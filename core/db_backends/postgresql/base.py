@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import base
+
+from core.db_backends import timed_connect
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Postgres backend that records how long opening (or checking out) a connection takes"""
+
+    def get_new_connection(self, conn_params):
+        with timed_connect(self.alias):
+            return super().get_new_connection(conn_params)
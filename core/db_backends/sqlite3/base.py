@@ -0,0 +1,23 @@
+from django.db.backends.sqlite3 import base
+
+from core.db_backends import timed_connect
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend that records how long opening a connection takes, and
+    starts transactions with BEGIN IMMEDIATE inside core.sqlite_profile.immediate_atomic()
+    (Django 5.1's OPTIONS['transaction_mode'] can only do it for every transaction)
+    """
+
+    begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        with timed_connect(self.alias):
+            return super().get_new_connection(conn_params)
+
+    def _start_transaction_under_autocommit(self):
+        if self.begin_immediate:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,211 @@
+"""
+Per-Request Database Limits for OncoOne Education
+A statement timeout and a query budget for every request, by view class, so
+one runaway staff request cannot hold a connection that checkout needs
+Version: 1.0
+
+DatabaseLimitsMiddleware gives each request a class from DB_LIMIT_CLASSES:
+the URL prefix picks it (DB_LIMIT_PATH_CLASSES, else 'portal'), and the
+@db_limits('export') decorator overrides it for a view. Each class sets:
+- STATEMENT_TIMEOUT_MS: on Postgres, `SET statement_timeout` on the request's
+  connection before its first query, repeated per statement inside atomic()
+  until one runs outside a transaction (RESET afterwards); on SQLite, a progress
+  handler interrupts a statement that runs past it. A cancelled statement
+  becomes a 503 instead of a hung worker.
+- QUERY_BUDGET: queries allowed per request. Going over is logged (and
+  counted in /metrics); with DB_QUERY_BUDGET_ACTION='raise' - meant for
+  staging - the query that goes over raises QueryBudgetExceeded instead.
+
+Requests only: management commands and the outbox worker keep the server's
+default timeout.
+"""
+
+import contextvars
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from django.conf import settings
+from django.db import OperationalError, connections
+
+from . import metrics
+
+logger = logging.getLogger('core.performance')
+
+DEFAULT_CLASS = 'portal'
+
+# Postgres SQLSTATE query_canceled (what statement_timeout raises)
+QUERY_CANCELED = '57014'
+
+# SQLite runs the progress handler every this many VM instructions
+_SQLITE_PROGRESS_STEPS = 1000
+
+_current = contextvars.ContextVar('db_limits', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more queries than its class allows (DB_QUERY_BUDGET_ACTION='raise')"""
+    pass
+
+
+def enabled() -> bool:
+    return getattr(settings, 'DB_LIMITS_ENABLED', True)
+
+
+def db_limits(limit_class: str):
+    """
+    View decorator: run the view under `limit_class` of DB_LIMIT_CLASSES,
+    e.g. @db_limits('export') for a view that legitimately runs long queries.
+    Put it above decorators that don't copy function attributes (no_cache).
+    """
+    def decorator(view_func):
+        view_func.db_limit_class = limit_class
+        return view_func
+    return decorator
+
+
+def limits_for(limit_class: str) -> Dict[str, Optional[int]]:
+    classes = getattr(settings, 'DB_LIMIT_CLASSES', {})
+    return classes.get(limit_class) or classes.get(DEFAULT_CLASS, {})
+
+
+def class_for_path(path: str) -> str:
+    for prefix, limit_class in getattr(settings, 'DB_LIMIT_PATH_CLASSES', ()):
+        if path.startswith(prefix):
+            return limit_class
+    return DEFAULT_CLASS
+
+
+class RequestLimits:
+    """The limits and query count of one request"""
+
+    def __init__(self, limit_class: str):
+        self.queries = 0
+        self.view = 'unmatched'
+        self.timed_out = False
+        # alias -> statement_timeout SET on that Postgres connection outside a
+        # transaction, so no rollback can undo it
+        self.applied: Dict[str, int] = {}
+        # Aliases whose statement_timeout was SET at all (RESET at the end)
+        self.changed: Set[str] = set()
+        self.set_class(limit_class)
+
+    def set_class(self, limit_class: str) -> None:
+        limits = limits_for(limit_class)
+        self.limit_class = limit_class
+        self.timeout_ms = limits.get('STATEMENT_TIMEOUT_MS')
+        self.budget = limits.get('QUERY_BUDGET')
+
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+
+def start_request(path: str) -> contextvars.Token:
+    return _current.set(RequestLimits(class_for_path(path)))
+
+
+def current() -> Optional[RequestLimits]:
+    return _current.get()
+
+
+def set_view(view: str, view_func) -> None:
+    """Name the view and apply its @db_limits class, once the URL has been resolved"""
+    limits = _current.get()
+    if limits is None:
+        return
+    limits.view = view
+    limit_class = getattr(view_func, 'db_limit_class', None)
+    if limit_class is not None:
+        limits.set_class(limit_class)
+
+
+def end_request(token: contextvars.Token) -> None:
+    """Log a blown query budget and put back the server's statement_timeout"""
+    limits = _current.get()
+    _current.reset(token)
+    if limits is None:
+        return
+    if limits.over_budget():
+        metrics.inc('oncoone_db_query_budget_exceeded_total', view=limits.view)
+        logger.warning(
+            f'Query budget exceeded: {limits.view} ran {limits.queries} queries '
+            f'(budget {limits.budget}, class {limits.limit_class})'
+        )
+    for alias in limits.changed:
+        connection = connections[alias]
+        if connection.connection is None:
+            continue
+        try:
+            with connection.connection.cursor() as cursor:
+                cursor.execute('RESET statement_timeout')
+        except Exception as e:
+            # A broken connection is discarded by Django anyway
+            logger.debug(f'Could not reset statement_timeout on {alias!r}: {e}')
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook: counts the query against the budget and enforces the timeout"""
+    limits = _current.get()
+    if limits is None:
+        return execute(sql, params, many, context)
+
+    limits.queries += 1
+    if limits.over_budget() and getattr(settings, 'DB_QUERY_BUDGET_ACTION', 'log') == 'raise':
+        raise QueryBudgetExceeded(
+            f'{limits.view} ran more than {limits.budget} queries (class {limits.limit_class})'
+        )
+
+    timeout_ms = limits.timeout_ms
+    if not timeout_ms:
+        return execute(sql, params, many, context)
+    connection = context['connection']
+    if connection.vendor == 'postgresql':
+        return _execute_postgresql(limits, timeout_ms, execute, sql, params, many, context)
+    if connection.vendor == 'sqlite':
+        return _execute_sqlite(limits, timeout_ms, execute, sql, params, many, context)
+    return execute(sql, params, many, context)
+
+
+def _execute_postgresql(limits, timeout_ms, execute, sql, params, many, context):
+    connection = context['connection']
+    alias = connection.alias
+    if limits.applied.get(alias) != timeout_ms:
+        # The raw cursor, so the SET is neither counted nor seen by the other wrappers
+        context['cursor'].cursor.execute(f'SET statement_timeout = {int(timeout_ms)}')
+        limits.changed.add(alias)
+        # SET is transactional: inside atomic() a rollback would undo it, so it
+        # is issued again before the next statement until one runs in autocommit
+        if not connection.in_atomic_block:
+            limits.applied[alias] = timeout_ms
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as e:
+        cause = e.__cause__
+        if (getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)) == QUERY_CANCELED:
+            _timed_out(limits, timeout_ms, sql)
+        raise
+
+
+def _execute_sqlite(limits, timeout_ms, execute, sql, params, many, context):
+    # SQLite has no statement_timeout: a progress handler aborts the statement
+    # ("interrupted") once the deadline passes. Rows fetched after execute()
+    # returns are not covered.
+    raw = context['connection'].connection
+    deadline = time.monotonic() + timeout_ms / 1000
+    raw.set_progress_handler(lambda: time.monotonic() > deadline, _SQLITE_PROGRESS_STEPS)
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as e:
+        if 'interrupted' in str(e) and time.monotonic() > deadline:
+            _timed_out(limits, timeout_ms, sql)
+        raise
+    finally:
+        raw.set_progress_handler(None, 0)
+
+
+def _timed_out(limits: RequestLimits, timeout_ms: int, sql: str) -> None:
+    limits.timed_out = True
+    metrics.inc('oncoone_db_statement_timeouts_total', view=limits.view)
+    logger.warning(
+        f'Statement cancelled after {timeout_ms}ms in {limits.view} (class {limits.limit_class}): {sql[:200]}'
+    )
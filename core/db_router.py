@@ -0,0 +1,88 @@
+"""
+Read-Replica Routing for OncoOne Education
+Sends reads of staff and reporting views to the 'replica' database when one
+is configured, and keeps everything else (and every write) on 'default'
+Version: 1.0
+"""
+
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from django.conf import settings
+
+REPLICA_DATABASE = 'replica'
+
+# Set while a replica-eligible view runs
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+# Set once the current request has written (or arrived with the pin cookie)
+_pinned_to_primary = contextvars.ContextVar('pinned_to_primary', default=False)
+# Set once the current request has written
+_wrote = contextvars.ContextVar('wrote', default=False)
+
+
+def replica_configured() -> bool:
+    return REPLICA_DATABASE in settings.DATABASES
+
+
+@contextmanager
+def use_replica():
+    """Route reads inside the block to the replica (unless the request is pinned to the primary)"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(view_func):
+    """View decorator: the view's reads may be served by the replica"""
+    @functools.wraps(view_func)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view_func(*args, **kwargs)
+    return wrapper
+
+
+def begin_request(pinned: bool = False):
+    """Reset routing state for a new request; returns tokens for end_request"""
+    return _pinned_to_primary.set(pinned), _wrote.set(False)
+
+
+def end_request(tokens):
+    pinned_token, wrote_token = tokens
+    _pinned_to_primary.reset(pinned_token)
+    _wrote.reset(wrote_token)
+
+
+def request_wrote() -> bool:
+    return _wrote.get()
+
+
+class ReplicaRouter:
+    """
+    Database router for an optional read replica
+
+    Reads go to the replica only inside use_replica()/replica_reads, only when
+    DATABASES has a 'replica' entry, and only until the request writes:
+    any write pins the rest of the request to the primary so it reads its own
+    writes (ReplicaPinMiddleware extends this to the next few requests).
+    Without a replica every method returns None and Django uses 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replica_configured():
+            return None
+        if _replica_reads.get() and not _pinned_to_primary.get():
+            return REPLICA_DATABASE
+        # Explicit, so related lookups on replica-loaded objects don't follow them to the replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _pinned_to_primary.set(True)
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
@@ -0,0 +1,372 @@
+"""
+In-Memory Fake Payment Gateway for OncoOne Education
+Deterministic stand-in for Stripe used for load testing, benchmarks and
+offline development. Enable with PAYMENT_GATEWAY=core.fake_gateway.FakePaymentGateway
+Version: 1.0
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Optional, Any
+from django.conf import settings
+
+from .payment_gateway import PaymentGateway
+
+logger = logging.getLogger('core.payment')
+
+# Payment method ids that force an outcome, mirroring Stripe's test payment methods
+DECLINE_PAYMENT_METHODS = {'pm_card_chargeDeclined', 'pm_card_visa_chargeDeclined'}
+THREE_DS_PAYMENT_METHODS = {'pm_card_threeDSecureRequired', 'pm_card_authenticationRequired'}
+
+DEFAULT_WEBHOOK_SECRET = 'whsec_fake'
+
+
+@dataclass
+class FakePaymentIntent:
+    """Minimal PaymentIntent look-alike exposing the attributes views read"""
+    id: str
+    amount: int
+    currency: str
+    client_secret: str
+    payment_method: Optional[str]
+    metadata: Dict[str, str] = field(default_factory=dict)
+    status: str = 'requires_confirmation'
+    outcome: str = 'succeed'  # succeed | decline | requires_action
+    latest_charge: Optional[str] = None
+    last_payment_error: Optional[Dict[str, str]] = None
+    refunded_cents: int = 0
+
+
+class FakePaymentGateway(PaymentGateway):
+    """
+    Deterministic in-process payment gateway
+
+    Behaviour is configured through settings.FAKE_PAYMENT_GATEWAY:
+        LATENCY_MS:       simulated network latency per call
+        LATENCY_JITTER_MS: extra latency added deterministically per intent
+        DECLINE_RATE:     fraction of intents declined at confirmation (0-1)
+        THREE_DS_RATE:    fraction of intents that require 3DS authentication (0-1)
+        SEED:             seed used to pick outcomes, so runs are repeatable
+
+    Outcomes are derived from a hash of the seed and the intent sequence
+    number, so a given intent always gets the same outcome regardless of
+    thread scheduling.
+    """
+
+    def __init__(self, **options):
+        config = dict(getattr(settings, 'FAKE_PAYMENT_GATEWAY', {}) or {})
+        config.update(options)
+        self.latency_ms = float(config.get('LATENCY_MS', 0))
+        self.latency_jitter_ms = float(config.get('LATENCY_JITTER_MS', 0))
+        self.decline_rate = float(config.get('DECLINE_RATE', 0))
+        self.three_ds_rate = float(config.get('THREE_DS_RATE', 0))
+        self.seed = str(config.get('SEED', 0))
+        self.webhook_secret = getattr(settings, 'STRIPE_WEBHOOK_SECRET', '') or DEFAULT_WEBHOOK_SECRET
+
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._charge_sequence = 0
+        self._intents: Dict[str, FakePaymentIntent] = {}
+        self._refunds: Dict[str, Dict[str, Any]] = {}
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _fraction(self, key: str) -> float:
+        """Map a key to a stable float in [0, 1)"""
+        digest = hashlib.sha256(f'{self.seed}:{key}'.encode()).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+    def _sleep(self, key: str) -> None:
+        delay = self.latency_ms + self.latency_jitter_ms * self._fraction(f'jitter:{key}')
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _pick_outcome(self, sequence: int, payment_method_id: Optional[str]) -> str:
+        if payment_method_id in DECLINE_PAYMENT_METHODS:
+            return 'decline'
+        if payment_method_id in THREE_DS_PAYMENT_METHODS:
+            return 'requires_action'
+        roll = self._fraction(f'outcome:{sequence}')
+        if roll < self.decline_rate:
+            return 'decline'
+        if roll < self.decline_rate + self.three_ds_rate:
+            return 'requires_action'
+        return 'succeed'
+
+    def _get_intent(self, payment_intent_id: str) -> Optional[FakePaymentIntent]:
+        with self._lock:
+            return self._intents.get(payment_intent_id)
+
+    def reset(self) -> None:
+        """Forget all intents and refunds (used between benchmark runs)"""
+        with self._lock:
+            self._sequence = 0
+            self._charge_sequence = 0
+            self._intents.clear()
+            self._refunds.clear()
+
+    # ------------------------------------------------------------------
+    # PaymentGateway interface
+    # ------------------------------------------------------------------
+
+    def create_payment_intent(
+        self,
+        amount_cad: Decimal,
+        email: str,
+        student_name: str,
+        course_name: str,
+        payment_id: Optional[str] = None,
+        payment_method_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        from .stripe_processor import StripePaymentProcessor, PaymentProcessingError
+
+        try:
+            StripePaymentProcessor.validate_amount(amount_cad)
+            amount_cents = StripePaymentProcessor.get_stripe_amount(amount_cad)
+        except PaymentProcessingError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'error_type': 'validation_error'
+            }
+
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        intent_id = f'pi_fake_{sequence:010d}'
+        self._sleep(intent_id)
+
+        metadata = {
+            'student_name': str(student_name)[:500],
+            'student_email': str(email)[:500],
+            'course_name': str(course_name)[:500],
+        }
+        if payment_id:
+            metadata['payment_id'] = str(payment_id)
+
+        intent = FakePaymentIntent(
+            id=intent_id,
+            amount=amount_cents,
+            currency=settings.STRIPE_CURRENCY,
+            client_secret=f'{intent_id}_secret_fake',
+            payment_method=payment_method_id,
+            metadata=metadata,
+            outcome=self._pick_outcome(sequence, payment_method_id),
+        )
+        with self._lock:
+            self._intents[intent_id] = intent
+
+        logger.info(f'Fake Payment Intent created: {intent_id} | Outcome: {intent.outcome}')
+        return {
+            'success': True,
+            'client_secret': intent.client_secret,
+            'payment_intent_id': intent.id,
+            'amount': amount_cad,
+            'currency': 'CAD',
+            'status': intent.status
+        }
+
+    def update_payment_intent(
+        self,
+        payment_intent_id: str,
+        amount_cad: Optional[Decimal] = None,
+        payment_method_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        from .stripe_processor import StripePaymentProcessor, PaymentProcessingError
+
+        self._sleep(payment_intent_id)
+        intent = self._get_intent(payment_intent_id)
+        if intent is None or intent.status in ('succeeded', 'canceled'):
+            return {
+                'success': False,
+                'error': 'Unable to update payment.',
+                'error_type': 'update_error'
+            }
+
+        amount_cents = None
+        if amount_cad is not None:
+            try:
+                StripePaymentProcessor.validate_amount(amount_cad)
+                amount_cents = StripePaymentProcessor.get_stripe_amount(amount_cad)
+            except PaymentProcessingError as e:
+                return {
+                    'success': False,
+                    'error': str(e),
+                    'error_type': 'validation_error'
+                }
+
+        with self._lock:
+            if amount_cents is not None:
+                intent.amount = amount_cents
+            if payment_method_id:
+                intent.payment_method = payment_method_id
+                if payment_method_id in DECLINE_PAYMENT_METHODS | THREE_DS_PAYMENT_METHODS:
+                    intent.outcome = self._pick_outcome(0, payment_method_id)
+            intent.status = 'requires_confirmation'
+
+        return {
+            'success': True,
+            'client_secret': intent.client_secret,
+            'payment_intent_id': intent.id,
+            'amount': intent.amount / 100,
+            'status': intent.status
+        }
+
+    def retrieve_payment_intent(self, payment_intent_id: str) -> Dict[str, Any]:
+        self._sleep(payment_intent_id)
+        intent = self._get_intent(payment_intent_id)
+        if intent is None:
+            return {
+                'success': False,
+                'error': 'Unable to retrieve payment information.',
+                'error_type': 'retrieval_error'
+            }
+        return {
+            'success': True,
+            'status': intent.status,
+            'amount': intent.amount / 100,
+            'currency': intent.currency.upper(),
+            'charges': [],
+            'payment_intent': intent
+        }
+
+    def confirm_payment(self, payment_intent_id: str, payment_method_id: Optional[str] = None) -> Dict[str, Any]:
+        self._sleep(payment_intent_id)
+        intent = self._get_intent(payment_intent_id)
+        if intent is None:
+            return {
+                'success': False,
+                'error': 'Unable to confirm payment status.',
+                'error_type': 'confirmation_error'
+            }
+
+        with self._lock:
+            if intent.status != 'succeeded':
+                if intent.outcome == 'decline':
+                    intent.status = 'requires_payment_method'
+                    intent.last_payment_error = {'code': 'card_declined', 'message': 'Your card was declined.'}
+                    return {
+                        'success': False,
+                        'status': intent.status,
+                        'error': 'Confirmation failed: Your card was declined.',
+                        'error_type': 'confirmation_error'
+                    }
+                if intent.outcome == 'requires_action':
+                    intent.status = 'requires_action'
+                    return {
+                        'success': False,
+                        'status': intent.status,
+                        'requires_action': True,
+                        'client_secret': intent.client_secret,
+                        'error': 'Payment status: Requires Action'
+                    }
+                self._charge_sequence += 1
+                intent.status = 'succeeded'
+                intent.latest_charge = f'ch_fake_{self._charge_sequence:010d}'
+
+        return {
+            'success': True,
+            'status': 'succeeded',
+            'amount': intent.amount / 100,
+            'charges': [],
+            'charge_id': intent.latest_charge,
+            'payment_method': intent.payment_method
+        }
+
+    def cancel_payment_intent(self, payment_intent_id: str, reason: str = 'abandoned') -> Dict[str, Any]:
+        self._sleep(payment_intent_id)
+        intent = self._get_intent(payment_intent_id)
+        with self._lock:
+            if intent is None or intent.status in ('succeeded', 'canceled'):
+                return {
+                    'success': False,
+                    'status': intent.status if intent else None,
+                    'error': 'Unable to cancel payment.',
+                    'error_type': 'cancel_error'
+                }
+            intent.status = 'canceled'
+        return {
+            'success': True,
+            'status': 'canceled',
+            'payment_intent_id': payment_intent_id
+        }
+
+    def refund_payment(
+        self,
+        charge_id: str,
+        amount_cents: Optional[int] = None,
+        reason: str = 'requested_by_customer'
+    ) -> Dict[str, Any]:
+        self._sleep(charge_id)
+        with self._lock:
+            intent = next((i for i in self._intents.values() if i.latest_charge == charge_id), None)
+            if intent is None:
+                return {
+                    'success': False,
+                    'error': 'Unable to process refund. Please contact support.',
+                    'error_type': 'refund_error'
+                }
+            refundable = intent.amount - intent.refunded_cents
+            amount = amount_cents or refundable
+            if amount > refundable:
+                return {
+                    'success': False,
+                    'error': 'Unable to process refund. Please contact support.',
+                    'error_type': 'refund_error'
+                }
+            intent.refunded_cents += amount
+            refund_id = f're_fake_{len(self._refunds) + 1:010d}'
+            self._refunds[refund_id] = {'charge': charge_id, 'amount': amount, 'reason': reason}
+
+        return {
+            'success': True,
+            'refund_id': refund_id,
+            'status': 'succeeded',
+            'amount': amount / 100,
+            'currency': intent.currency.upper()
+        }
+
+    def sign_payload(self, payload: bytes, timestamp: Optional[int] = None) -> str:
+        """Build a Stripe-Signature style header for a payload (for load tests)"""
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signed = f'{timestamp}.'.encode() + payload
+        digest = hmac.new(self.webhook_secret.encode(), signed, hashlib.sha256).hexdigest()
+        return f't={timestamp},v1={digest}'
+
+    def verify_webhook_signature(self, payload: bytes, signature: str) -> Dict[str, Any]:
+        try:
+            parts = dict(item.split('=', 1) for item in (signature or '').split(','))
+            expected = self.sign_payload(payload, int(parts['t']))
+        except (KeyError, ValueError):
+            return {
+                'success': False,
+                'error': 'Invalid signature'
+            }
+
+        if not hmac.compare_digest(expected, signature):
+            return {
+                'success': False,
+                'error': 'Invalid signature'
+            }
+
+        try:
+            event = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            return {
+                'success': False,
+                'error': 'Invalid payload'
+            }
+
+        return {
+            'success': True,
+            'event': event,
+            'event_type': event.get('type')
+        }
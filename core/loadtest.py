@@ -0,0 +1,217 @@
+"""
+Checkout Funnel Load Test for OncoOne Education
+Concurrent simulated students walk the payment portal from lookup to OTP
+verification; OTP codes are read from the locmem outbox like a student
+reading their email
+Version: 1.0
+
+Run through `python manage.py loadtest_checkout` (fake gateway, locmem email,
+throwaway database - see core.benchmarks.benchmark_environment).
+"""
+
+import itertools
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from django.core import mail
+from django.db import connection
+from django.test import Client
+
+from .benchmarks import percentiles, seed_students
+from .models import StudentCourseEnrollment
+
+STEPS = (
+    'portal_lookup',
+    'select_course',
+    'amount',
+    'summary',
+    'card_entry',
+    'otp_create',
+    'otp_verify',
+)
+
+OTP_PATTERN = re.compile(r'OTP CODE: (\d{6})')
+
+PAYMENT_AMOUNT = '50.00'
+TAX_AMOUNT = '2.50'
+TOTAL_AMOUNT = '52.50'
+
+
+class StepFailed(Exception):
+    """A journey step returned an error; the simulated student gives up"""
+    pass
+
+
+class CheckoutLoadTest:
+    """
+    `users` threads each run journeys back to back until `journeys` have been
+    started. Users start spread over `ramp_up` seconds and pause `think_ms`
+    between steps. Every student is used by one journey at a time, so an
+    OTP email can be matched to its journey by recipient.
+    """
+
+    def __init__(self, users=20, journeys=200, ramp_up=0.0, think_ms=0, students=None, log=None):
+        self.users = users
+        self.journeys = journeys
+        self.ramp_up = ramp_up
+        self.think_ms = think_ms
+        self.students = students or max(journeys, users)
+        self.log = log or (lambda message: None)
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(list)
+        self._errors = defaultdict(int)
+        self._error_samples = defaultdict(list)
+        self._completed = 0
+
+    def setup(self):
+        self.log(f'Seeding {self.students} students...')
+        seed_students(self.students)
+        # One enrollment per student, so concurrent journeys never share an inbox
+        enrollments = (
+            StudentCourseEnrollment.objects
+            .filter(registration__email__endswith='@loadtest.invalid')
+            .order_by('registration_id', 'id')
+            .values_list('registration_id', 'registration__registration_number', 'registration__email',
+                         'registration__name', 'id')
+        )
+        seen, self.targets = set(), []
+        for row in enrollments:
+            if row[0] not in seen:
+                seen.add(row[0])
+                self.targets.append(row)
+        self._next_journey = itertools.count()
+        mail.outbox = []
+
+    def record(self, step, elapsed_ms, error=None):
+        with self._lock:
+            if error is None:
+                self._latencies[step].append(elapsed_ms)
+            else:
+                self._errors[step] += 1
+                if len(self._error_samples[step]) < 3:
+                    self._error_samples[step].append(error)
+
+    def step(self, step, call):
+        """Time one request; raises StepFailed (after recording it) on an error response"""
+        started = time.perf_counter()
+        try:
+            response = call()
+        except Exception as exc:
+            self.record(step, 0, f'{type(exc).__name__}: {exc}')
+            raise StepFailed(step)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            self.record(step, elapsed_ms, f'HTTP {response.status_code}: {response.content[:200]!r}')
+            raise StepFailed(step)
+        self.record(step, elapsed_ms)
+        if self.think_ms:
+            time.sleep(self.think_ms / 1000)
+        return response
+
+    def read_otp(self, email):
+        """The code from the newest OTP email sent to `email`"""
+        for message in reversed(list(mail.outbox)):
+            if email in message.to:
+                match = OTP_PATTERN.search(message.body)
+                if match:
+                    return match.group(1)
+        return None
+
+    def journey(self, client, target):
+        student_id, registration_number, email, name, enrollment_id = target
+        amounts = f'enrollment_id={enrollment_id}&amount={PAYMENT_AMOUNT}&tax={TAX_AMOUNT}&total={TOTAL_AMOUNT}'
+
+        self.step('portal_lookup', lambda: client.post(
+            '/api/payment/verify-student/',
+            json.dumps({'student_id': registration_number}),
+            content_type='application/json',
+        ))
+        self.step('select_course', lambda: client.get(f'/api/payment/select-course/{student_id}/'))
+        self.step('amount', lambda: client.get(f'/api/payment/amount/{student_id}/?enrollment_id={enrollment_id}'))
+        self.step('summary', lambda: client.get(f'/api/payment/summary/{student_id}/?{amounts}'))
+        self.step('card_entry', lambda: client.get(f'/api/payment/card-entry/{student_id}/?{amounts}'))
+        response = self.step('otp_create', lambda: client.post('/api/payment/create-and-send-otp/', json.dumps({
+            'student_id': student_id,
+            'enrollment_id': enrollment_id,
+            'payment_method_id': 'pm_card_visa',
+            'payment_amount': PAYMENT_AMOUNT,
+            'tax_amount': TAX_AMOUNT,
+            'total_amount': TOTAL_AMOUNT,
+            'card_holder': name,
+            'card_type': 'visa',
+            'card_last_four': '4242',
+            'email': email,
+        }), content_type='application/json'))
+        payment_id = response.json()['payment_id']
+
+        otp_code = self.read_otp(email)
+        if otp_code is None:
+            self.record('otp_verify', 0, f'No OTP email for {email}')
+            raise StepFailed('otp_verify')
+        self.step('otp_verify', lambda: client.post(
+            '/api/payment/verify-otp/',
+            json.dumps({'payment_id': payment_id, 'otp_code': otp_code}),
+            content_type='application/json',
+        ))
+        with self._lock:
+            self._completed += 1
+
+    def user(self, number):
+        if self.ramp_up:
+            time.sleep(self.ramp_up * number / self.users)
+        client = Client()
+        try:
+            while True:
+                index = next(self._next_journey)
+                if index >= self.journeys:
+                    return
+                try:
+                    self.journey(client, self.targets[index % len(self.targets)])
+                except StepFailed:
+                    pass
+        finally:
+            connection.close()
+
+    def run(self) -> Dict:
+        self.setup()
+        self.log(f'{self.users} users, {self.journeys} journeys...')
+        threads = [threading.Thread(target=self.user, args=(n,)) for n in range(self.users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        return self.report(seconds)
+
+    def report(self, seconds) -> Dict:
+        steps = {}
+        for step in STEPS:
+            latencies: List[float] = self._latencies[step]
+            errors = self._errors[step]
+            requests = len(latencies) + errors
+            spread = percentiles(latencies)
+            steps[step] = {
+                'requests': requests,
+                'errors': errors,
+                'error_rate': errors / requests if requests else 0.0,
+                'throughput': requests / seconds if seconds else 0.0,
+                'p50_ms': round(spread['p50'], 2),
+                'p95_ms': round(spread['p95'], 2),
+                'p99_ms': round(spread['p99'], 2),
+                'error_samples': self._error_samples[step],
+            }
+        return {
+            'users': self.users,
+            'journeys': self.journeys,
+            'completed': self._completed,
+            'failed': self.journeys - self._completed,
+            'error_rate': (self.journeys - self._completed) / self.journeys if self.journeys else 0.0,
+            'seconds': round(seconds, 3),
+            'checkouts_per_second': self._completed / seconds if seconds else 0.0,
+            'steps': steps,
+        }
@@ -0,0 +1,118 @@
+"""
+Benchmark the registration, portal, admin and checkout endpoints
+
+Creates a throwaway test database (like `manage.py test`), seeds it with
+generate_load_data, and drives each endpoint through the Django test client
+with the fake payment gateway and locmem email. Writes p50/p95/p99 latency,
+queries per request and peak memory to a JSON report; pass the report of an
+earlier commit as --baseline to print the change per endpoint.
+
+Example:
+    python manage.py benchmark_endpoints --output bench/before.json
+    python manage.py benchmark_endpoints --output bench/after.json --baseline bench/before.json
+    python manage.py benchmark_endpoints --students 500 --only register_view student_dashboard
+"""
+
+import json
+import os
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.benchmarks import EndpointBenchmark, benchmark_environment
+
+COLUMNS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_median', 'peak_memory_kb')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark hot endpoints against seeded data and write a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000, help='Students seeded (x2 enrollments, x5 payments)')
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint first')
+        parser.add_argument('--listing-iterations', type=int, default=5, help='Timed requests for the admin listings')
+        parser.add_argument('--only', nargs='+', help='Only these endpoints')
+        parser.add_argument('--output', default='benchmark-report.json', help='Where to write the JSON report')
+        parser.add_argument('--baseline', help='Earlier report to compare against')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read baseline {options["baseline"]}: {exc}')
+
+        benchmark = EndpointBenchmark(
+            students=options['students'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            listing_iterations=options['listing_iterations'],
+            log=self.stdout.write,
+        )
+        known = {name for name, _, _ in benchmark.scenarios()}
+        unknown = set(options['only'] or []) - known
+        if unknown:
+            raise CommandError(f'Unknown endpoint(s): {", ".join(sorted(unknown))}. Choose from {", ".join(sorted(known))}')
+
+        with benchmark_environment():
+            results = benchmark.run(only=options['only'])
+            database = connection.vendor
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'database': database,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'students': options['students'],
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+            },
+            'endpoints': results,
+        }
+        output_dir = os.path.dirname(options['output'])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+        self.print_table(results, baseline['endpoints'] if baseline else None)
+        errors = sum(result['errors'] for result in results.values())
+        summary = f'Endpoints: {len(results)} | Error responses: {errors} | Report: {options["output"]}'
+        self.stdout.write(self.style.SUCCESS(summary) if not errors else self.style.WARNING(summary))
+
+    def print_table(self, results, baseline):
+        line = '=' * 110
+        self.stdout.write(line)
+        self.stdout.write(f"{'Endpoint':<30} {'p50 ms':>14} {'p95 ms':>14} {'p99 ms':>14} {'Queries':>12} {'Peak KB':>14}")
+        self.stdout.write(line)
+        for name, result in results.items():
+            cells = []
+            for column in COLUMNS:
+                value = result[column]
+                cell = f'{value:.1f}' if isinstance(value, float) else str(value)
+                previous = (baseline or {}).get(name, {}).get(column)
+                if previous:
+                    cell += f' ({(value - previous) / previous:+.0%})'
+                cells.append(cell)
+            self.stdout.write(f'{name:<30} {cells[0]:>14} {cells[1]:>14} {cells[2]:>14} {cells[3]:>12} {cells[4]:>14}')
+        self.stdout.write(line)
@@ -0,0 +1,138 @@
+"""
+Benchmark concurrent registrations on SQLite, with and without the production profile
+
+Each profile gets a freshly migrated database in a temporary directory and a
+child process that posts registrations to /api/register/ from several
+threads at once (Django test client, locmem email). The child runs with
+SQLITE_PRODUCTION_PROFILE=False (SQLite's defaults, deferred transactions)
+or True (core/sqlite_profile.py), so the two runs differ only in the profile.
+
+Example:
+    python manage.py benchmark_sqlite
+    python manage.py benchmark_sqlite --threads 16 --requests 100
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from core.benchmarks import percentiles
+
+PROFILES = (('default', 'False'), ('production', 'True'))
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent registration throughput on SQLite with default pragmas vs the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=50, help='Registrations posted per client')
+        # Internal: run one profile's load against the current settings and print JSON
+        parser.add_argument('--worker', action='store_true', help='(internal) run the load in this process')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.run_load(options['threads'], options['requests'])))
+            return
+
+        manage_py = str(settings.BASE_DIR / 'manage.py')
+        results = {}
+        for profile, enabled in PROFILES:
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {
+                    **os.environ,
+                    'POSTGRES_DB': '',
+                    'SQLITE_PATH': os.path.join(tmp, 'bench.sqlite3'),
+                    'SQLITE_REPLICA_PATH': '',
+                    'SQLITE_PRODUCTION_PROFILE': enabled,
+                    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+                    'ADMIN_EMAIL': 'admin@example.com',
+                    'PAYMENT_SWEEPER_INTERVAL_SECONDS': '0',
+                }
+                self.stdout.write(f'[{profile}] migrating a fresh database...')
+                subprocess.run([sys.executable, manage_py, 'migrate', '--noinput', '-v', '0'], env=env, check=True)
+                self.stdout.write(f"[{profile}] {options['threads']} threads x {options['requests']} registrations...")
+                child = subprocess.run(
+                    [sys.executable, manage_py, 'benchmark_sqlite', '--worker',
+                     '--threads', str(options['threads']), '--requests', str(options['requests'])],
+                    env=env, capture_output=True, text=True,
+                )
+                if child.returncode:
+                    raise CommandError(f'{profile} run failed:\n{child.stderr}')
+                results[profile] = json.loads(child.stdout.strip().splitlines()[-1])
+
+        line = '=' * 84
+        self.stdout.write(line)
+        self.stdout.write(f"{'Profile':<12} {'OK':>7} {'Failed':>7} {'Locked':>7} {'Seconds':>9} {'Req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        self.stdout.write(line)
+        for profile, result in results.items():
+            self.stdout.write(
+                f"{profile:<12} {result['ok']:>7} {result['failed']:>7} {result['locked']:>7} "
+                f"{result['seconds']:>9.2f} {result['throughput']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f}"
+            )
+        self.stdout.write(line)
+
+        before, after = results['default'], results['production']
+        speedup = after['throughput'] / before['throughput'] if before['throughput'] else float('inf')
+        self.stdout.write(self.style.SUCCESS(
+            f"Successful registrations/s: {before['throughput']:.1f} -> {after['throughput']:.1f} ({speedup:.1f}x) | "
+            f"Locked errors: {before['locked']} -> {after['locked']}"
+        ))
+
+    def run_load(self, threads, requests):
+        """Post `threads` x `requests` registrations concurrently; returns counts and latencies"""
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        lock = threading.Lock()
+        latencies, outcome = [], {'ok': 0, 'failed': 0, 'locked': 0}
+        start = threading.Barrier(threads)
+
+        def client_thread(thread_number):
+            client = Client()
+            start.wait()
+            try:
+                for i in range(requests):
+                    began = time.perf_counter()
+                    response = client.post('/api/register/', {
+                        'name': f'Bench Student {thread_number}-{i}',
+                        'email': f'bench-{thread_number}-{i}@example.com',
+                        'contact': '555-0100',
+                        'course': 'Benchmark Course',
+                        'hasQualification': 'no',
+                    })
+                    elapsed_ms = (time.perf_counter() - began) * 1000
+                    with lock:
+                        if response.status_code == 200:
+                            outcome['ok'] += 1
+                            latencies.append(elapsed_ms)
+                        else:
+                            outcome['failed'] += 1
+                            if b'locked' in response.content:
+                                outcome['locked'] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=client_thread, args=(n,)) for n in range(threads)]
+        began = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - began
+
+        spread = percentiles(latencies)
+        return {
+            **outcome,
+            'seconds': seconds,
+            'throughput': outcome['ok'] / seconds if seconds else 0.0,
+            'p50_ms': spread['p50'],
+            'p95_ms': spread['p95'],
+        }
@@ -0,0 +1,32 @@
+"""
+Create the Postgres sequences behind invoice numbers ahead of time
+
+Requests never create sequences (the app's database user needs no DDL rights);
+a year without one falls back to the slower NumberSequence counter row. The
+migrations create this year's and next year's; run this yearly for the rest.
+Does nothing on SQLite.
+
+Cron example (every December 1st):
+    0 3 1 12 * cd /srv/oncoone && python manage.py create_number_sequences >> logs/sequences.log 2>&1
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.numbering import create_sequence, invoice_sequence_name, sequence_name
+
+
+class Command(BaseCommand):
+    help = "Create the invoice number sequences for the given years (default: this year and next)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('years', nargs='*', type=int, help='Years to create sequences for')
+
+    def handle(self, *args, **options):
+        year = timezone.now().year
+        for invoice_year in options['years'] or [year, year + 1]:
+            name = invoice_sequence_name(invoice_year)
+            if create_sequence(name):
+                self.stdout.write(self.style.SUCCESS(f'Created {sequence_name(name)}'))
+            else:
+                self.stdout.write(f'{sequence_name(name)}: exists or not using Postgres')
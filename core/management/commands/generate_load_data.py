@@ -0,0 +1,273 @@
+"""
+Generate production-sized synthetic data for performance work
+
+Creates registrations, course enrollments (some with proof blobs), payments
+with their OTPs, and invoices for completed payments. The same --seed always
+produces the same rows. Everything is inserted with batched multi-row
+INSERTs that write the generated timestamps directly (see insert_rows), one
+transaction per batch of students, on SQLite or Postgres.
+
+Generated students use the @loadtest.invalid email domain and ON00-NNNNNNN
+registration numbers (seven digits, one more than real numbers), so they
+never collide with real data and --flush can remove them.
+
+Example:
+    python manage.py generate_load_data
+    python manage.py generate_load_data --registrations 20000 --enrollments 40000 --payments 100000
+    python manage.py generate_load_data --flush --proof-ratio 0.1 --seed 7
+"""
+
+import math
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from core.models import Course, Payment, PaymentInvoice, PaymentOTP, Registration, StudentCourseEnrollment
+
+EMAIL_DOMAIN = 'loadtest.invalid'
+
+FIRST_NAMES = ['Olivia', 'Emma', 'Amelia', 'Sophia', 'Noah', 'Liam', 'Ava', 'Mia', 'Priya', 'Aisha',
+               'Chloe', 'Lucas', 'Zoe', 'Hannah', 'Mateo', 'Fatima', 'Leah', 'Grace', 'Wei', 'Nora']
+LAST_NAMES = ['Smith', 'Tremblay', 'Martin', 'Roy', 'Wilson', 'Singh', 'Nguyen', 'Brown', 'Gagnon', 'Lee',
+              'Patel', 'Chen', 'Kim', 'Taylor', 'Khan', 'Bouchard', 'Campbell', 'Garcia', 'Ali', 'Young']
+
+# Weighted like a live system: mostly completed, a tail of abandoned and failed checkouts
+PAYMENT_STATUSES = ['completed', 'pending', 'failed', 'cancelled', 'processing']
+PAYMENT_STATUS_WEIGHTS = [60, 10, 12, 16, 2]
+
+PROOF_MIMES = [('application/pdf', 'pdf'), ('image/jpeg', 'jpg'), ('image/png', 'png')]
+MAX_PROOF_BYTES = 5 * 1024 * 1024  # Same cap as register_view
+
+
+def spread(total: int, slots: int, index: int) -> int:
+    """How many of `total` items slot `index` of `slots` gets; exact and evenly spread"""
+    return (index + 1) * total // slots - index * total // slots
+
+
+def insert_rows(model, objs):
+    """
+    bulk_create that keeps the generated created_at/updated_at values
+
+    bulk_create runs each field's pre_save(), which stamps auto_now and
+    auto_now_add fields with now(). This is the same batched INSERT as a raw
+    insert (how loaddata saves fixtures): the values set on the objects are
+    written as they are, and the new ids are set on the objects.
+    """
+    if not objs:
+        return
+    connection = connections[router.db_for_write(model)]
+    if not connection.features.can_return_rows_from_bulk_insert:
+        raise CommandError(f'{connection.vendor} cannot return ids from a bulk insert')
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    returning = model._meta.db_returning_fields
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    for first in range(0, len(objs), batch_size):
+        batch = objs[first:first + batch_size]
+        rows = model._base_manager.using(connection.alias)._insert(
+            batch, fields=fields, returning_fields=returning, raw=True, using=connection.alias,
+        )
+        for obj, row in zip(batch, rows):
+            for field, value in zip(returning, row):
+                setattr(obj, field.attname, value)
+            obj._state.adding = False
+            obj._state.db = connection.alias
+
+
+class Command(BaseCommand):
+    help = 'Generate deterministic production-scale registrations, enrollments, payments and OTPs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registrations', type=int, default=200_000)
+        parser.add_argument('--enrollments', type=int, default=400_000, help='Total enrollments, spread evenly over students')
+        parser.add_argument('--payments', type=int, default=1_000_000, help='Total payments, spread evenly over enrollments')
+        parser.add_argument('--otp-ratio', type=float, default=1.0, help='Fraction of payments that have an OTP row')
+        parser.add_argument('--proof-ratio', type=float, default=0.02, help='Fraction of enrollments with a proof blob')
+        parser.add_argument('--proof-kb', type=int, default=400, help='Median proof size in KB (sizes vary around it)')
+        parser.add_argument('--days', type=int, default=365, help='Spread creation times over this many days')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Students (with their rows) per transaction')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--flush', action='store_true', help='Delete previously generated data first')
+
+    def handle(self, *args, **options):
+        registrations = options['registrations']
+        if registrations <= 0:
+            raise CommandError('--registrations must be positive')
+        if options['enrollments'] < 0 or options['payments'] < 0:
+            raise CommandError('--enrollments and --payments cannot be negative')
+        if options['payments'] and not options['enrollments']:
+            raise CommandError('--payments needs at least one enrollment')
+
+        generated = Registration.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+        if options['flush']:
+            self.flush(generated, options['batch_size'])
+        elif generated.exists():
+            raise CommandError('Generated data already exists. Re-run with --flush to replace it.')
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.now = timezone.now()
+        self.courses = self.ensure_courses(math.ceil(options['enrollments'] / registrations))
+
+        started = time.monotonic()
+        self.totals = {'registrations': 0, 'enrollments': 0, 'payments': 0, 'otps': 0, 'invoices': 0, 'proof_bytes': 0}
+        self.enrollment_index = 0
+        self.payment_index = 0
+        for first in range(0, registrations, options['batch_size']):
+            last = min(first + options['batch_size'], registrations)
+            with transaction.atomic():
+                self.generate_batch(first, last)
+            elapsed = time.monotonic() - started
+            rows = sum(value for key, value in self.totals.items() if key != 'proof_bytes')
+            self.stdout.write(
+                f'{last}/{registrations} students | {rows} rows | '
+                f'{rows / elapsed if elapsed else 0:,.0f} rows/s | {elapsed:.1f}s'
+            )
+
+        totals = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Registrations: {totals['registrations']} | Enrollments: {totals['enrollments']} | "
+            f"Payments: {totals['payments']} | OTPs: {totals['otps']} | Invoices: {totals['invoices']} | "
+            f"Proof blobs: {totals['proof_bytes'] / 1024 / 1024:.1f} MB | {time.monotonic() - started:.1f}s"
+        ))
+
+    def flush(self, generated, batch_size):
+        deleted = 0
+        while True:
+            ids = list(generated.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                Registration.objects.filter(id__in=ids).delete()  # Cascades to enrollments, payments, OTPs, invoices
+            deleted += len(ids)
+            self.stdout.write(f'Deleted {deleted} generated students...')
+
+    def ensure_courses(self, needed):
+        """The load courses LOAD01.. (created once, reused), enough for the busiest student"""
+        courses = []
+        for number in range(1, max(needed, 4) + 1):
+            course, _created = Course.objects.get_or_create(
+                course_code=f'LOAD{number:02d}',
+                defaults={
+                    'course_name': f'Load Test Course {number}',
+                    'price_cad': Decimal(1000 + 500 * (number % 4)),
+                    'requires_prerequisite': number % 2 == 1,
+                },
+            )
+            courses.append(course)
+        return courses
+
+    def created_at(self, index, total):
+        """Creation times rise with the index over --days, with some jitter"""
+        days = self.options['days']
+        offset = days * 86400 * (1 - (index + 1) / total) + self.rng.uniform(0, 3600)
+        return self.now - timedelta(seconds=offset)
+
+    def proof_blob(self):
+        size = int(self.rng.lognormvariate(math.log(self.options['proof_kb'] * 1024), 0.6))
+        return self.rng.randbytes(min(max(size, 10 * 1024), MAX_PROOF_BYTES))
+
+    def generate_batch(self, first, last):
+        rng, options = self.rng, self.options
+        total_registrations = options['registrations']
+
+        registrations = []
+        for index in range(first, last):
+            created = self.created_at(index, total_registrations)
+            registrations.append(Registration(
+                name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                email=f'student{index}@{EMAIL_DOMAIN}',
+                contact=f'+1-{rng.randint(200, 999)}-555-{rng.randint(0, 9999):04d}',
+                registration_number=f'ON00-{index:07d}',
+                student_password=f'ld{index:08d}',
+                created_at=created,
+                updated_at=created,
+            ))
+        insert_rows(Registration, registrations)
+
+        enrollments = []
+        for offset, registration in enumerate(registrations):
+            count = spread(options['enrollments'], total_registrations, first + offset)
+            for course in rng.sample(self.courses, count):
+                enrolled = registration.created_at + timedelta(minutes=rng.randint(0, 60 * 24 * 14))
+                enrollment = StudentCourseEnrollment(
+                    registration=registration,
+                    course=course,
+                    course_name=course.course_name,
+                    has_prerequisite=course.requires_prerequisite,
+                    enrollment_status=rng.choice(['pending', 'approved', 'in_progress', 'completed']),
+                    enrolled_at=enrolled,
+                    updated_at=enrolled,
+                )
+                if course.requires_prerequisite and rng.random() < options['proof_ratio']:
+                    mime, extension = rng.choice(PROOF_MIMES)
+                    enrollment.proof_data = self.proof_blob()
+                    enrollment.proof_name = f'certificate_{registration.registration_number}.{extension}'
+                    enrollment.proof_mime = mime
+                    self.totals['proof_bytes'] += len(enrollment.proof_data)
+                enrollments.append(enrollment)
+        insert_rows(StudentCourseEnrollment, enrollments)
+
+        total_enrollments = options['enrollments']
+        payments = []
+        for enrollment in enrollments:
+            count = spread(options['payments'], total_enrollments, self.enrollment_index)
+            self.enrollment_index += 1
+            price = enrollment.course.price_cad
+            for _ in range(count):
+                self.payment_index += 1
+                status = rng.choices(PAYMENT_STATUSES, PAYMENT_STATUS_WEIGHTS)[0]
+                amount = (price / count).quantize(Decimal('0.01'))
+                tax = (amount * Decimal('0.05')).quantize(Decimal('0.01'))
+                created = enrollment.enrolled_at + timedelta(minutes=rng.randint(1, 60 * 24 * 30))
+                payments.append(Payment(
+                    registration=enrollment.registration,
+                    enrollment=enrollment,
+                    student_id=enrollment.registration.registration_number,
+                    course_name=enrollment.course_name,
+                    total_price_cad=price,
+                    payment_amount_cad=amount,
+                    tax_amount=tax,
+                    final_amount_cad=amount + tax,
+                    status=status,
+                    payment_method=rng.choice(['visa', 'mastercard', 'amex']),
+                    card_holder_name=enrollment.registration.name,
+                    card_last_four=f'{rng.randint(0, 9999):04d}',
+                    stripe_payment_intent_id=f'pi_load_{self.payment_index:010d}',
+                    stripe_charge_id=f'ch_load_{self.payment_index:010d}' if status == 'completed' else None,
+                    transaction_id=f'load-{options["seed"]}-{self.payment_index}',
+                    invoice_number=f'INV-LD-{self.payment_index:08d}' if status == 'completed' else None,
+                    created_at=created,
+                    updated_at=created,
+                    completed_at=created + timedelta(minutes=2) if status == 'completed' else None,
+                ))
+        insert_rows(Payment, payments)
+
+        otps, invoices = [], []
+        for payment in payments:
+            if rng.random() < options['otp_ratio']:
+                verified = payment.status == 'completed'
+                otps.append(PaymentOTP(
+                    payment=payment,
+                    otp_code=f'{rng.randint(0, 999999):06d}',
+                    is_verified=verified,
+                    attempts=rng.choice([0, 0, 0, 1, 2]),
+                    created_at=payment.created_at,
+                    expires_at=payment.created_at + timedelta(minutes=10),
+                    verified_at=payment.completed_at,
+                    ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                ))
+            if payment.status == 'completed':
+                invoices.append(PaymentInvoice(payment=payment, generated_at=payment.completed_at))
+        insert_rows(PaymentOTP, otps)
+        insert_rows(PaymentInvoice, invoices)
+
+        self.totals['registrations'] += len(registrations)
+        self.totals['enrollments'] += len(enrollments)
+        self.totals['payments'] += len(payments)
+        self.totals['otps'] += len(otps)
+        self.totals['invoices'] += len(invoices)
@@ -0,0 +1,58 @@
+"""
+Import students and course enrollments from a CSV file
+
+Columns: name, email, contact, course (code or name), has_prerequisite (optional)
+
+Example:
+    python manage.py import_students cohort.csv --report cohort-report.csv
+"""
+
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.student_import import ImportFileError, import_students
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import students from a CSV (welcome emails are queued; run send_queued_emails to deliver)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='Path to the CSV file')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per INSERT statement')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without writing anything')
+        parser.add_argument('--no-email', action='store_true', help='Do not queue welcome or summary emails')
+        parser.add_argument('--report', help='Write per-row outcomes to this CSV path')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['csv_path'], 'rb') as csv_file:
+                result = import_students(
+                    csv_file,
+                    chunk_size=options['chunk_size'],
+                    dry_run=options['dry_run'],
+                    notify=not options['no_email'],
+                )
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as report:
+                writer = csv.DictWriter(report, fieldnames=list(result['rows'][0]) if result['rows'] else ['row'])
+                writer.writeheader()
+                writer.writerows(result['rows'])
+
+        for outcome in result['rows']:
+            if outcome['status'] == 'error':
+                self.stderr.write(f"Row {outcome['row']}: {outcome['message']}")
+
+        summary = result['summary']
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Rows: {summary['rows']} | Created: {summary['created']} | "
+            f"Enrolled: {summary['enrolled']} | Skipped: {summary['skipped']} | "
+            f"Errors: {summary['errors']} | Emails queued: {summary['emails_queued']} "
+            f"({time.monotonic() - started:.2f}s)"
+        ))
@@ -0,0 +1,44 @@
+"""
+Print all registrations with their enrolled courses
+
+Rows are streamed with iterator() and enrollments are prefetched per chunk,
+so memory stays flat and the query count is two per chunk.
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import Registration
+
+
+class Command(BaseCommand):
+    help = 'List registrations with their enrolled courses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per query')
+        parser.add_argument('--limit', type=int, default=None, help='Only list the newest N registrations')
+
+    def handle(self, *args, **options):
+        registrations = (
+            Registration.objects.order_by('-created_at')
+            .only('id', 'registration_number', 'name', 'email', 'created_at')
+            .prefetch_related('course_enrollments')
+        )
+        if options['limit']:
+            registrations = registrations[:options['limit']]
+
+        line = '=' * 120
+        self.stdout.write(line)
+        self.stdout.write(f"{'ID':<7} {'Registration ID':<20} {'Name':<20} {'Email':<30} {'Courses':<25} {'Created':<20}")
+        self.stdout.write(line)
+
+        total = 0
+        for reg in registrations.iterator(chunk_size=options['chunk_size']):
+            courses = ', '.join((e.course_name or '')[:20] for e in reg.course_enrollments.all()) or 'None'
+            self.stdout.write(
+                f"{reg.id:<7} {reg.registration_number:<20} {reg.name[:20]:<20} {reg.email[:30]:<30} "
+                f"{courses[:25]:<25} {reg.created_at.strftime('%Y-%m-%d %H:%M'):<20}"
+            )
+            total += 1
+
+        self.stdout.write(line)
+        self.stdout.write(f'Total: {total} students' if total else 'No registrations found')
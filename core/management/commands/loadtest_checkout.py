@@ -0,0 +1,77 @@
+"""
+Load test the checkout funnel at a target concurrency
+
+Simulated students run the whole portal journey concurrently: lookup, select
+course, amount, summary, card entry, OTP create and OTP verify (code read
+from the locmem outbox). The fake gateway stands in for Stripe with
+configurable latency. Runs on a throwaway database; on SQLite that is a WAL
+file with the production profile, so the numbers reflect the real lock behaviour.
+
+Example:
+    python manage.py loadtest_checkout --users 50 --journeys 500
+    python manage.py loadtest_checkout --users 100 --journeys 1000 --ramp-up 10 --gateway-latency-ms 400 --output load.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import benchmark_environment
+from core.loadtest import STEPS, CheckoutLoadTest
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent checkout journeys and report throughput, error rate and latency per step'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Concurrent simulated students')
+        parser.add_argument('--journeys', type=int, default=200, help='Checkout journeys in total')
+        parser.add_argument('--ramp-up', type=float, default=0, help='Seconds over which users start')
+        parser.add_argument('--think-ms', type=int, default=0, help='Pause between steps of a journey')
+        parser.add_argument('--gateway-latency-ms', type=float, default=250, help='Fake gateway latency per call')
+        parser.add_argument('--gateway-jitter-ms', type=float, default=100, help='Random extra gateway latency')
+        parser.add_argument('--output', help='Also write the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['users'] <= 0 or options['journeys'] <= 0:
+            raise CommandError('--users and --journeys must be positive')
+
+        loadtest = CheckoutLoadTest(
+            users=options['users'],
+            journeys=options['journeys'],
+            ramp_up=options['ramp_up'],
+            think_ms=options['think_ms'],
+            log=self.stdout.write,
+        )
+        with benchmark_environment(
+            file_database=True,
+            gateway_latency_ms=options['gateway_latency_ms'],
+            gateway_jitter_ms=options['gateway_jitter_ms'],
+        ):
+            report = loadtest.run()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        line = '=' * 92
+        self.stdout.write(line)
+        self.stdout.write(f"{'Step':<16} {'Requests':>9} {'Errors':>7} {'Error %':>8} {'Req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        self.stdout.write(line)
+        for step in STEPS:
+            result = report['steps'][step]
+            self.stdout.write(
+                f"{step:<16} {result['requests']:>9} {result['errors']:>7} {result['error_rate']:>8.1%} "
+                f"{result['throughput']:>8.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f}"
+            )
+        self.stdout.write(line)
+        for step in STEPS:
+            for sample in report['steps'][step]['error_samples']:
+                self.stdout.write(self.style.WARNING(f'{step}: {sample}'))
+
+        summary = (
+            f"Users: {report['users']} | Checkouts: {report['completed']}/{report['journeys']} | "
+            f"Error rate: {report['error_rate']:.1%} | {report['checkouts_per_second']:.1f} checkouts/s | "
+            f"{report['seconds']:.1f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(summary) if not report['failed'] else self.style.WARNING(summary))
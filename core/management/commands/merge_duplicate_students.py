@@ -0,0 +1,167 @@
+"""
+Merge registrations whose emails differ only by case into the oldest one
+
+Unlike the old cleanup, nothing is lost: enrollments and payments of the
+duplicates are moved onto the surviving registration with set-based UPDATEs,
+and only the emptied duplicates are deleted. Each batch of groups is merged
+in its own transaction, so the command can be stopped and re-run at any time.
+
+Example:
+    python manage.py merge_duplicate_students --dry-run
+    python manage.py merge_duplicate_students --batch-size 200 --noinput
+"""
+
+import time
+from typing import Dict, List, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, CharField, Count, IntegerField, Min, Value, When
+from django.db.models.functions import Lower, Trim
+
+from core.models import Payment, Registration, StudentCourseEnrollment
+
+
+def duplicate_groups(limit: int = None):
+    """
+    One GROUP BY LOWER(email) query: (email_lower, survivor_id, count) for every duplicated email
+
+    The survivor is the oldest registration, MIN(id).
+    """
+    groups = (
+        Registration.objects
+        .annotate(email_lower=Lower(Trim('email')))
+        .values('email_lower')
+        .annotate(survivor_id=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('survivor_id')
+        .values_list('email_lower', 'survivor_id', 'count')
+    )
+    return list(groups[:limit] if limit else groups)
+
+
+def _case(field: str, mapping: Dict, output_field):
+    return Case(
+        *[When(**{field: old}, then=Value(new)) for old, new in mapping.items()],
+        output_field=output_field,
+    )
+
+
+def merge_groups(groups: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """
+    Merge one batch of duplicate groups; call inside a transaction
+
+    Returns:
+        dict: Counts of removed registrations, moved enrollments, merged
+        (conflicting) enrollments and moved payments
+    """
+    survivors = {email_lower: survivor_id for email_lower, survivor_id, _ in groups}
+    members = list(
+        Registration.objects
+        .annotate(email_lower=Lower(Trim('email')))
+        .filter(email_lower__in=list(survivors))
+        .values_list('id', 'email_lower', 'registration_number')
+    )
+    survivor_of = {reg_id: survivors[email_lower] for reg_id, email_lower, _ in members}
+    losers = {reg_id: survivor_id for reg_id, survivor_id in survivor_of.items() if reg_id != survivor_id}
+    numbers = {reg_id: number for reg_id, _, number in members}
+    if not losers:
+        return {'registrations': 0, 'enrollments_moved': 0, 'enrollments_merged': 0, 'payments_moved': 0}
+
+    # Within a group, one enrollment per course survives: the survivor's own,
+    # otherwise the oldest. Others are folded into it (unique registration+course).
+    kept_enrollment = {}
+    duplicate_enrollments = {}
+    enrollments = (
+        StudentCourseEnrollment.objects
+        .filter(registration_id__in=list(survivor_of))
+        .values_list('id', 'registration_id', 'course_id', 'course_name')
+    )
+    survivor_ids = set(survivors.values())
+    for enrollment_id, registration_id, course_id, course_name in sorted(
+        enrollments, key=lambda row: (row[1] not in survivor_ids, row[0])
+    ):
+        key = (survivor_of[registration_id], course_id if course_id is not None else course_name)
+        if key in kept_enrollment:
+            duplicate_enrollments[enrollment_id] = kept_enrollment[key]
+        else:
+            kept_enrollment[key] = enrollment_id
+
+    if duplicate_enrollments:
+        Payment.objects.filter(enrollment_id__in=list(duplicate_enrollments)).update(
+            enrollment_id=_case('enrollment_id', duplicate_enrollments, IntegerField())
+        )
+        StudentCourseEnrollment.objects.filter(id__in=list(duplicate_enrollments)).delete()
+
+    enrollments_moved = StudentCourseEnrollment.objects.filter(registration_id__in=list(losers)).update(
+        registration_id=_case('registration_id', losers, IntegerField())
+    )
+
+    # Payment.student_id holds either the registration number or the registration pk
+    student_ids = {}
+    for loser_id, survivor_id in losers.items():
+        student_ids[str(loser_id)] = str(survivor_id)
+        if numbers[loser_id]:
+            student_ids[numbers[loser_id]] = numbers[survivor_id]
+    payments_moved = Payment.objects.filter(registration_id__in=list(losers)).update(
+        registration_id=_case('registration_id', losers, IntegerField()),
+        student_id=Case(
+            *[When(student_id=old, then=Value(new)) for old, new in student_ids.items()],
+            default='student_id',
+            output_field=CharField(),
+        ),
+    )
+
+    Registration.objects.filter(id__in=list(losers)).delete()
+    return {
+        'registrations': len(losers),
+        'enrollments_moved': enrollments_moved,
+        'enrollments_merged': len(duplicate_enrollments),
+        'payments_moved': payments_moved,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Merge registrations with the same email (case-insensitive) into the oldest, keeping enrollments and payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Duplicate groups merged per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicate groups without changing anything')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive', help='Do not prompt for confirmation')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['dry_run']:
+            groups = duplicate_groups()
+            for email_lower, survivor_id, count in groups[:20]:
+                self.stdout.write(f'  {email_lower}: {count} registrations, keeping id {survivor_id}')
+            if len(groups) > 20:
+                self.stdout.write(f'  ... and {len(groups) - 20} more')
+            self.stdout.write(self.style.SUCCESS(
+                f'[dry-run] Groups: {len(groups)} | Registrations to merge: {sum(g[2] - 1 for g in groups)}'
+            ))
+            return
+
+        if options['interactive']:
+            self.stdout.write('This will merge duplicate students into the oldest registration with the same email.')
+            if input('Continue? (yes/no): ').strip().lower() not in ('yes', 'y'):
+                raise CommandError('Cancelled. No changes made.')
+
+        totals = {'groups': 0, 'registrations': 0, 'enrollments_moved': 0, 'enrollments_merged': 0, 'payments_moved': 0}
+        while True:
+            with transaction.atomic():
+                # Merged groups disappear from the query, so each pass takes the next batch
+                groups = duplicate_groups(limit=options['batch_size'])
+                if not groups:
+                    break
+                result = merge_groups(groups)
+            totals['groups'] += len(groups)
+            for key, value in result.items():
+                totals[key] += value
+            self.stdout.write(f"Merged {totals['groups']} group(s) so far ({time.monotonic() - started:.1f}s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Groups: {totals['groups']} | Registrations removed: {totals['registrations']} | "
+            f"Enrollments moved: {totals['enrollments_moved']} | Enrollments merged: {totals['enrollments_merged']} | "
+            f"Payments moved: {totals['payments_moved']} | {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,168 @@
+"""
+Reconcile pending payments against their Stripe PaymentIntents
+
+Payments that reach 'pending' but never finish OTP verification (closed tab,
+abandoned 3DS) would otherwise stay pending forever. This command checks each
+one with the payment gateway and settles the ones Stripe has already resolved.
+
+Cron example (every 15 minutes):
+    */15 * * * * cd /srv/oncoone && python manage.py reconcile_payments >> logs/reconcile.log 2>&1
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Payment
+from core.payment_gateway import get_payment_gateway
+
+logger = logging.getLogger('core.payment')
+
+
+def _charge_id(payment_intent):
+    """Extract the charge id from a PaymentIntent whose latest_charge may be expanded"""
+    latest_charge = getattr(payment_intent, 'latest_charge', None)
+    if latest_charge is None:
+        return None
+    return getattr(latest_charge, 'id', latest_charge)
+
+
+def resolve_status(result):
+    """
+    Map a gateway retrieve result to (new_status, charge_id)
+
+    Returns (None, None) when the intent is still in progress and the
+    payment should stay pending.
+    """
+    if not result.get('success'):
+        return None, None
+
+    intent_status = result.get('status')
+    payment_intent = result.get('payment_intent')
+    if intent_status == 'succeeded':
+        return 'completed', _charge_id(payment_intent)
+    if intent_status == 'canceled':
+        return 'cancelled', None
+    if intent_status == 'requires_payment_method' and getattr(payment_intent, 'last_payment_error', None):
+        return 'failed', None
+    return None, None
+
+
+class Command(BaseCommand):
+    help = 'Reconcile pending payments older than PAYMENT_TIMEOUT_MINUTES against Stripe'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Payments fetched per batch')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent gateway requests')
+        parser.add_argument(
+            '--older-than-minutes', type=int, default=None,
+            help='Only consider payments older than this (default: PAYMENT_TIMEOUT_MINUTES)'
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many payments')
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without saving them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        minutes = options['older_than_minutes']
+        if minutes is None:
+            minutes = settings.PAYMENT_TIMEOUT_MINUTES
+        limit = options['limit']
+        dry_run = options['dry_run']
+
+        cutoff = timezone.now() - timedelta(minutes=minutes)
+        pending = (
+            Payment.objects
+            .filter(status='pending', created_at__lt=cutoff, stripe_payment_intent_id__isnull=False)
+            .exclude(stripe_payment_intent_id='')
+            .order_by('id')
+        )
+
+        gateway = get_payment_gateway()
+        totals = {'checked': 0, 'completed': 0, 'cancelled': 0, 'failed': 0, 'unchanged': 0, 'errors': 0}
+        started = time.monotonic()
+        last_id = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while limit is None or totals['checked'] < limit:
+                size = batch_size if limit is None else min(batch_size, limit - totals['checked'])
+                batch = list(
+                    pending.filter(id__gt=last_id).values_list('id', 'stripe_payment_intent_id')[:size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+
+                # Only the gateway calls run in the pool; all ORM work stays on this thread
+                results = pool.map(get_intent_result(gateway), [intent_id for _, intent_id in batch])
+                resolved = {}
+                for (payment_id, _), result in zip(batch, results):
+                    if not result.get('success'):
+                        totals['errors'] += 1
+                        continue
+                    new_status, charge_id = resolve_status(result)
+                    if new_status is None:
+                        totals['unchanged'] += 1
+                    else:
+                        resolved[payment_id] = (new_status, charge_id)
+
+                totals['checked'] += len(batch)
+                if resolved and not dry_run:
+                    self._apply(resolved, totals)
+                else:
+                    for new_status, _ in resolved.values():
+                        totals[new_status] += 1
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"checked={totals['checked']} completed={totals['completed']} "
+                    f"cancelled={totals['cancelled']} failed={totals['failed']} "
+                    f"unchanged={totals['unchanged']} errors={totals['errors']} "
+                    f"rate={totals['checked'] / elapsed if elapsed else 0:.1f}/s"
+                )
+
+        summary = ', '.join(f'{key}={value}' for key, value in totals.items())
+        prefix = '[dry-run] ' if dry_run else ''
+        logger.info(f'{prefix}Payment reconciliation finished: {summary}')
+        self.stdout.write(self.style.SUCCESS(f'{prefix}Reconciliation complete: {summary}'))
+
+    def _apply(self, resolved, totals):
+        """Write one batch of resolved payments in a single transaction"""
+        now = timezone.now()
+        with transaction.atomic():
+            # Re-check status under lock so a concurrent OTP verification wins
+            payments = list(
+                Payment.objects.select_for_update().filter(id__in=resolved.keys(), status='pending')
+            )
+            for payment in payments:
+                new_status, charge_id = resolved[payment.id]
+                payment.status = new_status
+                payment.updated_at = now
+                if new_status == 'completed':
+                    payment.completed_at = now
+                    if charge_id:
+                        payment.stripe_charge_id = charge_id
+                    payment.generate_invoice_number()
+                totals[new_status] += 1
+
+            Payment.objects.bulk_update(
+                payments,
+                ['status', 'stripe_charge_id', 'completed_at', 'invoice_number', 'updated_at'],
+            )
+        totals['unchanged'] += len(resolved) - len(payments)
+
+
+def get_intent_result(gateway):
+    """Build the pool worker that retrieves one PaymentIntent"""
+    def fetch(payment_intent_id):
+        try:
+            return gateway.retrieve_payment_intent(payment_intent_id)
+        except Exception as e:
+            logger.error(f'Reconciliation lookup failed for {payment_intent_id}: {e}')
+            return {'success': False, 'error': str(e)}
+    return fetch
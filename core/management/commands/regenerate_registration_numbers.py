@@ -0,0 +1,32 @@
+"""
+Give every registration a new number from the registration number allocator
+
+Example:
+    python manage.py regenerate_registration_numbers --batch-size 2000
+"""
+
+from django.core.management.base import CommandError
+
+from core.batch import BatchCommand
+from core.models import Registration
+from core.student_import import generate_registration_numbers
+
+
+class Command(BatchCommand):
+    help = 'Regenerate ALL registration numbers (ON{YY}-XXXXXX), in resumable batches'
+    confirm_message = 'This will regenerate ALL registration numbers. Students will need their new numbers.'
+
+    def handle(self, *args, **options):
+        if not self.confirm(options):
+            raise CommandError('Cancelled. No changes made.')
+
+        def regenerate(batch):
+            if options['dry_run']:
+                return batch
+            # New numbers are checked against the table, so no row is cleared first
+            for registration, number in zip(batch, generate_registration_numbers(len(batch))):
+                registration.registration_number = number
+            return batch
+
+        runner = self.runner('regenerate_registration_numbers', Registration.objects.only('id', 'registration_number'), options)
+        self.report(runner.run(regenerate, update_fields=['registration_number']), options)
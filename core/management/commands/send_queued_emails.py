@@ -0,0 +1,22 @@
+"""
+Deliver emails queued in the outbox (QueuedEmail)
+
+Cron example (every minute):
+    * * * * * cd /srv/oncoone && python manage.py send_queued_emails >> logs/outbox.log 2>&1
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send pending queued emails over one connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages sent per connection')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many messages')
+
+    def handle(self, *args, **options):
+        result = send_queued_emails(batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f"Sent: {result['sent']} | Failed: {result['failed']}"))
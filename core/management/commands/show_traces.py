@@ -0,0 +1,126 @@
+"""
+Inspect exported traces offline (the TRACING_FILE written by core/tracing.py)
+
+Lists the slowest traces with the payment and enrollment they touched, or
+prints one trace as a span tree with offsets and durations.
+
+Example:
+    python manage.py show_traces
+    python manage.py show_traces --payment 1234 --min-ms 500
+    python manage.py show_traces --trace 4bf92f3577b34da6a3ce929d0e0e4736
+    python manage.py show_traces --file /tmp/traces.jsonl --limit 50
+"""
+
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _attributes(span):
+    """OTLP attribute list -> dict"""
+    values = {}
+    for attribute in span.get('attributes', []):
+        value = attribute['value']
+        values[attribute['key']] = next(iter(value.values()), None)
+    return values
+
+
+def _duration_ms(span):
+    return (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+
+
+class Command(BaseCommand):
+    help = 'List the slowest exported traces, or print one as a span tree'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Trace file (default: TRACING_FILE)')
+        parser.add_argument('--trace', help='Print this trace id as a span tree')
+        parser.add_argument('--payment', help='Only traces tagged with this payment id')
+        parser.add_argument('--enrollment', help='Only traces tagged with this enrollment id')
+        parser.add_argument('--min-ms', type=float, default=0, help='Only traces at least this long')
+        parser.add_argument('--limit', type=int, default=20, help='Traces to list')
+
+    def handle(self, *args, **options):
+        path = options['file'] or getattr(settings, 'TRACING_FILE', '')
+        traces = defaultdict(list)
+        try:
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    for resource in json.loads(line).get('resourceSpans', []):
+                        for scope in resource.get('scopeSpans', []):
+                            for span in scope.get('spans', []):
+                                traces[span['traceId']].append(span)
+        except FileNotFoundError:
+            raise CommandError(f'No trace file at {path} (is TRACING_EXPORTER=file set?)')
+        except ValueError as e:
+            raise CommandError(f'{path} is not OTLP/JSON lines: {e}')
+
+        if options['trace']:
+            spans = traces.get(options['trace'])
+            if not spans:
+                raise CommandError(f"Trace {options['trace']} not found in {path}")
+            self.print_tree(spans)
+            return
+
+        rows = []
+        for trace_id, spans in traces.items():
+            span_ids = {span['spanId'] for span in spans}
+            root = next((span for span in spans if span.get('parentSpanId') not in span_ids), spans[0])
+            attributes = _attributes(root)
+            if options['payment'] and str(attributes.get('payment.id')) != options['payment']:
+                continue
+            if options['enrollment'] and str(attributes.get('enrollment.id')) != options['enrollment']:
+                continue
+            duration = _duration_ms(root)
+            if duration < options['min_ms']:
+                continue
+            rows.append((duration, trace_id, root, attributes, len(spans)))
+        rows.sort(key=lambda row: row[0], reverse=True)
+
+        line = '=' * 118
+        self.stdout.write(line)
+        self.stdout.write(f"{'Trace':<34} {'Root span':<42} {'ms':>9} {'Spans':>6} {'Payment':>9} {'Enrollment':>11} {'Error':>5}")
+        self.stdout.write(line)
+        for duration, trace_id, root, attributes, span_count in rows[:options['limit']]:
+            error = 'yes' if any(span['status'].get('code') == 'STATUS_CODE_ERROR' for span in traces[trace_id]) else ''
+            self.stdout.write(
+                f"{trace_id:<34} {root['name'][:42]:<42} {duration:>9.1f} {span_count:>6} "
+                f"{str(attributes.get('payment.id', '')):>9} {str(attributes.get('enrollment.id', '')):>11} {error:>5}"
+            )
+        self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} matching traces of {len(traces)} in {path}'))
+
+    def print_tree(self, spans):
+        children = defaultdict(list)
+        span_ids = {span['spanId'] for span in spans}
+        roots = []
+        for span in sorted(spans, key=lambda span: int(span['startTimeUnixNano'])):
+            if span.get('parentSpanId') in span_ids:
+                children[span['parentSpanId']].append(span)
+            else:
+                roots.append(span)
+        trace_start = min(int(span['startTimeUnixNano']) for span in spans)
+
+        def show(span, depth):
+            attributes = _attributes(span)
+            offset = (int(span['startTimeUnixNano']) - trace_start) / 1e6
+            detail = attributes.get('db.statement', '')
+            status = span['status'].get('message', '') if span['status'].get('code') == 'STATUS_CODE_ERROR' else ''
+            text = f"{offset:>9.1f} {_duration_ms(span):>9.1f}  {'  ' * depth}{span['name']}"
+            if detail:
+                text += f'  {detail[:100]}'
+            self.stdout.write(self.style.ERROR(f'{text}  [{status}]') if status else text)
+            for child in children[span['spanId']]:
+                show(child, depth + 1)
+
+        self.stdout.write(f"{'Start ms':>9} {'Dur ms':>9}  Span")
+        for root in roots:
+            show(root, 0)
+        attributes = _attributes(roots[0]) if roots else {}
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(spans)} spans | payment {attributes.get('payment.id', '-')} | enrollment {attributes.get('enrollment.id', '-')}"
+        ))
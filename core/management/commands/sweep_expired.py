@@ -0,0 +1,32 @@
+"""
+Delete expired OTP codes and cancel abandoned pending payments
+
+Cron example (hourly):
+    0 * * * * cd /srv/oncoone && python manage.py sweep_expired >> logs/sweeper.log 2>&1
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.sweeper import sweep
+
+
+class Command(BaseCommand):
+    help = 'Delete expired unverified OTPs and cancel pending payments older than PAYMENT_TIMEOUT_MINUTES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent gateway cancellations')
+        parser.add_argument('--dry-run', action='store_true', help='Count rows without changing anything')
+
+    def handle(self, *args, **options):
+        result = sweep(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+        )
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}OTPs deleted: {result['otps_deleted']} | "
+            f"Payments cancelled: {result['payments_cancelled']} | "
+            f"Left for reconciliation: {result['intents_not_cancelled']}"
+        ))
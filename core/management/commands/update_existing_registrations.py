@@ -0,0 +1,60 @@
+"""
+Fill in missing registration numbers and passwords on existing registrations
+
+Run this on the server after migrating (it needs the BatchCheckpoint and
+NumberSequence tables):
+    python manage.py migrate
+    python manage.py update_existing_registrations --numbers-only --noinput
+"""
+
+from django.core.management.base import CommandError
+from django.db.models import Q
+
+from core.batch import BatchCommand
+from core.models import Registration
+from core.student_import import generate_passwords, generate_registration_numbers
+
+# Placeholder number written by early versions of the registration form
+PLACEHOLDER_NUMBERS = ('', 'ON26-0000')
+
+
+class Command(BatchCommand):
+    help = 'Generate registration numbers and passwords for registrations missing them, in resumable batches'
+    confirm_message = (
+        'This will:\n'
+        '  1. Generate registration numbers for students without them\n'
+        '  2. Generate unique passwords for students without them'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--numbers-only', action='store_true', help='Only fill in registration numbers')
+
+    def handle(self, *args, **options):
+        if not self.confirm(options):
+            raise CommandError('Cancelled. No changes made.')
+
+        missing_number = Q(registration_number__in=PLACEHOLDER_NUMBERS) | Q(registration_number__isnull=True)
+        missing_password = Q(student_password='') | Q(student_password__isnull=True)
+        if options['numbers_only']:
+            queryset = Registration.objects.filter(missing_number)
+            fields = ['registration_number']
+        else:
+            queryset = Registration.objects.filter(missing_number | missing_password)
+            fields = ['registration_number', 'student_password']
+
+        def fill(batch):
+            if options['dry_run']:
+                return batch
+            need_number = [r for r in batch if not r.registration_number or r.registration_number in PLACEHOLDER_NUMBERS]
+            for registration, number in zip(need_number, generate_registration_numbers(len(need_number))):
+                registration.registration_number = number
+            if 'student_password' in fields:
+                need_password = [r for r in batch if not r.student_password]
+                for registration, password in zip(need_password, generate_passwords(len(need_password))):
+                    registration.student_password = password
+            return batch
+
+        job = 'update_existing_registrations' + (':numbers' if options['numbers_only'] else '')
+        runner = self.runner(job, queryset.only('id', *fields), options)
+        self.report(runner.run(fill, update_fields=fields), options)
@@ -0,0 +1,220 @@
+"""
+Prometheus Metrics for OncoOne Education
+Counters and histograms in the Prometheus text format, served at /metrics
+Version: 1.0
+
+Each process keeps its own registry and, when METRICS_DIR is set, writes it to
+METRICS_DIR/metrics-<pid>.json (at most every METRICS_FLUSH_SECONDS, and at
+exit). A scrape merges every file, so the numbers cover all gunicorn workers
+whichever one answers, including workers that have since been recycled.
+gunicorn.conf.py sets METRICS_DIR and empties it when the server starts.
+
+Everything exported is a counter or histogram (safe to sum across processes),
+except the email queue depth, which is read from the database at scrape time.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger('core.performance')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'oncoone_http_request_duration_seconds': (
+        'histogram', 'Request latency by view name, method and status code', LATENCY_BUCKETS),
+    'oncoone_db_queries_total': ('counter', 'Database queries run while handling requests, by view', None),
+    'oncoone_db_query_seconds_total': ('counter', 'Time spent in database queries during requests, by view', None),
+    'oncoone_db_statement_timeouts_total': ('counter', 'Queries cancelled by the per-request statement timeout, by view', None),
+    'oncoone_db_query_budget_exceeded_total': ('counter', 'Requests that ran more queries than their budget, by view', None),
+    'oncoone_db_connections_total': ('counter', 'New database connections (or pool checkouts), by alias', None),
+    'oncoone_db_connect_duration_seconds': ('histogram', 'Time to open a database connection', LATENCY_BUCKETS),
+    'oncoone_stripe_call_duration_seconds': ('histogram', 'Payment gateway call latency, by method', LATENCY_BUCKETS),
+    'oncoone_stripe_errors_total': ('counter', 'Failed payment gateway calls, by method and error_type', None),
+    'oncoone_otp_verifications_total': ('counter', 'Payment OTP verification attempts, by outcome', None),
+    'oncoone_email_send_duration_seconds': ('histogram', 'Time to send one email', LATENCY_BUCKETS),
+    'oncoone_invoice_render_duration_seconds': ('histogram', 'Time to render an invoice PDF', LATENCY_BUCKETS),
+    'oncoone_template_render_duration_seconds': ('histogram', 'Time to render a template', LATENCY_BUCKETS),
+    'oncoone_email_queue_depth': ('gauge', 'Queued emails by status (read from the database at scrape time)', None),
+}
+
+# core.timing categories recorded as histograms
+TIMED_HISTOGRAMS = {
+    'email': 'oncoone_email_send_duration_seconds',
+    'pdf': 'oncoone_invoice_render_duration_seconds',
+    'render': 'oncoone_template_render_duration_seconds',
+}
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def enabled() -> bool:
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class Registry:
+    """This process's counters and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters: Dict[Tuple[str, LabelSet], float] = defaultdict(float)
+        # name, labels -> [bucket counts..., sum, count]
+        self.histograms: Dict[Tuple[str, LabelSet], list] = {}
+        self.last_flush = time.monotonic()
+
+    def _check_fork(self):
+        # A forked worker must not report (or overwrite the file of) its parent's numbers
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name: str, labels: dict, amount: float = 1.0) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self.counters[key] += amount
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def dump(self) -> dict:
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': [[name, list(map(list, labels)), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(map(list, labels)), list(series)] for (name, labels), series in self.histograms.items()],
+            }
+
+    def flush(self, force: bool = False) -> None:
+        """Write this process's numbers to METRICS_DIR (no-op without one)"""
+        directory = getattr(settings, 'METRICS_DIR', '')
+        if not directory:
+            return
+        if not force and time.monotonic() - self.last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+            return
+        self.last_flush = time.monotonic()
+        data = self.dump()
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)  # Readers never see a half-written file
+        except OSError as e:
+            logger.warning(f'Could not write metrics to {path}: {e}')
+
+
+REGISTRY = Registry()
+atexit.register(lambda: REGISTRY.flush(force=True))
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    if enabled():
+        REGISTRY.inc(name, labels, amount)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    if enabled():
+        REGISTRY.observe(name, labels, value)
+
+
+def maybe_flush() -> None:
+    """Called after each request; writes the process file every METRICS_FLUSH_SECONDS"""
+    if enabled():
+        REGISTRY.flush()
+
+
+def collect() -> dict:
+    """Counters and histograms summed over every process that wrote to METRICS_DIR (or just this one)"""
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if directory:
+        REGISTRY.flush(force=True)
+        dumps = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    dumps.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Being replaced right now; its numbers are in the next scrape
+    else:
+        dumps = [REGISTRY.dump()]
+
+    counters = defaultdict(float)
+    histograms = {}
+    for dump in dumps:
+        for name, labels, value in dump['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, series in dump['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], series)]
+            else:
+                histograms[key] = list(series)
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_text(gauges: Dict[str, Dict[LabelSet, float]] = None) -> str:
+    """The Prometheus text exposition (format 0.0.4) of collect() plus the given gauges"""
+    collected = collect()
+    gauges = gauges or {}
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (series_name, labels), value in sorted(collected['counters'].items()):
+                if series_name == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        elif kind == 'histogram':
+            for (series_name, labels), series in sorted(collected['histograms'].items()):
+                if series_name != name:
+                    continue
+                for bound, count in zip(buckets, series):
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {_number(count)}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {_number(series[-1])}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(series[-2])}')
+                lines.append(f'{name}_count{_labels(labels)} {_number(series[-1])}')
+        else:
+            for labels, value in sorted(gauges.get(name, {}).items()):
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
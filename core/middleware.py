@@ -0,0 +1,225 @@
+"""
+Middleware for OncoOne Education
+Version: 1.0
+"""
+
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from . import db_limits, metrics, profiling, query_log, timing, tracing
+from .db_router import begin_request, end_request, replica_configured, request_wrote
+
+logger = logging.getLogger('core.performance')
+
+PIN_COOKIE = 'db_primary_pin'
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes across requests when a read replica is configured
+
+    A request that wrote sets a short-lived cookie; while it is present the
+    browser's following requests read from the primary, covering replica lag
+    (REPLICA_PIN_SECONDS). Does nothing when no replica is configured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        tokens = begin_request(pinned=PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if request_wrote():
+                response.set_cookie(
+                    PIN_COOKIE,
+                    '1',
+                    max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                    httponly=True,
+                    samesite='Lax',
+                    secure=request.is_secure(),
+                )
+            return response
+        finally:
+            end_request(tokens)
+
+
+class RequestTimingMiddleware:
+    """
+    Per-request breakdown of where the time went (see core/timing.py)
+
+    Logs one line per request at or above REQUEST_TIMING_LOG_MS and, for
+    staff users, adds a Server-Timing header the browser devtools display.
+    Also feeds the request latency and per-view query metrics (core/metrics.py)
+    and is the root span of sampled traces (core/tracing.py); with
+    QUERY_LOG_ENABLED it also runs the slow-query/N+1 log (core/query_log.py).
+    A plain pass-through when all of these are off.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing_enabled = getattr(settings, 'REQUEST_TIMING_ENABLED', True)
+        metrics_enabled = metrics.enabled()
+        query_log_enabled = query_log.enabled()
+        if not (timing_enabled or metrics_enabled or tracing.enabled() or query_log_enabled):
+            return self.get_response(request)
+
+        token = timing.start_request()
+        query_token = query_log.start_request() if query_log_enabled else None
+        try:
+            with tracing.start_trace(
+                f'{request.method} {request.path}',
+                traceparent=request.META.get('HTTP_TRACEPARENT'),
+                **{'http.request.method': request.method, 'url.path': request.path},
+            ) as root, ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.db_execute_wrapper))
+                    if root is not None:
+                        stack.enter_context(connection.execute_wrapper(tracing.db_execute_wrapper))
+                    if query_token is not None:
+                        stack.enter_context(connection.execute_wrapper(query_log.execute_wrapper))
+                response = self.get_response(request)
+                if root is not None:
+                    self.finish_span(root, request, response)
+
+            timings = timing.current()
+            total_ms = timings.total_ms()
+            if metrics_enabled:
+                self.record_metrics(request, response, timings, total_ms)
+            if timing_enabled:
+                if total_ms >= getattr(settings, 'REQUEST_TIMING_LOG_MS', 0):
+                    trace = f' trace={root.trace.trace_id}' if root is not None else ''
+                    logger.info(
+                        f'{request.method} {request.path} {response.status_code} {total_ms:.0f}ms | {timings.summary()}{trace}'
+                    )
+                user = getattr(request, 'user', None)
+                if user is not None and user.is_staff:
+                    response['Server-Timing'] = timings.server_timing()
+            return response
+        finally:
+            if query_token is not None:
+                query_log.end_request(query_token)
+            timing.end_request(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        query_log.set_view(self.view_name(request))
+
+    @staticmethod
+    def view_name(request) -> str:
+        # The URL name, not the path, so ids in the path don't create a series per student
+        match = getattr(request, 'resolver_match', None)
+        return (match.url_name or match.view_name) if match is not None else 'unmatched'
+
+    def finish_span(self, root, request, response):
+        route = self.view_name(request)
+        root.name = f'{request.method} {route}'
+        root.set_attribute('http.route', route)
+        root.set_attribute('http.response.status_code', response.status_code)
+        if response.status_code >= 500:
+            root.set_error(f'HTTP {response.status_code}')
+
+    def record_metrics(self, request, response, timings, total_ms):
+        view = self.view_name(request)
+        metrics.observe(
+            'oncoone_http_request_duration_seconds', total_ms / 1000,
+            view=view, method=request.method, status=str(response.status_code),
+        )
+        if timings.counts['db']:
+            metrics.inc('oncoone_db_queries_total', timings.counts['db'], view=view)
+            metrics.inc('oncoone_db_query_seconds_total', timings.ms['db'] / 1000, view=view)
+        metrics.maybe_flush()
+
+
+class DatabaseLimitsMiddleware:
+    """
+    Statement timeout and query budget per request (see core/db_limits.py)
+
+    A statement cancelled by the timeout turns into a 503 with Retry-After,
+    whether the view let the error propagate or caught it and returned its
+    own 500. Disabled entirely with DB_LIMITS_ENABLED=False.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not db_limits.enabled():
+            return self.get_response(request)
+
+        token = db_limits.start_request(request.path)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(db_limits.execute_wrapper))
+                response = self.get_response(request)
+            # Most views catch Exception and answer 500 themselves
+            if response.status_code >= 500 and db_limits.current().timed_out:
+                return self.timeout_response()
+            return response
+        finally:
+            db_limits.end_request(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        db_limits.set_view(RequestTimingMiddleware.view_name(request), view_func)
+
+    def process_exception(self, request, exception):
+        limits = db_limits.current()
+        if limits is None or not limits.timed_out:
+            return None
+        return self.timeout_response()
+
+    @staticmethod
+    def timeout_response():
+        response = JsonResponse({
+            'status': 'error',
+            'error': 'This request took too long and was cancelled. Please try again.',
+            'error_type': 'statement_timeout',
+        }, status=503)
+        response['Retry-After'] = '30'
+        return response
+
+
+class RequestProfilerMiddleware:
+    """
+    Profile one request on demand (see core/profiling.py)
+
+    Staff only: `?_profile=sample|cprofile` or `X-Profile: sample|cprofile`.
+    The artifacts are saved under PROFILER_DIR and the response names them in
+    X-Profile-Id. Placed after AuthenticationMiddleware so request.user is known.
+    Disabled entirely with PROFILER_ENABLED=False.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profiling.requested_mode(request) if getattr(settings, 'PROFILER_ENABLED', True) else None
+        user = getattr(request, 'user', None)
+        if mode is None or user is None or not user.is_staff:
+            return self.get_response(request)
+
+        if not profiling.try_acquire():
+            response = self.get_response(request)
+            response['X-Profile'] = 'busy'
+            return response
+        try:
+            profile = profiling.RequestProfile(mode)
+            response = profile.run(lambda: self.get_response(request))
+            profile_id = profile.save(f'{request.method}-{RequestTimingMiddleware.view_name(request)}')
+        finally:
+            profiling.release()
+
+        summary = ' '.join(f'{key}={value}' for key, value in profile.summary.items())
+        logger.info(f'Profiled {request.method} {request.path} for {user.get_username()}: {profile_id} | {summary}')
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Summary'] = summary
+        return response
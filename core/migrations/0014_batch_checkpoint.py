@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_queued_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('processed', models.BigIntegerField(default=0)),
+                ('changed', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Batch Checkpoint',
+                'verbose_name_plural': 'Batch Checkpoints',
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:52
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, F
+import django.db.models.functions.text
+from django.db.models.functions import Lower, Trim
+
+BATCH_SIZE = 1000
+
+
+def lowercase_emails(apps, schema_editor):
+    """Lower-case stored emails in batches, refusing to run if that would create duplicates"""
+    Registration = apps.get_model('core', 'Registration')
+    db_alias = schema_editor.connection.alias
+    registrations = Registration.objects.using(db_alias)
+
+    collisions = (
+        registrations.annotate(email_lower=Lower(Trim('email')))
+        .values('email_lower')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+    sample = list(collisions[:5])
+    if sample:
+        raise RuntimeError(
+            f'Registrations share an email that differs only by case ({", ".join(sample)}, ...). '
+            f'Run "python manage.py merge_duplicate_students" first, then migrate again.'
+        )
+
+    to_fix = (
+        registrations.annotate(email_normalized=Lower(Trim('email')))
+        .exclude(email=F('email_normalized'))
+        .order_by('id')
+    )
+    last_id = 0
+    while True:
+        ids = list(to_fix.filter(id__gt=last_id).values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        last_id = ids[-1]
+        with transaction.atomic(using=db_alias):
+            registrations.filter(id__in=ids).update(email=Lower(Trim('email')))
+
+
+class Migration(migrations.Migration):
+
+    # Each backfill batch commits on its own instead of one long transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_batch_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='registration',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='core_registration_email_lower_uniq'),
+        ),
+    ]
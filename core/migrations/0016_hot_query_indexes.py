@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_normalize_registration_emails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['enrollment', 'status'], name='core_pay_enr_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['registration', 'course_name', 'status'], name='core_pay_reg_course_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'created_at'], name='core_pay_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['enrollment', 'payment_amount_cad'], name='core_pay_completed_enr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentcourseenrollment',
+            index=models.Index(fields=['registration', 'course_name'], name='core_enr_reg_course_name_idx'),
+        ),
+    ]
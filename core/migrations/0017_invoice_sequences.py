@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def create_invoice_sequences(apps, schema_editor):
+    """Postgres: create this year's and next year's invoice sequences, so requests never run DDL"""
+    from core.numbering import create_sequence, invoice_sequence_name
+
+    year = timezone.now().year
+    for invoice_year in (year, year + 1):
+        create_sequence(invoice_sequence_name(invoice_year), using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_invoice_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:37
+
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def store_keys(apps, schema_editor):
+    """
+    Give every counter its own key. Counters already in use keep the key they
+    were permuted with until now (derived from REGISTRATION_NUMBER_KEY, or
+    SECRET_KEY), so the rest of their year cannot collide with issued numbers.
+    """
+    NumberSequence = apps.get_model('core', 'NumberSequence')
+    secret = getattr(settings, 'REGISTRATION_NUMBER_KEY', '') or settings.SECRET_KEY
+    for sequence in NumberSequence.objects.using(schema_editor.connection.alias).filter(key=''):
+        if sequence.name.startswith('registration_number:'):
+            year_suffix = sequence.name.split(':', 1)[1]
+            sequence.key = hashlib.sha256(f'registration-number:{year_suffix}:{secret}'.encode()).hexdigest()
+        else:
+            sequence.key = secrets.token_hex(32)
+        sequence.save(update_fields=['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_invoice_sequences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='numbersequence',
+            name='key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(store_keys, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import Lower
 from django.utils import timezone
 from decimal import Decimal
 import uuid
@@ -6,6 +7,43 @@ import random
 import string
 
 
+# Attempts to step past registration numbers issued before the allocator existed
+LEGACY_COLLISION_RETRIES = 5
+
+
+class NumberSequence(models.Model):
+	"""Named counters backing registration and invoice numbers (one row per sequence and year)"""
+	
+	name = models.CharField(max_length=100, unique=True)  # e.g., "registration_number:26", "invoice:2026"
+	value = models.BigIntegerField(default=0)  # Number of values handed out so far
+	key = models.CharField(max_length=64, blank=True, default='')  # Hex secret keying the registration number permutation; never changes
+	
+	class Meta:
+		verbose_name = 'Number Sequence'
+		verbose_name_plural = 'Number Sequences'
+
+	def __str__(self):
+		return f"{self.name} = {self.value}"
+
+
+
+class BatchCheckpoint(models.Model):
+	"""Resume point of a batched maintenance command (see core.batch)"""
+	
+	job = models.CharField(max_length=100, unique=True)  # e.g., "regenerate_registration_numbers"
+	last_id = models.BigIntegerField(default=0)  # Highest primary key already processed
+	processed = models.BigIntegerField(default=0)  # Rows processed so far in this run
+	changed = models.BigIntegerField(default=0)  # Rows written so far in this run
+	started_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	class Meta:
+		verbose_name = 'Batch Checkpoint'
+		verbose_name_plural = 'Batch Checkpoints'
+
+	def __str__(self):
+		return f"{self.job} @ {self.last_id}"
+
 class Course(models.Model):
 	"""Master course catalog - all available courses"""
 	
@@ -33,7 +71,7 @@ class Registration(models.Model):
 	"""Student registration model - single student can register for multiple courses"""
 	
 	name = models.CharField(max_length=255)
-	email = models.EmailField(unique=True, db_index=True)  # Prevent duplicate emails
+	email = models.EmailField(unique=True, db_index=True)  # Stored lower-case (see normalize_email)
 	contact = models.CharField(max_length=50)
 	registration_number = models.CharField(max_length=20, unique=True, db_index=True, blank=True, default='')  # ON26-0001 format
 	student_password = models.CharField(max_length=10, unique=True, blank=True, default='')  # Unique 10-character password
@@ -46,43 +84,32 @@ class Registration(models.Model):
 		ordering = ['-created_at']
 		verbose_name = 'Student Registration'
 		verbose_name_plural = 'Student Registrations'
+		constraints = [
+			# Backstop for writes that bypass save() (bulk_create, update)
+			models.UniqueConstraint(Lower('email'), name='core_registration_email_lower_uniq'),
+		]
 
 	def __str__(self):
 		return f"{self.registration_number} - {self.name} <{self.email}>"
 	
 	@staticmethod
-	def generate_registration_number():
-		"""Generate unique registration number in format: ON{YY}-{XXXXXX}
-		Example: ON26-698574 for a student in 2026 (random 6-digit number)
-		"""
-		from django.utils import timezone
-		import random
+	def normalize_email(email):
+		"""Canonical form used for every write and lookup: trimmed and lower-cased
 		
-		current_year = timezone.now().year
-		year_suffix = str(current_year)[-2:]  # Last 2 digits (26 for 2026)
-		
-		# Generate unique random 6-digit number
-		max_attempts = 1000
-		for _ in range(max_attempts):
-			# Generate random 6-digit number (100000 to 999999)
-			random_num = random.randint(100000, 999999)
-			registration_number = f"ON{year_suffix}-{random_num}"
-			
-			# Check if this number is already used
-			if not Registration.objects.filter(registration_number=registration_number).exists():
-				return registration_number
-		
-		# If somehow we couldn't generate unique number after max attempts,
-		# fallback to timestamp-based generation
-		timestamp = str(int(timezone.now().timestamp()))[-6:]
-		registration_number = f"ON{year_suffix}-{timestamp}"
-		
-		# Ensure uniqueness
-		while Registration.objects.filter(registration_number=registration_number).exists():
-			random_num = random.randint(100000, 999999)
-			registration_number = f"ON{year_suffix}-{random_num}"
+		Lookups with the normalized value are a plain seek on the email index.
+		"""
+		return (email or '').strip().lower()
+	
+	@staticmethod
+	def generate_registration_number():
+		"""Allocate a unique registration number in format: ON{YY}-{XXXXXX}
+		Example: ON26-698574 for a student in 2026 (non-sequential 6-digit number)
 		
-		return registration_number
+		Numbers come from a per-year counter passed through a keyed permutation
+		(see core.numbering), so no probe queries or retries are needed.
+		"""
+		from .numbering import allocate_registration_numbers
+		return allocate_registration_numbers(1)[0]
 	
 	def generate_unique_password(self):
 		"""Generate a unique 10-character password for the student"""
@@ -105,12 +132,29 @@ class Registration(models.Model):
 	
 	def save(self, *args, **kwargs):
 		"""Auto-generate registration number and password if not set"""
-		if not self.registration_number:
+		self.email = self.normalize_email(self.email)
+		allocated = not self.registration_number
+		if allocated:
 			self.registration_number = self.generate_registration_number()
 		
 		if not self.student_password:
 			self.student_password = self.generate_unique_password()
 		
+		if not allocated:
+			super().save(*args, **kwargs)
+			return
+		
+		# Allocated numbers never repeat, but they can hit a number issued by the
+		# old random generator. Only that (rare) case takes another number.
+		for _ in range(LEGACY_COLLISION_RETRIES):
+			try:
+				with transaction.atomic():
+					super().save(*args, **kwargs)
+				return
+			except IntegrityError:
+				if not Registration.objects.filter(registration_number=self.registration_number).exists():
+					raise
+				self.registration_number = self.generate_registration_number()
 		super().save(*args, **kwargs)
 	
 	def get_enrolled_courses(self):
@@ -153,6 +197,9 @@ class StudentCourseEnrollment(models.Model):
 	class Meta:
 		unique_together = ['registration', 'course']  # Prevent duplicate enrollments for same course
 		ordering = ['-enrolled_at']
+		indexes = [
+			models.Index(fields=['registration', 'course_name'], name='core_enr_reg_course_name_idx'),  # register_view duplicate check
+		]
 		verbose_name = 'Course Enrollment'
 		verbose_name_plural = 'Course Enrollments'
 
@@ -208,17 +255,30 @@ class Payment(models.Model):
 
 	class Meta:
 		ordering = ['-created_at']
+		indexes = [
+			models.Index(fields=['enrollment', 'status'], name='core_pay_enr_status_idx'),  # Balance per enrollment
+			models.Index(fields=['registration', 'course_name', 'status'], name='core_pay_reg_course_status_idx'),  # Admin balances
+			models.Index(fields=['status', 'created_at'], name='core_pay_status_created_idx'),  # Sweeper and reconciliation
+			# Completed payments are what every balance sums; the amount column makes the sum index-only
+			models.Index(
+				fields=['enrollment', 'payment_amount_cad'],
+				condition=models.Q(status='completed'),
+				name='core_pay_completed_enr_idx',
+			),
+		]
 
 	def __str__(self):
 		return f"Payment {self.invoice_number} - {self.student_id} - {self.status}"
 
 	def generate_invoice_number(self):
-		"""Generate a unique invoice number"""
-		from datetime import datetime
+		"""Assign the next invoice number (INV-YYYY-NNNNNN) if not already set
+		
+		Does not need self.id, so callers set it alongside the status change
+		and persist both in a single save.
+		"""
+		from .numbering import allocate_invoice_number
 		if not self.invoice_number:
-			timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-			random_suffix = str(self.id).zfill(5)
-			self.invoice_number = f"INV-{timestamp}-{random_suffix}"
+			self.invoice_number = allocate_invoice_number()
 
 	def calculate_remaining_balance(self):
 		"""Calculate remaining balance for the course"""
@@ -335,3 +395,36 @@ class PaymentOTP(models.Model):
 		else:
 			return False, "Invalid OTP. Maximum attempts reached. Please request a new code"
 
+
+
+class QueuedEmail(models.Model):
+	"""Outbox for emails sent later in batches by the send_queued_emails command"""
+	STATUS_CHOICES = [
+		('pending', 'Pending'),
+		('sending', 'Sending'),
+		('sent', 'Sent'),
+		('failed', 'Failed'),
+	]
+
+	subject = models.CharField(max_length=255)
+	body = models.TextField()
+	from_email = models.CharField(max_length=255, blank=True, default='')  # Empty = DEFAULT_FROM_EMAIL
+	to = models.TextField()  # Comma-separated recipients
+	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+	attempts = models.IntegerField(default=0)
+	last_error = models.TextField(blank=True, default='')
+	claim_token = models.CharField(max_length=32, blank=True, default='')  # Set by the worker sending it
+	claimed_at = models.DateTimeField(blank=True, null=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	sent_at = models.DateTimeField(blank=True, null=True)
+
+	class Meta:
+		ordering = ['id']
+		verbose_name = 'Queued Email'
+		verbose_name_plural = 'Queued Emails'
+		indexes = [
+			models.Index(fields=['status', 'id']),
+		]
+
+	def __str__(self):
+		return f"{self.subject} -> {self.to} ({self.status})"
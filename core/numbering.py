@@ -0,0 +1,223 @@
+"""
+Number Allocation for OncoOne Education
+Issues registration numbers from a per-year database counter passed through a
+keyed permutation, so numbers are unique, look random, and need no probe queries.
+The permutation key is generated with the counter row and stored on it.
+Invoice numbers come from a per-year sequence and need no second UPDATE.
+Version: 1.0
+"""
+
+import hashlib
+import hmac
+import logging
+import secrets
+from typing import List, Tuple
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger('core.security')
+
+# Registration numbers are ON{YY}-XXXXXX with XXXXXX in 100000..999999
+REGISTRATION_NUMBER_MIN = 100000
+REGISTRATION_NUMBER_CAPACITY = 900000
+
+# Feistel network over 20-bit values (2^20 = 1,048,576 >= capacity), cycle-walked into range
+_HALF_BITS = 10
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+
+# Log a warning once a year's space is this full
+EXHAUSTION_WARNING_RATIO = 0.9
+
+# Numbers skipped when a Postgres sequence takes over from a counter row already in use
+SEQUENCE_HANDOVER_GAP = 1000
+
+
+class SequenceExhausted(Exception):
+    """Raised when a sequence cannot hand out more numbers"""
+    pass
+
+
+def reserve(name: str, count: int = 1, limit: int = None) -> int:
+    """
+    Reserve `count` consecutive values from the named counter
+
+    The increment is a single UPDATE ... SET value = value + count, which takes
+    the row lock (Postgres) or the database write lock (SQLite) before reading,
+    so concurrent callers always get disjoint blocks without retry loops.
+
+    Returns:
+        int: The first reserved value (values are first .. first + count - 1)
+
+    Raises:
+        SequenceExhausted: If the block would go past `limit`
+    """
+    return _reserve(name, count, limit)[0]
+
+
+def _reserve(name: str, count: int, limit: int = None) -> Tuple[int, str]:
+    """reserve(), also returning the counter's key (created with the row, so it never changes)"""
+    from .models import NumberSequence
+
+    with transaction.atomic():
+        updated = NumberSequence.objects.filter(name=name).update(value=F('value') + count)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    NumberSequence.objects.create(name=name, value=count, key=secrets.token_hex(32))
+            except IntegrityError:
+                # Another worker created the row first; take our block from it
+                NumberSequence.objects.filter(name=name).update(value=F('value') + count)
+        end, key = NumberSequence.objects.filter(name=name).values_list('value', 'key').get()
+        first = end - count
+
+        if limit is not None and end > limit:
+            # Rolling back the transaction releases the block we just took
+            raise SequenceExhausted(f'Sequence {name} exhausted ({first}/{limit} used)')
+
+    return first, key
+
+
+def sequence_name(name: str) -> str:
+    """Postgres sequence backing a named counter, e.g. invoice:2026 -> core_seq_invoice_2026"""
+    return 'core_seq_' + ''.join(ch if ch.isalnum() else '_' for ch in name).lower()
+
+
+def next_in_sequence(name: str) -> int:
+    """
+    Return the next value (starting at 1) of a gap-tolerant named sequence
+
+    On Postgres this is a native sequence when one has been created for `name`
+    (create_sequence(); nextval never blocks other transactions and is not
+    rolled back, so numbers may have gaps). Otherwise - other databases, or a
+    sequence not created yet - the NumberSequence counter row through reserve().
+    Never runs DDL, so the app's database user needs no CREATE rights.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # The ::text makes nextval resolve the name at run time, so a missing
+            # sequence yields NULL here instead of an error
+            cursor.execute(
+                'SELECT CASE WHEN to_regclass(%s) IS NOT NULL THEN nextval(%s::text) END',
+                [sequence_name(name)] * 2,
+            )
+            value = cursor.fetchone()[0]
+        if value is not None:
+            return value
+    return reserve(name) + 1
+
+
+def create_sequence(name: str, using: str = 'default') -> bool:
+    """
+    Create the Postgres sequence for a named counter, if it does not exist yet
+
+    Run ahead of time (migration 0017, the create_number_sequences command),
+    never from a request. If the counter row was already in use, the sequence
+    starts SEQUENCE_HANDOVER_GAP past it, so numbers handed out by the row
+    while the sequence was being created cannot be issued again.
+
+    Returns:
+        bool: Whether a sequence was created (False on other databases or if it exists)
+    """
+    from django.db import connections
+
+    db = connections[using]
+    if db.vendor != 'postgresql':
+        return False
+    with transaction.atomic(using=using), db.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [sequence_name(name)])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute('SELECT value FROM core_numbersequence WHERE name = %s', [name])
+        row = cursor.fetchone()
+        start = row[0] + 1 + SEQUENCE_HANDOVER_GAP if row else 1
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {sequence_name(name)} START WITH {int(start)}')
+    logger.info(f'Created sequence {sequence_name(name)} for {name} starting at {start}')
+    return True
+
+
+def invoice_sequence_name(year: int) -> str:
+    return f'invoice:{year}'
+
+
+def allocate_invoice_number() -> str:
+    """
+    Allocate the next invoice number for the current year
+
+    Example: INV-2026-000042. The counter restarts every year and does not
+    depend on the payment's id, so the number can be set before the first save.
+    """
+    year = timezone.now().year
+    return f'INV-{year}-{next_in_sequence(invoice_sequence_name(year)):06d}'
+
+
+def _feistel(value: int, key: bytes) -> int:
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for round_number in range(_ROUNDS):
+        digest = hmac.new(key, bytes([round_number]) + right.to_bytes(2, 'big'), hashlib.sha256).digest()
+        left, right = right, left ^ (int.from_bytes(digest[:2], 'big') & _HALF_MASK)
+    return (left << _HALF_BITS) | right
+
+
+def permute(index: int, key: bytes) -> int:
+    """
+    Map a counter index in [0, capacity) to a unique pseudo-random index in the same range
+
+    The Feistel network is a bijection on 20-bit values; cycle-walking (re-applying
+    it while the result is out of range) restricts it to a bijection on
+    [0, REGISTRATION_NUMBER_CAPACITY). It takes about 1.2 rounds on average.
+    `key` is the year's counter key, stored with the counter row, so rotating
+    SECRET_KEY cannot change numbers still to be issued.
+    """
+    value = _feistel(index, key)
+    while value >= REGISTRATION_NUMBER_CAPACITY:
+        value = _feistel(value, key)
+    return value
+
+
+def allocate_registration_numbers(count: int = 1) -> List[str]:
+    """
+    Allocate `count` unique registration numbers for the current year
+
+    Example: ['ON26-698574', 'ON26-131907']
+
+    Raises:
+        SequenceExhausted: When the year's 900,000 numbers are used up
+    """
+    year_suffix = str(timezone.now().year)[-2:]
+    name = f'registration_number:{year_suffix}'
+    first, key = _reserve(name, count, limit=REGISTRATION_NUMBER_CAPACITY)
+    key = bytes.fromhex(key)
+
+    used = first + count
+    if used >= REGISTRATION_NUMBER_CAPACITY * EXHAUSTION_WARNING_RATIO:
+        logger.warning(
+            f'Registration numbers for 20{year_suffix} are {used / REGISTRATION_NUMBER_CAPACITY:.1%} '
+            f'used ({used}/{REGISTRATION_NUMBER_CAPACITY})'
+        )
+
+    return [
+        f'ON{year_suffix}-{REGISTRATION_NUMBER_MIN + permute(index, key)}'
+        for index in range(first, first + count)
+    ]
+
+
+def registration_number_usage(year: int = None) -> dict:
+    """Report how much of a year's registration number space has been issued"""
+    from .models import NumberSequence
+
+    year_suffix = str(year or timezone.now().year)[-2:]
+    used = (
+        NumberSequence.objects
+        .filter(name=f'registration_number:{year_suffix}')
+        .values_list('value', flat=True)
+        .first()
+    ) or 0
+    return {
+        'year': year_suffix,
+        'used': used,
+        'capacity': REGISTRATION_NUMBER_CAPACITY,
+        'remaining': REGISTRATION_NUMBER_CAPACITY - used,
+    }
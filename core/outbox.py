@@ -0,0 +1,149 @@
+"""
+Email Outbox for OncoOne Education
+Queues emails as QueuedEmail rows so bulk operations never wait on SMTP, and
+sends them later over a single connection per batch
+Version: 1.0
+"""
+
+import logging
+import uuid
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import QueuedEmail
+from .timing import timed
+
+logger = logging.getLogger('core.payment')
+
+# Messages are left as failed after this many delivery attempts
+MAX_SEND_ATTEMPTS = 5
+
+
+def build_email(subject: str, body: str, to: Iterable[str], from_email: str = '') -> QueuedEmail:
+    """Build an unsaved QueuedEmail (pass a list of these to queue_emails)"""
+    return QueuedEmail(subject=subject[:255], body=body, to=','.join(to), from_email=from_email)
+
+
+def queue_emails(emails: List[QueuedEmail], batch_size: int = 500) -> int:
+    """Insert queued emails with bulk_create; returns the number queued"""
+    QueuedEmail.objects.bulk_create(emails, batch_size=batch_size)
+    return len(emails)
+
+
+def claim_batch(size: int, after_id: int = 0) -> List[QueuedEmail]:
+    """
+    Claim up to `size` pending emails (ids above after_id) for this worker
+
+    A conditional UPDATE moves them from pending to sending under a fresh
+    claim token, so two workers running at once never pick up the same row.
+    Rows left sending by a worker that died are claimable again after
+    OUTBOX_CLAIM_SECONDS.
+    """
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'OUTBOX_CLAIM_SECONDS', 600))
+    claimable = QueuedEmail.objects.filter(Q(status='pending') | Q(status='sending', claimed_at__lt=stale))
+    while True:
+        ids = list(claimable.filter(id__gt=after_id).order_by('id').values_list('id', flat=True)[:size])
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        claimed = claimable.filter(id__in=ids).update(status='sending', claim_token=token, claimed_at=timezone.now())
+        if claimed:
+            return list(QueuedEmail.objects.filter(claim_token=token, status='sending').order_by('id'))
+        # Another worker claimed all of them first; look further along
+        after_id = ids[-1]
+
+
+def send_queued_emails(batch_size: int = 100, limit: int = None) -> Dict[str, int]:
+    """
+    Send pending emails, batch_size at a time, over one backend connection per batch
+
+    Each batch is claimed first (see claim_batch), so concurrent runs share
+    the queue instead of sending the same messages twice, then marked sent or
+    failed with a single bulk_update. Messages that fail go back to pending
+    and are retried on the next run until MAX_SEND_ATTEMPTS.
+
+    Returns:
+        dict: Counts of sent and failed messages
+    """
+    totals = {'sent': 0, 'failed': 0}
+    last_id = 0
+
+    while limit is None or totals['sent'] + totals['failed'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - totals['sent'] - totals['failed'])
+        batch = claim_batch(size, after_id=last_id)
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        connection = get_connection()
+        try:
+            connection.open()
+            for queued in batch:
+                message = EmailMessage(
+                    queued.subject,
+                    queued.body,
+                    queued.from_email or settings.DEFAULT_FROM_EMAIL,
+                    [address for address in queued.to.split(',') if address],
+                    connection=connection,
+                )
+                queued.attempts += 1
+                try:
+                    with timed('email'):
+                        message.send()
+                    queued.status = 'sent'
+                    queued.sent_at = timezone.now()
+                    queued.last_error = ''
+                    totals['sent'] += 1
+                except Exception as e:
+                    queued.last_error = str(e)
+                    queued.status = 'failed' if queued.attempts >= MAX_SEND_ATTEMPTS else 'pending'
+                    totals['failed'] += 1
+        except Exception as e:
+            # Could not connect at all; hand the batch back for the next run
+            logger.error(f'Email outbox connection failed: {e}')
+            QueuedEmail.objects.filter(id__in=[queued.id for queued in batch], status='sending').update(
+                status='pending', claim_token='', claimed_at=None,
+            )
+            break
+        finally:
+            connection.close()
+
+        for queued in batch:
+            queued.claim_token = ''
+            queued.claimed_at = None
+        QueuedEmail.objects.bulk_update(
+            batch, ['status', 'attempts', 'last_error', 'sent_at', 'claim_token', 'claimed_at'],
+        )
+
+    if totals['failed']:
+        logger.warning(f"Email outbox: {totals['sent']} sent, {totals['failed']} failed")
+    return totals
+
+
+def welcome_email_content(name: str, email: str, registration_number: str, course_name: str):
+    """Subject and body of the registration confirmation sent to a new student"""
+    subject = f"Welcome to OncoOne - Registration Number: {registration_number}"
+    body = (
+        f"Hi {name},\n\n"
+        f"Thank you for registering for {course_name}!\n\n"
+        f"═══════════════════════════════════════\n"
+        f"YOUR REGISTRATION NUMBER: {registration_number}\n"
+        f"═══════════════════════════════════════\n\n"
+        f"Please save this registration number. You will need it to:\n"
+        f"• Make payments through our payment portal\n"
+        f"• Access your student account\n"
+        f"• Track your course progress\n\n"
+        f"Student Details:\n"
+        f"Name: {name}\n"
+        f"Email: {email}\n"
+        f"Course: {course_name}\n\n"
+        f"Payment Portal: Use your registration number ({registration_number}) to make payments\n\n"
+        f"If you have any questions, please contact us.\n\n"
+        f"– OncoOne Team"
+    )
+    return subject, body
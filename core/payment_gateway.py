@@ -0,0 +1,150 @@
+"""
+Payment Gateway Interface for OncoOne Education
+Defines the operations every payment backend must provide and selects the
+active backend from settings.PAYMENT_GATEWAY
+Version: 1.0
+"""
+
+import functools
+import time
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Dict, Optional, Any
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import metrics, tracing
+from .timing import timed
+
+
+class PaymentGateway(ABC):
+    """
+    Base interface for payment gateways
+
+    All methods return plain dicts with a ``success`` flag, mirroring the
+    result format used by StripePaymentProcessor so views never need to know
+    which backend is active. Every method is abstract, so a gateway that
+    misses one fails when it is constructed rather than mid-payment.
+    """
+
+    @abstractmethod
+    def create_payment_intent(
+        self,
+        amount_cad: Decimal,
+        email: str,
+        student_name: str,
+        course_name: str,
+        payment_id: Optional[str] = None,
+        payment_method_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Create a payment intent for the given amount"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_payment_intent(
+        self,
+        payment_intent_id: str,
+        amount_cad: Optional[Decimal] = None,
+        payment_method_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Change the amount and/or payment method of an unconfirmed payment intent"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def confirm_payment(self, payment_intent_id: str, payment_method_id: Optional[str] = None) -> Dict[str, Any]:
+        """Confirm a payment intent and return its latest status"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def retrieve_payment_intent(self, payment_intent_id: str) -> Dict[str, Any]:
+        """Retrieve the current state of a payment intent"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def cancel_payment_intent(self, payment_intent_id: str, reason: str = 'abandoned') -> Dict[str, Any]:
+        """Cancel a payment intent that was never completed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def refund_payment(
+        self,
+        charge_id: str,
+        amount_cents: Optional[int] = None,
+        reason: str = 'requested_by_customer'
+    ) -> Dict[str, Any]:
+        """Refund a completed charge (full or partial)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def verify_webhook_signature(self, payload: bytes, signature: str) -> Dict[str, Any]:
+        """Verify a webhook payload and return the decoded event"""
+        raise NotImplementedError
+
+
+class TimedGateway:
+    """
+    Proxy that times every call to the wrapped gateway under 'stripe' (core/timing.py),
+    records its latency and failures (by error_type) for /metrics, and traces it
+    as a stripe.<method> span
+    """
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    def __getattr__(self, name):
+        attr = getattr(self.gateway, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            error_type = None
+            try:
+                with tracing.span(f'stripe.{name}', kind='CLIENT', **{'peer.service': 'stripe'}) as span, timed('stripe'):
+                    result = attr(*args, **kwargs)
+                    if isinstance(result, dict) and result.get('success') is False:
+                        error_type = result.get('error_type') or 'unknown'
+                        if span is not None:
+                            span.set_attribute('stripe.error_type', error_type)
+                            span.set_error(str(result.get('error', error_type)))
+                    elif isinstance(result, dict) and span is not None:
+                        span.set_attribute('stripe.payment_intent_id', result.get('payment_intent_id'))
+                        span.set_attribute('stripe.status', result.get('status'))
+                return result
+            except Exception as exc:
+                error_type = type(exc).__name__
+                raise
+            finally:
+                metrics.observe('oncoone_stripe_call_duration_seconds', time.perf_counter() - started, method=name)
+                if error_type is not None:
+                    metrics.inc('oncoone_stripe_errors_total', method=name, error_type=error_type)
+        return call
+
+
+@functools.lru_cache(maxsize=None)
+def _load_gateway(path: str) -> PaymentGateway:
+    gateway = import_string(path)
+    # Gateways may be declared as classes (Stripe uses static methods) or instances
+    if isinstance(gateway, type):
+        gateway = gateway()
+    return TimedGateway(gateway)
+
+
+def get_payment_gateway() -> PaymentGateway:
+    """
+    Return the payment gateway configured in settings.PAYMENT_GATEWAY
+
+    The instance is cached per process so stateful gateways (such as the
+    in-memory fake) keep their intents between requests.
+    """
+    path = getattr(settings, 'PAYMENT_GATEWAY', 'core.stripe_processor.StripePaymentProcessor')
+    return _load_gateway(path)
+
+
+@receiver(setting_changed)
+def _reset_gateway_cache(setting, **kwargs):
+    if setting.startswith('PAYMENT_GATEWAY') or setting == 'FAKE_PAYMENT_GATEWAY':
+        _load_gateway.cache_clear()
@@ -0,0 +1,204 @@
+"""
+On-Demand Request Profiler for OncoOne Education
+Profiles a single staff request in place: a stack sampler (or cProfile) plus
+tracemalloc, saved under PROFILER_DIR
+Version: 1.0
+
+A staff user adds `?_profile=sample` (or the header `X-Profile: sample`) to any
+URL; `cprofile` instead of `sample` runs the deterministic profiler. The
+response carries `X-Profile-Id`, and the artifacts can be downloaded from
+/api/admin/profiles/<id>/<artifact>/ (see RequestProfilerMiddleware):
+- collapsed: folded stacks ("a;b;c 12" per line) for flamegraph.pl, inferno or speedscope
+- prof: cProfile stats for snakeviz / pstats (cprofile mode)
+- alloc: the top allocation sites by size, from tracemalloc
+
+One profile runs at a time per process (tracemalloc is process-wide); a
+request arriving while another is being profiled runs normally.
+"""
+
+import cProfile
+import os
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional
+
+from django.conf import settings
+
+MODES = ('sample', 'cprofile')
+ARTIFACTS = {
+    'collapsed': ('.collapsed', 'text/plain; charset=utf-8'),
+    'prof': ('.prof', 'application/octet-stream'),
+    'alloc': ('.alloc.txt', 'text/plain; charset=utf-8'),
+}
+PROFILE_ID = re.compile(r'^[0-9A-Za-z_-]+$')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_busy = threading.Lock()
+
+
+def requested_mode(request) -> Optional[str]:
+    """'sample' or 'cprofile' when the request asks to be profiled ('1' means sample), else None"""
+    value = request.GET.get('_profile') or request.META.get('HTTP_X_PROFILE')
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value in ('1', 'true'):
+        return 'sample'
+    return value if value in MODES else None
+
+
+def _short_path(filename: str) -> str:
+    """core/views.py for project files, django/db/... for installed packages"""
+    if filename.startswith(PROJECT_DIR):
+        return os.path.relpath(filename, PROJECT_DIR)
+    return filename.split('site-packages' + os.sep)[-1]
+
+
+def _frame_label(code) -> str:
+    return f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Samples one thread's stack every `interval_ms` from a background thread"""
+
+    def __init__(self, thread_id: int, interval_ms: float):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _collapsed_from_cprofile(profile: cProfile.Profile) -> str:
+    """caller;callee lines weighted by callee time (microseconds); cProfile keeps no deeper stacks"""
+    stats = pstats.Stats(profile)
+    lines = []
+    for (filename, line, name), (_, _, _, _, callers) in stats.stats.items():
+        label = f'{name} ({_short_path(filename)}:{line})'
+        for (caller_file, caller_line, caller_name), caller_stats in callers.items():
+            micros = int(caller_stats[2] * 1e6)
+            if micros:
+                lines.append(f'{caller_name} ({_short_path(caller_file)}:{caller_line});{label} {micros}\n')
+    return ''.join(sorted(lines))
+
+
+def _allocation_report(snapshot: tracemalloc.Snapshot, peak: int, limit: int) -> str:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    stats = snapshot.statistics('lineno')
+    lines = [
+        f'Peak traced memory: {peak / 1024:.1f} KiB (all threads of the process while the request ran)',
+        f'Top {limit} allocation sites still held at the end of the request:',
+        '',
+    ]
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f'{stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {_short_path(frame.filename)}:{frame.lineno}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestProfile:
+    """Runs one request under the profiler; `run(call)` returns call()'s result"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.profile_id = None
+        self.summary: Dict[str, object] = {}
+        self._artifacts = {}
+
+    def run(self, call):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        sampler = profile = None
+        started = time.perf_counter()
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+        else:
+            sampler = StackSampler(threading.get_ident(), getattr(settings, 'PROFILER_SAMPLE_INTERVAL_MS', 2))
+            sampler.start()
+        try:
+            return call()
+        finally:
+            if profile is not None:
+                profile.disable()
+            else:
+                sampler.stop()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            self.summary = {'mode': self.mode, 'ms': round(elapsed_ms, 1), 'peak_kib': round(peak / 1024, 1)}
+            if sampler is not None:
+                self.summary['samples'] = sampler.samples
+            self._artifacts = {
+                'collapsed': sampler.collapsed() if sampler is not None else _collapsed_from_cprofile(profile),
+                'alloc': _allocation_report(snapshot, peak, getattr(settings, 'PROFILER_ALLOCATION_SITES', 25)),
+            }
+            if profile is not None:
+                self._artifacts['prof'] = profile
+
+    def save(self, label: str) -> str:
+        """Write the artifacts to PROFILER_DIR; returns the profile id"""
+        directory = settings.PROFILER_DIR
+        os.makedirs(directory, exist_ok=True)
+        label = re.sub(r'[^0-9A-Za-z_-]+', '-', label).strip('-')[:60] or 'request'
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{secrets.token_hex(3)}"
+        for artifact, content in self._artifacts.items():
+            path = artifact_path(self.profile_id, artifact)
+            if artifact == 'prof':
+                content.dump_stats(path)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+        return self.profile_id
+
+
+def artifact_path(profile_id: str, artifact: str) -> Optional[str]:
+    """Where a saved artifact lives, or None for an invalid id/artifact"""
+    if artifact not in ARTIFACTS or not PROFILE_ID.match(profile_id):
+        return None
+    return os.path.join(settings.PROFILER_DIR, profile_id + ARTIFACTS[artifact][0])
+
+
+def try_acquire() -> bool:
+    return _busy.acquire(blocking=False)
+
+
+def release() -> None:
+    _busy.release()
@@ -0,0 +1,229 @@
+"""
+Slow-Query Log for OncoOne Education
+Opt-in instrumentation that logs slow queries and N+1 patterns with the core
+call site that issued them, and optionally their EXPLAIN plan
+Version: 1.0
+
+RequestTimingMiddleware installs execute_wrapper() on every connection while
+QUERY_LOG_ENABLED is on. Per request it:
+- logs queries slower than QUERY_LOG_SLOW_MS (a QUERY_LOG_SAMPLE_RATE share
+  of them), with EXPLAIN output when QUERY_LOG_EXPLAIN is on
+- counts query shapes (the SQL with IN-lists collapsed) and logs each shape
+  run QUERY_LOG_N_PLUS_ONE_THRESHOLD or more times - the N+1 signature
+
+Records go to the core.queries logger (its own file, QUERY_LOG_FILE, one JSON
+object per line); report() aggregates that file for the staff report page.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('core.queries')
+
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Instrumentation modules that sit between the calling code and the database
+_SKIP_FILES = {
+    os.path.join(CORE_DIR, name)
+    for name in ('query_log.py', 'middleware.py', 'timing.py', 'tracing.py', 'db_router.py', 'sqlite_profile.py')
+}
+_SKIP_DIRS = (os.path.join(CORE_DIR, 'db_backends'),)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SQL_MAX_CHARS = 2000
+
+_current = contextvars.ContextVar('query_log', default=None)
+
+
+def enabled() -> bool:
+    return getattr(settings, 'QUERY_LOG_ENABLED', False)
+
+
+def shape(sql: str) -> str:
+    """The query with IN-lists collapsed, so `id IN (1, 2)` and `id IN (1, 2, 3)` count as one shape"""
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def call_site() -> str:
+    """file:line in function of the innermost core frame outside the instrumentation"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(CORE_DIR)
+            and filename not in _SKIP_FILES
+            and not filename.startswith(_SKIP_DIRS)
+        ):
+            relative = os.path.relpath(filename, os.path.dirname(CORE_DIR))
+            return f'{relative}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'outside core'
+
+
+class RequestQueries:
+    """Query shapes seen during one request"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.ms: Dict[str, float] = defaultdict(float)
+        self.sites: Dict[str, str] = {}
+        self.view = 'unmatched'
+        self.explaining = False
+
+
+def start_request() -> contextvars.Token:
+    return _current.set(RequestQueries())
+
+
+def set_view(view: str) -> None:
+    """Name the view being run (URL name), once the URL has been resolved"""
+    queries = _current.get()
+    if queries is not None:
+        queries.view = view
+
+
+def end_request(token: contextvars.Token) -> None:
+    """Log every shape that ran at least QUERY_LOG_N_PLUS_ONE_THRESHOLD times in the request"""
+    queries = _current.get()
+    _current.reset(token)
+    if queries is None:
+        return
+    view = queries.view
+    threshold = getattr(settings, 'QUERY_LOG_N_PLUS_ONE_THRESHOLD', 10)
+    for sql, count in queries.counts.items():
+        if count >= threshold:
+            site = queries.sites.get(sql, 'outside core')
+            logger.warning(
+                f'N+1: {count} x {sql[:200]} at {site} ({view})',
+                extra={
+                    'kind': 'n_plus_one',
+                    'view': view,
+                    'call_site': site,
+                    'sql': sql[:_SQL_MAX_CHARS],
+                    'count': count,
+                    'duration_ms': round(queries.ms[sql], 2),
+                },
+            )
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook; see the module docstring"""
+    queries = _current.get()
+    if queries is None or queries.explaining:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    key = shape(sql)
+    queries.counts[key] += 1
+    queries.ms[key] += elapsed_ms
+    if queries.counts[key] == 2:
+        # Only shapes that repeat need a call site; looked up once per shape
+        queries.sites[key] = call_site()
+
+    if (
+        elapsed_ms >= getattr(settings, 'QUERY_LOG_SLOW_MS', 100)
+        and random.random() < getattr(settings, 'QUERY_LOG_SAMPLE_RATE', 1.0)
+    ):
+        connection = context['connection']
+        explain = None
+        if getattr(settings, 'QUERY_LOG_EXPLAIN', False) and not many and sql.lstrip().upper().startswith('SELECT'):
+            explain = _explain(queries, connection, sql, params)
+        site = call_site()
+        logger.warning(
+            f'Slow query {elapsed_ms:.0f}ms at {site} ({queries.view}): {sql[:200]}',
+            extra={
+                'kind': 'slow',
+                'view': queries.view,
+                'call_site': site,
+                'sql': sql[:_SQL_MAX_CHARS],
+                'duration_ms': round(elapsed_ms, 2),
+                'database': connection.alias,
+                'explain': explain,
+            },
+        )
+    return result
+
+
+def _explain(queries: RequestQueries, connection, sql: str, params) -> Optional[str]:
+    """The backend's EXPLAIN of `sql`, run on the same connection (not itself instrumented)"""
+    queries.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        queries.explaining = False
+
+
+def report(path: Optional[str] = None, max_bytes: int = 2 * 1024 * 1024) -> List[Dict]:
+    """
+    Aggregate the last `max_bytes` of the query log: one row per (kind, call
+    site, shape) with occurrences, total/max milliseconds and the slowest
+    example's EXPLAIN, worst first
+    """
+    path = path or getattr(settings, 'QUERY_LOG_FILE', '')
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - max_bytes))
+            data = f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return []
+    lines = data.splitlines()
+    if size > max_bytes:
+        lines = lines[1:]  # Started mid-line
+
+    rows = {}
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get('kind') not in ('slow', 'n_plus_one'):
+            continue
+        key = (entry['kind'], entry.get('call_site', ''), shape(entry.get('sql', '')))
+        row = rows.setdefault(key, {
+            'kind': entry['kind'],
+            'call_site': key[1],
+            'sql': entry.get('sql', ''),
+            'views': set(),
+            'occurrences': 0,
+            'queries': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'explain': None,
+            'last_seen': None,
+        })
+        duration = entry.get('duration_ms') or 0.0
+        row['occurrences'] += 1
+        row['queries'] += entry.get('count', 1)
+        row['total_ms'] += duration
+        if entry.get('view'):
+            row['views'].add(entry['view'])
+        if duration >= row['max_ms']:
+            row['max_ms'] = duration
+            row['explain'] = entry.get('explain') or row['explain']
+        row['last_seen'] = entry.get('ts')
+
+    result = []
+    for row in rows.values():
+        row['views'] = sorted(row['views'])
+        row['total_ms'] = round(row['total_ms'], 2)
+        result.append(row)
+    result.sort(key=lambda row: row['total_ms'], reverse=True)
+    return result
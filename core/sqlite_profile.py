@@ -0,0 +1,71 @@
+"""
+SQLite Production Profile for OncoOne Education
+Per-connection pragmas and BEGIN IMMEDIATE transactions, so concurrent
+registrations and payments on a single-box SQLite deployment queue for the
+write lock instead of failing with "database is locked"
+Version: 1.0
+
+Configured by SQLITE_PRODUCTION_PROFILE / SQLITE_PRAGMAS in settings.
+Does nothing on Postgres.
+"""
+
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger('core.security')
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """connection_created receiver: set SQLITE_PRAGMAS on every new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+            if name == 'journal_mode':
+                mode = cursor.fetchone()[0]
+                # In-memory test databases answer 'memory'; anything else means WAL was refused
+                if mode.lower() not in (str(value).lower(), 'memory'):
+                    logger.warning(f'SQLite journal_mode is {mode!r}, not {value!r}, for {connection.alias!r}')
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    """
+    transaction.atomic() that takes SQLite's write lock when it begins
+
+    A default (deferred) SQLite transaction that reads before it writes has to
+    upgrade its lock at the first write; if another connection is writing,
+    SQLite fails that upgrade at once with "database is locked" rather than
+    waiting out busy_timeout. BEGIN IMMEDIATE takes the write lock first, so
+    writers wait their turn. Keep the block short: it serializes all writers,
+    so gateway calls and emails belong outside it.
+
+    Works as a decorator too. Nested blocks become savepoints of the outer
+    transaction; on Postgres this is plain transaction.atomic().
+    """
+    connection = transaction.get_connection(using)
+    immediate = (
+        connection.vendor == 'sqlite'
+        and getattr(settings, 'SQLITE_PRODUCTION_PROFILE', False)
+        and not connection.in_atomic_block
+    )
+    if not immediate:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Read by core.db_backends.sqlite3 when atomic() issues BEGIN
+    connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        connection.begin_immediate = False
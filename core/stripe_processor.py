@@ -13,19 +13,36 @@ from decimal import Decimal
 from typing import Dict, Optional, Any
 from django.conf import settings
 
+from .circuit_breaker import circuit_guarded, get_breaker
+from .payment_gateway import PaymentGateway
+
 # Initialize logging
 logger = logging.getLogger('core.payment')
 
 # Initialize Stripe with API key
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY', settings.STRIPE_SECRET_KEY)
 
+# Fail fast instead of holding a worker for the library's 80s default timeout
+stripe.max_network_retries = getattr(settings, 'STRIPE_MAX_NETWORK_RETRIES', 0)
+stripe.default_http_client = stripe.http_client.new_default_http_client(
+    timeout=getattr(settings, 'STRIPE_TIMEOUT_SECONDS', 10)
+)
+
+# Errors that indicate Stripe itself is unhealthy and count against the circuit breaker.
+# Card declines and invalid requests mean Stripe answered, so they do not.
+STRIPE_OUTAGE_ERRORS = (
+    stripe.error.APIConnectionError,
+    stripe.error.APIError,
+    stripe.error.RateLimitError,
+)
+
 
 class PaymentProcessingError(Exception):
     """Custom exception for payment processing errors"""
     pass
 
 
-class StripePaymentProcessor:
+class StripePaymentProcessor(PaymentGateway):
     """
     Professional Stripe Payment Processor for OncoOne Education
     Handles all payment operations with comprehensive error handling and security
@@ -97,6 +114,7 @@ class StripePaymentProcessor:
             raise PaymentProcessingError('Invalid payment amount')
     
     @staticmethod
+    @circuit_guarded('stripe_create_payment_intent')
     def create_payment_intent(
         amount_cad: Decimal,
         email: str,
@@ -138,23 +156,24 @@ class StripePaymentProcessor:
             
             # Create Payment Intent with Stripe
             # Attach payment method so we can confirm after OTP
-            payment_intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency=settings.STRIPE_CURRENCY,
-                description=f'{settings.BUSINESS_NAME} - {course_name}',
-                statement_descriptor_suffix=settings.STRIPE_STATEMENT_DESCRIPTOR[:22],  # Max 22 chars for suffix
-                receipt_email=email,
-                metadata=metadata,
-                payment_method_types=['card'],
-                payment_method=payment_method_id,
-                confirmation_method='automatic',
-                confirm=False,
-                payment_method_options={
-                    'card': {
-                        'request_three_d_secure': 'automatic'
-                    }
-                },
-            )
+            with get_breaker('stripe_create_payment_intent').track(STRIPE_OUTAGE_ERRORS):
+                payment_intent = stripe.PaymentIntent.create(
+                    amount=amount_cents,
+                    currency=settings.STRIPE_CURRENCY,
+                    description=f'{settings.BUSINESS_NAME} - {course_name}',
+                    statement_descriptor_suffix=settings.STRIPE_STATEMENT_DESCRIPTOR[:22],  # Max 22 chars for suffix
+                    receipt_email=email,
+                    metadata=metadata,
+                    payment_method_types=['card'],
+                    payment_method=payment_method_id,
+                    confirmation_method='automatic',
+                    confirm=False,
+                    payment_method_options={
+                        'card': {
+                            'request_three_d_secure': 'automatic'
+                        }
+                    },
+                )
             
             logger.info(
                 f'✅ Payment Intent created: {payment_intent.id} | '
@@ -236,6 +255,65 @@ class StripePaymentProcessor:
             }
     
     @staticmethod
+    @circuit_guarded('stripe_update_payment_intent')
+    def update_payment_intent(
+        payment_intent_id: str,
+        amount_cad: Optional[Decimal] = None,
+        payment_method_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Update an unconfirmed Payment Intent so it can be reused on retry
+        
+        Args:
+            payment_intent_id: Stripe Payment Intent ID
+            amount_cad: New amount in CAD (None to keep the current amount)
+            payment_method_id: New payment method to attach (optional)
+            
+        Returns:
+            Dict with success status and updated intent details or error
+        """
+        try:
+            params = {}
+            if amount_cad is not None:
+                StripePaymentProcessor.validate_amount(amount_cad)
+                params['amount'] = StripePaymentProcessor.get_stripe_amount(amount_cad)
+            if payment_method_id:
+                params['payment_method'] = payment_method_id
+                params['metadata'] = {'payment_method_id': str(payment_method_id)}
+            
+            with get_breaker('stripe_update_payment_intent').track(STRIPE_OUTAGE_ERRORS):
+                if params:
+                    payment_intent = stripe.PaymentIntent.modify(payment_intent_id, **params)
+                else:
+                    payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            
+            logger.info(f'Payment Intent updated: {payment_intent_id} | Fields: {", ".join(params) or "none"}')
+            return {
+                'success': True,
+                'client_secret': payment_intent.client_secret,
+                'payment_intent_id': payment_intent.id,
+                'amount': payment_intent.amount / 100,
+                'status': payment_intent.status
+            }
+            
+        except PaymentProcessingError as e:
+            logger.warning(f'Payment validation error: {str(e)}')
+            return {
+                'success': False,
+                'error': str(e),
+                'error_type': 'validation_error'
+            }
+            
+        except stripe.error.StripeError as e:
+            logger.warning(f'Unable to update payment intent {payment_intent_id}: {str(e)}')
+            return {
+                'success': False,
+                'error': 'Unable to update payment.',
+                'error_type': 'update_error'
+            }
+    
+    @staticmethod
+    @circuit_guarded('stripe_retrieve_payment_intent')
     def retrieve_payment_intent(payment_intent_id: str) -> Dict[str, Any]:
         """
         Retrieve and verify a payment intent from Stripe
@@ -247,10 +325,11 @@ class StripePaymentProcessor:
             Dict with payment intent details or error
         """
         try:
-            payment_intent = stripe.PaymentIntent.retrieve(
-                payment_intent_id,
-                expand=['charges', 'latest_charge', 'payment_method']
-            )
+            with get_breaker('stripe_retrieve_payment_intent').track(STRIPE_OUTAGE_ERRORS):
+                payment_intent = stripe.PaymentIntent.retrieve(
+                    payment_intent_id,
+                    expand=['charges', 'latest_charge', 'payment_method']
+                )
             
             logger.info(f'Payment Intent retrieved: {payment_intent_id} | Status: {payment_intent.status}')
             
@@ -281,15 +360,18 @@ class StripePaymentProcessor:
             }
     
     @staticmethod
+    @circuit_guarded('stripe_confirm_payment')
     def confirm_payment(payment_intent_id: str, payment_method_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Confirm a payment intent and return latest status/details
         """
+        breaker = get_breaker('stripe_confirm_payment')
         try:
-            payment_intent = stripe.PaymentIntent.retrieve(
-                payment_intent_id,
-                expand=['charges', 'latest_charge', 'payment_method']
-            )
+            with breaker.track(STRIPE_OUTAGE_ERRORS):
+                payment_intent = stripe.PaymentIntent.retrieve(
+                    payment_intent_id,
+                    expand=['charges', 'latest_charge', 'payment_method']
+                )
 
             # If not succeeded, attempt to confirm with attached payment method
             if payment_intent.status != 'succeeded':
@@ -297,7 +379,8 @@ class StripePaymentProcessor:
                     confirm_kwargs = {}
                     if payment_method_id:
                         confirm_kwargs['payment_method'] = payment_method_id
-                    payment_intent = stripe.PaymentIntent.confirm(payment_intent_id, **confirm_kwargs)
+                    with breaker.track(STRIPE_OUTAGE_ERRORS):
+                        payment_intent = stripe.PaymentIntent.confirm(payment_intent_id, **confirm_kwargs)
                 except stripe.error.StripeError as e:
                     logger.error(f'Error confirming payment {payment_intent_id}: {str(e)}')
                     return {
@@ -358,6 +441,40 @@ class StripePaymentProcessor:
             }
     
     @staticmethod
+    @circuit_guarded('stripe_cancel_payment_intent')
+    def cancel_payment_intent(payment_intent_id: str, reason: str = 'abandoned') -> Dict[str, Any]:
+        """
+        Cancel a payment intent that was never completed
+        
+        Args:
+            payment_intent_id: Stripe Payment Intent ID
+            reason: Stripe cancellation reason (abandoned, duplicate, requested_by_customer)
+            
+        Returns:
+            Dict with cancellation status or error
+        """
+        try:
+            with get_breaker('stripe_cancel_payment_intent').track(STRIPE_OUTAGE_ERRORS):
+                payment_intent = stripe.PaymentIntent.cancel(payment_intent_id, cancellation_reason=reason)
+            
+            logger.info(f'Payment Intent cancelled: {payment_intent_id} | Reason: {reason}')
+            return {
+                'success': True,
+                'status': payment_intent.status,
+                'payment_intent_id': payment_intent_id
+            }
+            
+        except stripe.error.StripeError as e:
+            # Intents that already succeeded or were cancelled cannot be cancelled again
+            logger.warning(f'Unable to cancel payment intent {payment_intent_id}: {str(e)}')
+            return {
+                'success': False,
+                'error': 'Unable to cancel payment.',
+                'error_type': 'cancel_error'
+            }
+    
+    @staticmethod
+    @circuit_guarded('stripe_create_customer')
     def create_customer(email: str, name: str) -> Dict[str, Any]:
         """
         Create or retrieve a Stripe customer account
@@ -369,9 +486,11 @@ class StripePaymentProcessor:
         Returns:
             Dict with customer ID and creation status
         """
+        breaker = get_breaker('stripe_create_customer')
         try:
             # Search for existing customer by email
-            customers = stripe.Customer.list(email=email, limit=1)
+            with breaker.track(STRIPE_OUTAGE_ERRORS):
+                customers = stripe.Customer.list(email=email, limit=1)
             
             if customers.data:
                 logger.info(f'Existing Stripe customer found: {email}')
@@ -382,11 +501,12 @@ class StripePaymentProcessor:
                 }
             
             # Create new customer
-            customer = stripe.Customer.create(
-                email=email,
-                name=name,
-                description=f'{settings.BUSINESS_NAME} Student - {name}'
-            )
+            with breaker.track(STRIPE_OUTAGE_ERRORS):
+                customer = stripe.Customer.create(
+                    email=email,
+                    name=name,
+                    description=f'{settings.BUSINESS_NAME} Student - {name}'
+                )
             
             logger.info(f'✅ New Stripe customer created: {customer.id} for {email}')
             return {
@@ -404,6 +524,7 @@ class StripePaymentProcessor:
             }
     
     @staticmethod
+    @circuit_guarded('stripe_refund_payment')
     def refund_payment(
         charge_id: str,
         amount_cents: Optional[int] = None,
@@ -429,7 +550,8 @@ class StripePaymentProcessor:
             if amount_cents:
                 refund_params['amount'] = amount_cents
             
-            refund = stripe.Refund.create(**refund_params)
+            with get_breaker('stripe_refund_payment').track(STRIPE_OUTAGE_ERRORS):
+                refund = stripe.Refund.create(**refund_params)
             
             logger.info(
                 f'✅ Refund processed: {refund.id} for charge {charge_id} | '
@@ -505,6 +627,7 @@ class StripePaymentProcessor:
             }
     
     @staticmethod
+    @circuit_guarded('stripe_get_charge_details')
     def get_charge_details(charge_id: str) -> Dict[str, Any]:
         """
         Retrieve details of a specific charge
@@ -516,7 +639,8 @@ class StripePaymentProcessor:
             Dict with charge details
         """
         try:
-            charge = stripe.Charge.retrieve(charge_id)
+            with get_breaker('stripe_get_charge_details').track(STRIPE_OUTAGE_ERRORS):
+                charge = stripe.Charge.retrieve(charge_id)
             
             return {
                 'success': True,
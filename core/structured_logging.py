@@ -0,0 +1,227 @@
+"""
+Structured Logging for OncoOne Education
+JSON log records, secret redaction, per-logger sampling and a background
+queue so request threads never wait on log I/O
+Version: 1.0
+
+Wired up by LOGGING in backend/settings.py and CoreConfig.ready():
+- JSONFormatter / TextFormatter redact OTP codes and Stripe secrets from the
+  message and traceback, whatever the call site wrote
+- SamplingFilter keeps a fraction of DEBUG/INFO records per logger
+  (LOG_SAMPLE_RATES); warnings and errors are always kept
+- start_queue_listener() moves the configured handlers of the core loggers
+  behind a QueueHandler, and a QueueListener thread does the formatting and
+  writing (LOG_QUEUE_ENABLED)
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterable, List, Optional, Union
+
+REDACTED = '[REDACTED]'
+
+# (pattern, replacement) applied to every formatted message and traceback. A
+# backstop only: code must not log secrets in the first place.
+REDACTIONS = (
+    # "OTP CODE: 123456", "DB OTP Code: 123456", "otp_code=123456", "Entered=123456"
+    (re.compile(r'(?i)(otp[ _]?code\W{0,3}\s*[:=]?\s*|entered\s*=\s*)\d{4,8}\b'), r'\1' + REDACTED),
+    (re.compile(r'\b(sk|rk)_(live|test)_[0-9A-Za-z]+'), r'\1_\2_' + REDACTED),
+    (re.compile(r'\bwhsec_[0-9A-Za-z]+'), 'whsec_' + REDACTED),
+    (re.compile(r'\b((?:pi|seti)_[0-9A-Za-z]+)_secret_[0-9A-Za-z]+'), r'\1_secret_' + REDACTED),
+    (re.compile(r'(?i)(password\W{0,3}\s*[:=]\s*)\S+'), r'\1' + REDACTED),
+)
+
+# LogRecord attributes that are not `extra=` fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'trace_id'}
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _trace_id(record) -> Optional[str]:
+    trace_id = getattr(record, 'trace_id', None)
+    if trace_id is None:
+        # Formatting in the calling thread (no queue): read it directly
+        from .tracing import current_trace_id
+        trace_id = current_trace_id()
+    return trace_id
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one-line format, with secrets redacted"""
+
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, module, message, pid, thread, trace_id, exc and any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': redact(record.getMessage()),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        trace_id = _trace_id(record)
+        if trace_id:
+            entry['trace_id'] = trace_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = redact(record.exc_text)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep `rate` of the DEBUG/INFO records of each logger in `rates`
+    ({'core.payment': 0.1} or 'core.payment=0.1'); the longest matching
+    logger name wins, and loggers not listed are kept in full
+    """
+
+    def __init__(self, rates: Union[str, Dict[str, float], None] = None):
+        super().__init__()
+        if isinstance(rates, str):
+            rates = parse_sample_rates(rates)
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def rate_for(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """'core.payment=0.1,core.performance=0.5' -> {'core.payment': 0.1, 'core.performance': 0.5}"""
+    rates = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, rate = item.split('=', 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    QueueHandler that captures what only the calling thread knows (the trace
+    id) and renders the message there, so the listener thread gets a plain record
+    """
+
+    def prepare(self, record):
+        from .tracing import current_trace_id
+        record.trace_id = current_trace_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_queued_loggers: List[logging.Logger] = []
+
+
+def start_queue_listener(logger_names: Iterable[str], max_size: int = 10000) -> None:
+    """
+    Put each named logger's handlers behind one shared queue, drained by a
+    QueueListener thread. When the queue is full a record is dropped rather
+    than blocking the request. Safe to call more than once.
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(max_size)
+        queue_handler = _NonBlockingQueueHandler(log_queue)
+        for name in logger_names:
+            logger = logging.getLogger(name)
+            if not logger.handlers:
+                continue
+            # The listener hands this logger's records to these once they come off the queue
+            logger._queued_handlers = list(logger.handlers)
+            logger.handlers = [queue_handler]
+            _queued_loggers.append(logger)
+        if not _queued_loggers:
+            return
+        _queue_handler = queue_handler
+        _listener = _RoutingQueueListener(log_queue)
+        _listener.start()
+        atexit.register(stop_queue_listener)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stop_queue_listener() -> None:
+    """Flush what is queued and stop the listener thread"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_after_fork():
+    # A forked worker inherits the listener's state but not its thread. The
+    # lock and the queue (with its internal locks) may have been held by a
+    # parent thread at fork time, so the child starts over with new ones.
+    global _lock, _listener
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    log_queue = queue.Queue(_listener.queue.maxsize)
+    _queue_handler.queue = log_queue
+    _listener = _RoutingQueueListener(log_queue)
+    _listener.start()
+
+
+class _NonBlockingQueueHandler(ContextQueueHandler):
+    dropped = 0  # Records lost to a full queue
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
+
+
+class _RoutingQueueListener(QueueListener):
+    """Hands each record to the handlers its logger had before it was queued"""
+
+    def handle(self, record):
+        logger = logging.getLogger(record.name)
+        while logger is not None and not hasattr(logger, '_queued_handlers'):
+            logger = logger.parent
+        if logger is None:
+            return
+        for handler in logger._queued_handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
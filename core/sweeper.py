@@ -0,0 +1,169 @@
+"""
+Expiry Sweeper for OncoOne Education
+Deletes expired, unverified PaymentOTP rows and cancels pending payments
+older than PAYMENT_TIMEOUT_MINUTES so the hot payment tables stay small
+Version: 1.0
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Payment, PaymentOTP
+from .payment_gateway import get_payment_gateway
+
+logger = logging.getLogger('core.payment')
+
+
+def delete_expired_otps(batch_size: int = 1000, now=None, dry_run: bool = False) -> int:
+    """
+    Delete expired, unverified OTP codes in bounded batches
+
+    Each batch selects ids through the (expires_at, is_verified) index and
+    deletes them by primary key, so no statement touches more than
+    batch_size rows.
+
+    Returns:
+        int: Number of OTP rows deleted (or that would be deleted in dry-run)
+    """
+    now = now or timezone.now()
+    expired = PaymentOTP.objects.filter(expires_at__lt=now, is_verified=False).order_by('expires_at')
+
+    if dry_run:
+        return expired.count()
+
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        count, _ = PaymentOTP.objects.filter(id__in=ids).delete()
+        deleted += count
+    return deleted
+
+
+def cancel_stale_payments(
+    batch_size: int = 200,
+    workers: int = 8,
+    now=None,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """
+    Cancel pending payments older than PAYMENT_TIMEOUT_MINUTES
+
+    Their PaymentIntents are cancelled concurrently through the gateway first;
+    only payments whose intent was cancelled (or that never had one) are marked
+    cancelled. Intents that could not be cancelled, for example because 3DS
+    completed after all, stay pending for reconcile_payments to settle.
+
+    Returns:
+        dict: Counts of cancelled payments and intents that could not be cancelled
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=settings.PAYMENT_TIMEOUT_MINUTES)
+    stale = Payment.objects.filter(status='pending', created_at__lt=cutoff).order_by('id')
+    totals = {'cancelled': 0, 'skipped': 0}
+
+    if dry_run:
+        totals['cancelled'] = stale.count()
+        return totals
+
+    gateway = get_payment_gateway()
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(stale.filter(id__gt=last_id).values_list('id', 'stripe_payment_intent_id')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            with_intent = [(pid, intent_id) for pid, intent_id in batch if intent_id]
+            results = pool.map(
+                lambda intent_id: gateway.cancel_payment_intent(intent_id, reason='abandoned'),
+                [intent_id for _, intent_id in with_intent],
+            )
+            cancel_ids = [pid for pid, intent_id in batch if not intent_id]
+            for (pid, _), result in zip(with_intent, results):
+                if result.get('success'):
+                    cancel_ids.append(pid)
+                else:
+                    totals['skipped'] += 1
+
+            if cancel_ids:
+                # status='pending' guard keeps a concurrent OTP verification from being overwritten
+                totals['cancelled'] += Payment.objects.filter(id__in=cancel_ids, status='pending').update(
+                    status='cancelled', updated_at=timezone.now()
+                )
+    return totals
+
+
+def sweep(batch_size: int = 1000, workers: int = 8, dry_run: bool = False) -> Dict[str, int]:
+    """Run both sweeps and log a one-line summary"""
+    started = time.monotonic()
+    now = timezone.now()
+    otps = delete_expired_otps(batch_size=batch_size, now=now, dry_run=dry_run)
+    payments = cancel_stale_payments(batch_size=min(batch_size, 200), workers=workers, now=now, dry_run=dry_run)
+    result = {
+        'otps_deleted': otps,
+        'payments_cancelled': payments['cancelled'],
+        'intents_not_cancelled': payments['skipped'],
+    }
+    prefix = '[dry-run] ' if dry_run else ''
+    logger.info(
+        f'{prefix}Expiry sweep: {otps} OTP(s) deleted, {payments["cancelled"]} payment(s) cancelled, '
+        f'{payments["skipped"]} left for reconciliation ({time.monotonic() - started:.2f}s)'
+    )
+    return result
+
+
+SWEEPER_LOCK_KEY = 'payment_sweeper_lock'
+
+_sweeper_thread: Optional[threading.Thread] = None
+
+
+def sweep_unless_locked(lock_seconds: int) -> Optional[Dict[str, int]]:
+    """
+    Run sweep() unless another worker already swept in the last lock_seconds
+
+    The lock is a cache.add() that is left to expire, not released, so one
+    sweep runs per period across all workers sharing the cache.
+
+    Returns:
+        dict: The sweep() result, or None when another worker holds the lock
+    """
+    if not cache.add(SWEEPER_LOCK_KEY, 1, timeout=lock_seconds):
+        return None
+    return sweep()
+
+
+def start_periodic_sweeper(interval_seconds: int) -> None:
+    """
+    Run sweep() every interval_seconds in a daemon thread
+
+    Every worker process starts a thread, but a cache lock makes sure only one
+    of them sweeps per interval (when CACHES is shared between workers).
+    """
+    global _sweeper_thread
+    if _sweeper_thread is not None or interval_seconds <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                sweep_unless_locked(interval_seconds)
+            except Exception as e:
+                logger.error(f'Periodic expiry sweep failed: {e}', exc_info=True)
+            finally:
+                close_old_connections()
+
+    _sweeper_thread = threading.Thread(target=run, name='payment-expiry-sweeper', daemon=True)
+    _sweeper_thread.start()
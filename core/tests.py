@@ -1,3 +1,1541 @@
-from django.test import TestCase
+import importlib
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.apps import apps
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import db_limits, numbering, structured_logging
+from .checks import check_shared_cache
+from .circuit_breaker import UNAVAILABLE_RESULT, CircuitBreaker, circuit_guarded, get_breaker
+from .batch import BatchRunner
+from .benchmarks import EndpointBenchmark
+from .db_router import ReplicaRouter, begin_request, end_request, use_replica
+from .management.commands.reconcile_payments import Command as ReconcileCommand
+from .models import BatchCheckpoint, Course, NumberSequence, Payment, PaymentOTP, QueuedEmail, Registration, StudentCourseEnrollment
+from .numbering import allocate_invoice_number
+from .outbox import build_email, queue_emails, send_queued_emails
+from .student_import import import_students
+from .payment_gateway import PaymentGateway, get_payment_gateway
+from .query_log import report as query_report
+from .structured_logging import JSONFormatter, SamplingFilter
+from .sweeper import cancel_stale_payments, delete_expired_otps, sweep_unless_locked
+
+# Tables that grow with traffic; a filtered query must never read all of one
+HOT_TABLES = {
+    'core_registration',
+    'core_studentcourseenrollment',
+    'core_payment',
+    'core_paymentotp',
+    'core_paymentinvoice',
+    'core_queuedemail',
+}
+
+SEED_STUDENTS = 300
+
+
+# Checkout against the in-memory gateway, with mail kept in memory
+FAKE_CHECKOUT_SETTINGS = {
+    'PAYMENT_GATEWAY': 'core.fake_gateway.FakePaymentGateway',
+    'FAKE_PAYMENT_GATEWAY': {'LATENCY_MS': 0, 'DECLINE_RATE': 0, 'THREE_DS_RATE': 0},
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+class CheckoutMixin:
+    """Card checkout for self.student / self.enrollment; use with FAKE_CHECKOUT_SETTINGS"""
+
+    def checkout(self, **headers):
+        return self.client.post('/api/payment/create-and-send-otp/', json.dumps({
+            'student_id': self.student.id,
+            'enrollment_id': self.enrollment.id,
+            'payment_method_id': 'pm_card_visa',
+            'payment_amount': '100.00',
+            'tax_amount': '5.00',
+            'total_amount': '105.00',
+            'card_holder': self.student.name,
+            'card_type': 'visa',
+            'card_last_four': '4242',
+            'email': self.student.email,
+        }), content_type='application/json', **headers)
+
+    def use_temporary_media_root(self):
+        """verify-otp renders the invoice PDF into MEDIA_ROOT; keep it out of the project"""
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+def full_scans(sql):
+    """Return the hot tables the database would read in full to run `sql`
+
+    SQLite: EXPLAIN QUERY PLAN rows that SCAN a table (a SEARCH uses an index).
+    Postgres: Seq Scan nodes, with enable_seqscan off so that a seq scan only
+    shows up when no index can serve the query (small test tables would
+    otherwise always be scanned).
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans, nodes = [], [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                if node.get('Node Type') == 'Seq Scan':
+                    scans.append(node.get('Relation Name'))
+                nodes.extend(node.get('Plans', []))
+            return [table for table in scans if table in HOT_TABLES]
+
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        scans = []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            if detail.startswith('SCAN '):
+                scans.append(detail.split()[1])
+        return [table for table in scans if table in HOT_TABLES]
+
+
+@override_settings(**FAKE_CHECKOUT_SETTINGS)
+class QueryPlanTests(CheckoutMixin, TestCase):
+    """EXPLAIN every query the hot views run and fail on full scans of growing tables
+
+    Runs on whichever database is configured, so the same tests check both
+    the SQLite and the Postgres plans. Unfiltered listings (no WHERE clause)
+    read the whole table by design and are not checked.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        courses = [
+            Course.objects.create(course_name=f'Course {code}', course_code=code, price_cad=Decimal('1000.00'))
+            for code in ('OEC', 'BRIDGE', 'ADV')
+        ]
+        registrations = Registration.objects.bulk_create([
+            Registration(
+                name=f'Student {i}',
+                email=f'student{i}@example.com',
+                contact='555-0100',
+                registration_number=f'ON26-{100000 + i}',
+                student_password=f'pw{i:08d}',
+            )
+            for i in range(SEED_STUDENTS)
+        ])
+        enrollments = StudentCourseEnrollment.objects.bulk_create([
+            StudentCourseEnrollment(registration=registration, course=course, course_name=course.course_name)
+            for registration in registrations
+            for course in courses[:2]
+        ])
+        statuses = ['completed', 'pending', 'failed', 'cancelled']
+        Payment.objects.bulk_create([
+            Payment(
+                registration=enrollment.registration,
+                enrollment=enrollment,
+                student_id=enrollment.registration.registration_number,
+                course_name=enrollment.course_name,
+                total_price_cad=Decimal('1000.00'),
+                payment_amount_cad=Decimal('100.00'),
+                final_amount_cad=Decimal('105.00'),
+                status=statuses[(enrollment.id + n) % len(statuses)],
+                invoice_number=f'INV-SEED-{enrollment.id}-{n}',
+            )
+            for enrollment in enrollments
+            for n in range(2)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.student = registrations[SEED_STUDENTS // 2]
+        cls.enrollment = StudentCourseEnrollment.objects.filter(registration=cls.student).first()
+
+    def setUp(self):
+        self.use_temporary_media_root()
+
+    def assertNoFullScans(self, captured):
+        failures = []
+        for query in captured:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')) or ' WHERE ' not in sql.upper():
+                continue
+            tables = full_scans(sql)
+            if tables:
+                failures.append(f'{", ".join(tables)}: {sql}')
+        self.assertFalse(failures, 'Full table scans:\n' + '\n'.join(failures))
+
+    def test_payment_portal_pages(self):
+        student, enrollment = self.student, self.enrollment
+        with CaptureQueriesContext(connection) as captured:
+            for student_id in (student.registration_number, student.email, str(student.id)):
+                self.client.post(
+                    '/api/payment/verify-student/', json.dumps({'student_id': student_id}), content_type='application/json'
+                )
+            self.client.get(f'/api/payment/select-course/{student.id}/')
+            self.client.get(f'/api/payment/amount/{student.id}/?enrollment_id={enrollment.id}')
+            self.client.get(f'/api/payment/summary/{student.id}/?enrollment_id={enrollment.id}&amount=100&tax=5&total=105')
+        self.assertNoFullScans(captured.captured_queries)
+
+    def test_student_dashboard(self):
+        session = self.client.session
+        session['student_id'] = self.student.id
+        session.save()
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(f'/api/student/dashboard/{self.student.id}/')
+            self.client.get(f'/api/student/dashboard/{self.student.id}/?course=Course+OEC&status=completed')
+        self.assertNoFullScans(captured.captured_queries)
+
+    def test_register_existing_student(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post('/api/register/', {
+                'name': self.student.name,
+                'email': self.student.email.upper(),
+                'contact': self.student.contact,
+                'course': 'Course OEC',
+                'hasQualification': 'no',
+            })
+        self.assertNoFullScans(captured.captured_queries)
+
+    def test_admin_payment_list(self):
+        staff = User.objects.create_user('staff', password='unused', is_staff=True)
+        self.client.force_login(staff)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/api/admin/payments/')
+        self.assertNoFullScans(captured.captured_queries)
+
+    def test_checkout(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.checkout()
+            payment_id = response.json()['payment_id']
+            otp = PaymentOTP.objects.get(payment_id=payment_id)
+            self.client.post(
+                '/api/payment/verify-otp/',
+                json.dumps({'payment_id': payment_id, 'otp_code': otp.otp_code}),
+                content_type='application/json',
+            )
+        self.assertEqual(Payment.objects.get(id=payment_id).status, 'completed')
+        self.assertNoFullScans(captured.captured_queries)
+
+    def test_sweeper(self):
+        with CaptureQueriesContext(connection) as captured:
+            delete_expired_otps(now=timezone.now())
+            cancel_stale_payments(now=timezone.now(), workers=1)
+        self.assertNoFullScans(captured.captured_queries)
+
+
+class ReplicaRouterTests(TestCase):
+    """Routing decisions; end to end, point SQLITE_REPLICA_PATH at a copy of db.sqlite3"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.tokens = begin_request()
+        self.addCleanup(end_request, self.tokens)
+
+    def test_no_replica_configured(self):
+        with use_replica():
+            self.assertIsNone(self.router.db_for_read(Registration))
+
+    @mock.patch('core.db_router.replica_configured', return_value=True)
+    def test_reads_go_to_replica_only_when_allowed(self, _configured):
+        self.assertEqual(self.router.db_for_read(Registration), 'default')
+        with use_replica():
+            self.assertEqual(self.router.db_for_read(Registration), 'replica')
+
+    @mock.patch('core.db_router.replica_configured', return_value=True)
+    def test_write_pins_request_to_primary(self, _configured):
+        with use_replica():
+            self.assertEqual(self.router.db_for_write(Registration), 'default')
+            self.assertEqual(self.router.db_for_read(Registration), 'default')
+
+
+@override_settings(**FAKE_CHECKOUT_SETTINGS)
+class EndpointBenchmarkTests(CheckoutMixin, TestCase):
+    """One request per scenario, so the benchmark suite keeps working as the views change"""
+
+    def test_every_scenario_succeeds(self):
+        benchmark = EndpointBenchmark(students=20, iterations=1, warmup=0, memory_iterations=1)
+        self.use_temporary_media_root()
+        results = benchmark.run()
+        self.assertEqual(set(results), {name for name, _, _ in benchmark.scenarios()})
+        for name, result in results.items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertGreater(result['queries_median'], 0, name)
+
+
+@override_settings(
+    **FAKE_CHECKOUT_SETTINGS,
+    REQUEST_TIMING_ENABLED=True,
+)
+class RequestTimingTests(CheckoutMixin, TestCase):
+    """Server-Timing breakdown for staff; nothing exposed to students"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course OEC', course_code='OEC', price_cad=Decimal('1000.00'))
+        cls.student = Registration.objects.create(name='Student', email='student@example.com', contact='555-0100')
+        cls.enrollment = StudentCourseEnrollment.objects.create(
+            registration=cls.student, course=course, course_name=course.course_name
+        )
+        cls.staff = User.objects.create_user('staff', password='unused', is_staff=True)
+
+    def test_staff_response_breaks_down_time(self):
+        self.client.force_login(self.staff)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        categories = [part.split(';')[0].strip() for part in response['Server-Timing'].split(',')]
+        for category in ('db', 'stripe', 'email', 'total'):
+            self.assertIn(category, categories)
+
+    def test_no_header_for_students(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_TIMING_ENABLED=False)
+    def test_disabled(self):
+        self.client.force_login(self.staff)
+        self.assertNotIn('Server-Timing', self.checkout())
+
+
+@override_settings(
+    **FAKE_CHECKOUT_SETTINGS,
+    METRICS_ENABLED=True,
+    METRICS_DIR='',
+)
+class MetricsEndpointTests(CheckoutMixin, TestCase):
+    """/metrics: access control, exposition format, and merging other workers' files"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course MET', course_code='MET', price_cad=Decimal('1000.00'))
+        cls.student = Registration.objects.create(name='Student', email='metrics@example.com', contact='555-0100')
+        cls.enrollment = StudentCourseEnrollment.objects.create(
+            registration=cls.student, course=course, course_name=course.course_name
+        )
+        cls.staff = User.objects.create_user('metrics-staff', password='unused', is_staff=True)
+
+    def setUp(self):
+        self.use_temporary_media_root()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_anonymous_forbidden(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_allowed_ip(self):
+        self.scrape()
+
+    def test_checkout_is_measured(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        self.client.post('/api/payment/verify-otp/', json.dumps({
+            'payment_id': response.json()['payment_id'], 'otp_code': '000000',
+        }), content_type='application/json')
+
+        self.client.force_login(self.staff)
+        text = self.scrape()
+        for expected in (
+            'oncoone_http_request_duration_seconds_bucket{method="POST",status="200",view="api-create-payment-otp",le="+Inf"}',
+            'oncoone_db_queries_total{view="api-create-payment-otp"}',
+            'oncoone_stripe_call_duration_seconds_count{method="create_payment_intent"}',
+            'oncoone_email_send_duration_seconds_count ',
+            'oncoone_otp_verifications_total{outcome="invalid"}',
+            'oncoone_email_queue_depth{status="pending"} 0',
+        ):
+            self.assertIn(expected, text)
+
+    def test_merges_other_processes(self):
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with open(os.path.join(metrics_dir, 'metrics-999999.json'), 'w') as f:
+                json.dump({
+                    'counters': [['oncoone_otp_verifications_total', [['outcome', 'other_worker']], 7]],
+                    'histograms': [],
+                }, f)
+            with override_settings(METRICS_DIR=metrics_dir):
+                self.client.force_login(self.staff)
+                text = self.scrape()
+                self.assertTrue(os.path.exists(os.path.join(metrics_dir, f'metrics-{os.getpid()}.json')))
+        self.assertIn('oncoone_otp_verifications_total{outcome="other_worker"} 7\n', text)
+
+
+@override_settings(
+    **FAKE_CHECKOUT_SETTINGS,
+    TRACING_EXPORTER='file',
+    TRACING_SAMPLE_RATE=1.0,
+    TRACING_SLOW_MS=0,
+)
+class TracingTests(CheckoutMixin, TestCase):
+    """Checkout traces exported as OTLP/JSON, tagged with the payment and enrollment"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course TRC', course_code='TRC', price_cad=Decimal('1000.00'))
+        cls.student = Registration.objects.create(name='Student', email='tracing@example.com', contact='555-0100')
+        cls.enrollment = StudentCourseEnrollment.objects.create(
+            registration=cls.student, course=course, course_name=course.course_name
+        )
+
+    def setUp(self):
+        trace_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(trace_dir.cleanup)
+        self.trace_file = os.path.join(trace_dir.name, 'traces.jsonl')
+        settings_override = self.settings(TRACING_FILE=self.trace_file)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def exported_spans(self):
+        if not os.path.exists(self.trace_file):
+            return []
+        with open(self.trace_file) as f:
+            return [
+                span
+                for line in f
+                for resource in json.loads(line)['resourceSpans']
+                for scope in resource['scopeSpans']
+                for span in scope['spans']
+            ]
+
+    def test_checkout_trace(self):
+        payment_id = self.checkout().json()['payment_id']
+        spans = self.exported_spans()
+        names = {span['name'] for span in spans}
+        for expected in ('POST api-create-payment-otp', 'db.query', 'stripe.create_payment_intent', 'smtp.send'):
+            self.assertIn(expected, names)
+        self.assertEqual(len({span['traceId'] for span in spans}), 1)
+        for span in spans:
+            attributes = {attribute['key']: attribute['value'] for attribute in span['attributes']}
+            self.assertEqual(attributes['payment.id'], {'intValue': str(payment_id)})
+            self.assertEqual(attributes['enrollment.id'], {'intValue': str(self.enrollment.id)})
+
+    def test_continues_traceparent(self):
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        self.checkout(HTTP_TRACEPARENT=f'00-{trace_id}-00f067aa0ba902b7-01')
+        root = next(span for span in self.exported_spans() if span['name'] == 'POST api-create-payment-otp')
+        self.assertEqual(root['traceId'], trace_id)
+        self.assertEqual(root['parentSpanId'], '00f067aa0ba902b7')
+
+    def test_not_sampled(self):
+        with self.settings(TRACING_SAMPLE_RATE=0.0):
+            self.checkout()
+        self.checkout(HTTP_TRACEPARENT='00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00')
+        self.assertEqual(self.exported_spans(), [])
+
+
+class StructuredLoggingTests(TestCase):
+    """JSON records with secrets stripped, and per-logger sampling of INFO lines"""
+
+    def record(self, message, level=logging.INFO, name='core.payment', **extra):
+        record = logging.LogRecord(name, level, __file__, 1, message, None, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_redacts_secrets(self):
+        line = JSONFormatter().format(self.record(
+            'DB OTP Code: 123456 | Entered=654321 | secret pi_3Ab_secret_Xy9 | OTP CODE: 111222', payment_id=5,
+        ))
+        entry = json.loads(line)
+        self.assertEqual(entry['logger'], 'core.payment')
+        self.assertEqual(entry['payment_id'], 5)
+        for secret in ('123456', '654321', 'Xy9', '111222'):
+            self.assertNotIn(secret, line)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_queue_listener_restarts_after_fork(self):
+        logger = logging.getLogger('core.security')
+        if structured_logging._listener is None or not hasattr(logger, '_queued_handlers'):
+            self.skipTest('LOG_QUEUE_ENABLED is off')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'child.log')
+            handler = logging.FileHandler(path)
+            logger._queued_handlers.append(handler)
+            try:
+                parent = (structured_logging._lock, structured_logging._listener.queue)
+                pid = os.fork()
+                if pid == 0:  # pragma: no cover - child process
+                    fresh = (structured_logging._lock, structured_logging._listener.queue)
+                    logger.warning('written by the child')
+                    structured_logging.stop_queue_listener()
+                    os._exit(0 if all(new is not old for new, old in zip(fresh, parent)) else 1)
+                _, status = os.waitpid(pid, 0)
+            finally:
+                logger._queued_handlers.remove(handler)
+                handler.close()
+            self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+            with open(path) as log_file:
+                self.assertIn('written by the child', log_file.read())
+
+    def test_sampling(self):
+        sampler = SamplingFilter('core.payment=0, core=1')
+        self.assertFalse(sampler.filter(self.record('busy')))
+        self.assertTrue(sampler.filter(self.record('kept', level=logging.WARNING)))
+        self.assertTrue(sampler.filter(self.record('other', name='core.security')))
+
+
+@override_settings(QUERY_LOG_ENABLED=True, QUERY_LOG_N_PLUS_ONE_THRESHOLD=5, QUERY_LOG_SLOW_MS=10000)
+class QueryLogTests(TestCase):
+    """Slow-query and N+1 records with the core call site, and the staff report built from them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course QLG', course_code='QLG', price_cad=Decimal('1000.00'))
+        for n in range(6):
+            registration = Registration.objects.create(name=f'Student {n}', email=f'qlog{n}@example.com', contact='555-0100')
+            StudentCourseEnrollment.objects.create(registration=registration, course=course, course_name=course.course_name)
+        cls.staff = User.objects.create_user('query-staff', password='unused', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_n_plus_one_attributed_to_view(self):
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            self.assertEqual(self.client.get('/api/admin/registrations/').status_code, 200)
+        records = [record for record in logs.records if record.kind == 'n_plus_one']
+        self.assertTrue(records)
+        for record in records:
+            self.assertEqual(record.view, 'admin-registrations-list')
+            self.assertRegex(record.call_site, r'^core/views\.py:\d+ in registrations_list$')
+            self.assertGreaterEqual(record.count, 5)
+
+    @override_settings(QUERY_LOG_SLOW_MS=0, QUERY_LOG_EXPLAIN=True)
+    def test_slow_query_explained(self):
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            self.client.get('/api/admin/registrations/')
+        slow = [record for record in logs.records if record.kind == 'slow' and record.sql.startswith('SELECT')]
+        self.assertTrue(slow)
+        self.assertTrue(all(record.explain and 'failed' not in record.explain for record in slow))
+
+    def test_report(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as f:
+            self.addCleanup(os.unlink, f.name)
+            for duration in (120.0, 300.0):
+                f.write(json.dumps({
+                    'kind': 'slow', 'view': 'admin-payments-list', 'call_site': 'core/views.py:1 in x',
+                    'sql': 'SELECT 1 WHERE id IN (%s, %s)', 'duration_ms': duration, 'explain': f'plan {duration}',
+                }) + '\n')
+        rows = query_report(f.name)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['occurrences'], rows[0]['max_ms'], rows[0]['explain']), (2, 300.0, 'plan 300.0'))
+
+        with self.settings(QUERY_LOG_FILE=f.name):
+            self.assertEqual(len(self.client.get('/api/admin/query-report/?format=json').json()['rows']), 1)
+            self.assertContains(self.client.get('/api/admin/query-report/'), 'core/views.py:1 in x')
+            self.client.logout()
+            self.assertEqual(self.client.get('/api/admin/query-report/').status_code, 302)
+
+
+class RequestProfilerTests(TestCase):
+    """Staff-only on-demand profiles, saved and downloadable"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('profile-staff', password='unused', is_staff=True)
+
+    def setUp(self):
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        settings_override = self.settings(PROFILER_DIR=profile_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_staff_profile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/admin/registrations/', HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+        collapsed = self.client.get(f'/api/admin/profiles/{profile_id}/collapsed/')
+        self.assertIn(b'registrations_list (core/views.py:', collapsed.content)
+        self.assertIn(b'Peak traced memory', self.client.get(f'/api/admin/profiles/{profile_id}/alloc/').content)
+        self.assertEqual(self.client.get(f'/api/admin/profiles/{profile_id}/prof/').status_code, 200)
+        self.assertEqual(self.client.get('/api/admin/profiles/..%2Fsecret/alloc/').status_code, 404)
+
+    def test_ignored_for_others(self):
+        response = self.client.get('/api/payment/?_profile=sample')
+        self.assertNotIn('X-Profile-Id', response)
+
+
+# Stopped by the statement timeout long before it could count this far
+RUNAWAY_QUERY = (
+    'WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n LIMIT 1000000000) '
+    'SELECT COUNT(*) FROM n'
+)
+
+
+class DatabaseLimitsTests(TestCase):
+    """Per-class statement timeouts and query budgets"""
+
+    LIMITS = {
+        'portal': {'STATEMENT_TIMEOUT_MS': 50, 'QUERY_BUDGET': 100},
+        'staff': {'STATEMENT_TIMEOUT_MS': 15000, 'QUERY_BUDGET': 3},
+        'export': {'STATEMENT_TIMEOUT_MS': 120000, 'QUERY_BUDGET': None},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course DBL', course_code='DBL', price_cad=Decimal('500.00'))
+        for n in range(4):
+            registration = Registration.objects.create(name=f'Student {n}', email=f'dbl{n}@example.com', contact='555-0100')
+            StudentCourseEnrollment.objects.create(registration=registration, course=course, course_name=course.course_name)
+        cls.staff = User.objects.create_user('limits-staff', password='unused', is_staff=True)
+
+    def setUp(self):
+        settings_override = self.settings(DB_LIMIT_CLASSES=self.LIMITS)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_classes(self):
+        self.assertEqual(db_limits.class_for_path('/api/admin/payments/'), 'staff')
+        self.assertEqual(db_limits.class_for_path('/api/payment/summary/1/'), 'portal')
+        from . import views
+        self.assertEqual(views.admin_import_students.db_limit_class, 'export')
+
+    def test_budget_logged(self):
+        self.client.force_login(self.staff)
+        with self.assertLogs('core.performance', 'WARNING') as logs:
+            self.assertEqual(self.client.get('/api/admin/registrations/').status_code, 200)
+        self.assertTrue(any(
+            'Query budget exceeded: admin-registrations-list' in line and '(budget 3, class staff)' in line
+            for line in logs.output
+        ))
+
+    @override_settings(DB_QUERY_BUDGET_ACTION='raise')
+    def test_budget_raises(self):
+        self.client.force_login(self.staff)
+        with self.assertRaises(db_limits.QueryBudgetExceeded):
+            self.client.get('/api/admin/registrations/')
+
+    def test_timeout_through_view(self):
+        def runaway(*args, **kwargs):
+            with connection.cursor() as cursor:
+                cursor.execute(RUNAWAY_QUERY)
+
+        # payment_verify_student catches the OperationalError and answers 500 itself
+        with mock.patch('core.views.Registration.objects.filter', side_effect=runaway), \
+                self.assertLogs('core.performance', 'WARNING') as logs:
+            response = self.client.post(
+                '/api/payment/verify-student/', json.dumps({'student_id': 'ON26-123456'}), content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['error_type'], 'statement_timeout')
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertTrue(any('Statement cancelled after 50ms in api-payment-verify-student' in line for line in logs.output))
+
+    def test_postgres_timeout_survives_rollback(self):
+        executed = []
+        cursor = mock.Mock()
+        cursor.cursor.execute.side_effect = executed.append
+        postgres = mock.Mock(vendor='postgresql', alias='default', in_atomic_block=True)
+        context = {'connection': postgres, 'cursor': cursor}
+        execute = mock.Mock(return_value=None)
+        token = db_limits.start_request('/api/payment/')
+        self.addCleanup(db_limits.end_request, token)
+
+        # Inside atomic() the SET could be rolled back, so it is repeated per statement
+        db_limits.execute_wrapper(execute, 'SELECT 1', None, False, context)
+        db_limits.execute_wrapper(execute, 'SELECT 2', None, False, context)
+        self.assertEqual(executed, ['SET statement_timeout = 50'] * 2)
+
+        # Once SET in autocommit it lasts for the session
+        postgres.in_atomic_block = False
+        db_limits.execute_wrapper(execute, 'SELECT 3', None, False, context)
+        postgres.in_atomic_block = True
+        db_limits.execute_wrapper(execute, 'SELECT 4', None, False, context)
+        self.assertEqual(executed, ['SET statement_timeout = 50'] * 3)
+        self.assertEqual(execute.call_count, 4)
+
+    def test_statement_timeout(self):
+        from .middleware import DatabaseLimitsMiddleware
+
+        token = db_limits.start_request('/api/payment/')
+        try:
+            with self.assertLogs('core.performance', 'WARNING'), connection.execute_wrapper(db_limits.execute_wrapper):
+                with self.assertRaises(OperationalError) as raised, connection.cursor() as cursor:
+                    cursor.execute(RUNAWAY_QUERY)
+            self.assertTrue(db_limits.current().timed_out)
+            response = DatabaseLimitsMiddleware(None).process_exception(RequestFactory().get('/api/payment/'), raised.exception)
+            self.assertEqual(response.status_code, 503)
+        finally:
+            db_limits.end_request(token)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')  # The connection is still usable
+
+
+@override_settings(**FAKE_CHECKOUT_SETTINGS)
+class ReconcilePaymentsTests(TestCase):
+    """reconcile_payments settles pending payments from their intents, without overwriting a concurrent completion"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course REC', course_code='REC', price_cad=Decimal('1000.00'))
+        cls.student = Registration.objects.create(name='Student', email='reconcile@example.com', contact='555-0100')
+        cls.enrollment = StudentCourseEnrollment.objects.create(
+            registration=cls.student, course=course, course_name=course.course_name
+        )
+
+    def pending_payment(self, payment_method_id='pm_card_visa'):
+        intent = get_payment_gateway().create_payment_intent(
+            Decimal('105.00'), self.student.email, self.student.name, 'Course REC', payment_method_id=payment_method_id,
+        )
+        return Payment.objects.create(
+            registration=self.student,
+            enrollment=self.enrollment,
+            student_id=self.student.registration_number,
+            course_name='Course REC',
+            total_price_cad=Decimal('1000.00'),
+            payment_amount_cad=Decimal('100.00'),
+            final_amount_cad=Decimal('105.00'),
+            status='pending',
+            stripe_payment_intent_id=intent['payment_intent_id'],
+        )
+
+    def reconcile(self, *args):
+        call_command('reconcile_payments', '--older-than-minutes', '0', '--workers', '1', *args, stdout=StringIO())
+
+    def test_settles_resolved_intents(self):
+        gateway = get_payment_gateway()
+        succeeded = self.pending_payment()
+        gateway.confirm_payment(succeeded.stripe_payment_intent_id)
+        declined = self.pending_payment('pm_card_chargeDeclined')
+        gateway.confirm_payment(declined.stripe_payment_intent_id)
+        cancelled = self.pending_payment()
+        gateway.cancel_payment_intent(cancelled.stripe_payment_intent_id)
+        in_progress = self.pending_payment()
+
+        self.reconcile()
+
+        succeeded.refresh_from_db()
+        self.assertEqual(succeeded.status, 'completed')
+        self.assertIsNotNone(succeeded.completed_at)
+        self.assertTrue(succeeded.stripe_charge_id.startswith('ch_fake_'))
+        self.assertRegex(succeeded.invoice_number, r'^INV-\d{4}-\d{6}$')
+        self.assertEqual(Payment.objects.get(id=declined.id).status, 'failed')
+        self.assertEqual(Payment.objects.get(id=cancelled.id).status, 'cancelled')
+        in_progress.refresh_from_db()
+        self.assertEqual((in_progress.status, in_progress.invoice_number), ('pending', None))
+
+    def test_dry_run_changes_nothing(self):
+        payment = self.pending_payment()
+        get_payment_gateway().confirm_payment(payment.stripe_payment_intent_id)
+        self.reconcile('--dry-run')
+        self.assertEqual(Payment.objects.get(id=payment.id).status, 'pending')
+
+    def test_concurrent_completion_left_alone(self):
+        payment = self.pending_payment()
+        # OTP verification completed it after the gateway lookup, before the batch was written
+        Payment.objects.filter(id=payment.id).update(status='completed', invoice_number='INV-2026-000042')
+        totals = {'completed': 0, 'cancelled': 0, 'failed': 0, 'unchanged': 0}
+        ReconcileCommand()._apply({payment.id: ('completed', 'ch_other')}, totals)
+        payment.refresh_from_db()
+        self.assertEqual((payment.invoice_number, payment.stripe_charge_id), ('INV-2026-000042', None))
+        self.assertEqual(totals['unchanged'], 1)
+        self.assertEqual(totals['completed'], 0)
+
+
+class MergeDuplicateStudentsTests(TestCase):
+    """merge_duplicate_students folds registrations whose emails differ only in case or whitespace into the oldest"""
+
+    def setUp(self):
+        self.oec = Course.objects.create(course_name='Course OEC', course_code='MOEC', price_cad=Decimal('1000.00'))
+        self.bridge = Course.objects.create(course_name='Course BRIDGE', course_code='MBRG', price_cad=Decimal('800.00'))
+        self.kept = Registration.objects.create(name='Student', email='dup@example.com', contact='555-0100')
+        self.duplicate = Registration.objects.create(name='Student', email='other@example.com', contact='555-0100')
+        # Stored before emails were normalized on save
+        Registration.objects.filter(id=self.duplicate.id).update(email='  Dup@Example.COM ')
+        self.duplicate.refresh_from_db()
+
+        self.kept_oec = StudentCourseEnrollment.objects.create(
+            registration=self.kept, course=self.oec, course_name='Course OEC'
+        )
+        self.duplicate_oec = StudentCourseEnrollment.objects.create(
+            registration=self.duplicate, course=self.oec, course_name='Course OEC'
+        )
+        self.duplicate_bridge = StudentCourseEnrollment.objects.create(
+            registration=self.duplicate, course=self.bridge, course_name='Course BRIDGE'
+        )
+        self.payment = Payment.objects.create(
+            registration=self.duplicate,
+            enrollment=self.duplicate_oec,
+            student_id=self.duplicate.registration_number,
+            course_name='Course OEC',
+            total_price_cad=Decimal('1000.00'),
+            payment_amount_cad=Decimal('100.00'),
+            final_amount_cad=Decimal('105.00'),
+            status='completed',
+        )
+
+    def merge(self, *args):
+        out = StringIO()
+        call_command('merge_duplicate_students', '--noinput', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        output = self.merge('--dry-run')
+        self.assertIn('dup@example.com: 2 registrations, keeping id', output)
+        self.assertEqual(Registration.objects.count(), 2)
+        self.assertEqual(StudentCourseEnrollment.objects.filter(registration=self.duplicate).count(), 2)
+        self.assertEqual(Payment.objects.get(id=self.payment.id).registration_id, self.duplicate.id)
+
+    def test_merges_into_oldest(self):
+        self.merge()
+        self.assertEqual(list(Registration.objects.values_list('id', flat=True)), [self.kept.id])
+
+        # Same course: folded into the kept enrollment; other course: moved over
+        self.assertFalse(StudentCourseEnrollment.objects.filter(id=self.duplicate_oec.id).exists())
+        self.assertEqual(StudentCourseEnrollment.objects.get(id=self.duplicate_bridge.id).registration_id, self.kept.id)
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.registration_id, self.kept.id)
+        self.assertEqual(self.payment.enrollment_id, self.kept_oec.id)
+        self.assertEqual(self.payment.student_id, self.kept.registration_number)
+
+        # Nothing left to merge on a second run
+        self.assertIn('Groups: 0', self.merge())
+
+
+class InvoiceNumberTests(TestCase):
+    """Invoice numbers are INV-YYYY-NNNNNN, unique, and allocated without DDL"""
+
+    def test_unique_and_formatted(self):
+        year = timezone.now().year
+        with CaptureQueriesContext(connection) as captured:
+            numbers = [allocate_invoice_number() for _ in range(50)]
+        self.assertEqual(len(set(numbers)), 50)
+        for number in numbers:
+            self.assertRegex(number, rf'^INV-{year}-\d{{6}}$')
+        self.assertFalse([query for query in captured if 'CREATE' in query['sql'].upper()])
+
+    def test_create_sequences_command(self):
+        out = StringIO()
+        call_command('create_number_sequences', '2030', stdout=out)
+        self.assertIn('core_seq_invoice_2030', out.getvalue())
+
+
+class RegistrationNumberTests(TestCase):
+    """Keyed permutation of the per-year counter: a bijection, with the key stored on the counter"""
+
+    def test_permutation_is_bijection(self):
+        # The same Feistel + cycle-walking construction, shrunk so the whole range can be checked
+        with mock.patch.object(numbering, '_HALF_BITS', 6), mock.patch.object(numbering, '_HALF_MASK', 63), \
+                mock.patch.object(numbering, 'REGISTRATION_NUMBER_CAPACITY', 3000):
+            values = [numbering.permute(index, b'key') for index in range(3000)]
+        self.assertEqual(sorted(values), list(range(3000)))
+
+    def test_permutation_in_range(self):
+        values = {numbering.permute(index, b'key') for index in range(20000)}
+        self.assertEqual(len(values), 20000)
+        self.assertTrue(all(0 <= value < numbering.REGISTRATION_NUMBER_CAPACITY for value in values))
+
+    def test_allocation_unique(self):
+        year_suffix = str(timezone.now().year)[-2:]
+        allocated = numbering.allocate_registration_numbers(500) + numbering.allocate_registration_numbers(1)
+        self.assertEqual(len(set(allocated)), 501)
+        for number in allocated:
+            self.assertRegex(number, rf'^ON{year_suffix}-[1-9]\d{{5}}$')
+
+    def test_key_survives_secret_rotation(self):
+        first = numbering.allocate_registration_numbers(1)[0]
+        NumberSequence.objects.filter(name__startswith='registration_number:').update(value=0)
+        with self.settings(SECRET_KEY='rotated-secret-key'):
+            self.assertEqual(numbering.allocate_registration_numbers(1)[0], first)
+
+
+@override_settings(**FAKE_CHECKOUT_SETTINGS)
+class PendingPaymentReuseTests(CheckoutMixin, TestCase):
+    """A retried checkout reuses its pending payment and intent; resend rotates the OTP code"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course RSD', course_code='RSD', price_cad=Decimal('1000.00'))
+        cls.student = Registration.objects.create(name='Student', email='resend@example.com', contact='555-0100')
+        cls.enrollment = StudentCourseEnrollment.objects.create(
+            registration=cls.student, course=course, course_name=course.course_name
+        )
+
+    def setUp(self):
+        # Resend cooldowns and lockouts live in the cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def resend(self, payment_id):
+        return self.client.post(
+            '/api/payment/resend-otp/', json.dumps({'payment_id': payment_id}), content_type='application/json'
+        )
+
+    def test_retry_reuses_payment_and_intent(self):
+        first = self.checkout().json()
+        payment = Payment.objects.get(id=first['payment_id'])
+        second = self.checkout().json()
+        self.assertEqual(second['payment_id'], payment.id)
+        self.assertTrue(second['reused'])
+        self.assertEqual(Payment.objects.filter(enrollment=self.enrollment).count(), 1)
+        self.assertEqual(Payment.objects.get(id=payment.id).stripe_payment_intent_id, payment.stripe_payment_intent_id)
+
+    def test_resend_rotates_code(self):
+        payment_id = self.checkout().json()['payment_id']
+        old_code = PaymentOTP.objects.get(payment_id=payment_id).otp_code
+        with mock.patch('core.views.OTPSecurityManager.generate_otp_code', return_value='654321'):
+            response = self.resend(payment_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['email_sent'])
+        self.assertNotEqual(old_code, '654321')
+        self.assertEqual(PaymentOTP.objects.get(payment_id=payment_id).otp_code, '654321')
+
+    def test_resend_cooldown(self):
+        payment_id = self.checkout().json()['payment_id']
+        self.assertEqual(self.resend(payment_id).status_code, 200)
+        self.assertEqual(self.resend(payment_id).status_code, 429)
+
+    def test_otp_codes_not_logged(self):
+        self.use_temporary_media_root()
+        payment_id = self.checkout().json()['payment_id']
+        code = PaymentOTP.objects.get(payment_id=payment_id).otp_code
+        wrong = '000000' if code != '000000' else '111111'
+        with self.assertLogs('core.payment', level='INFO') as logs:
+            for attempt in (wrong, code):
+                self.client.post('/api/payment/verify-otp/', json.dumps({
+                    'payment_id': payment_id, 'otp_code': attempt,
+                }), content_type='application/json')
+        # Raw messages, before any formatter's redaction
+        messages = [record.getMessage() for record in logs.records]
+        self.assertTrue(any('OTP Verification Result' in message for message in messages))
+        for message in messages:
+            self.assertNotIn(code, message)
+            self.assertNotIn(wrong, message)
+
+    def test_recheckout_keeps_failed_attempts(self):
+        payment_id = self.checkout().json()['payment_id']
+        max_attempts = settings.OTP_MAX_ATTEMPTS
+
+        def guess():
+            otp = PaymentOTP.objects.get(payment_id=payment_id)
+            wrong = '000000' if otp.otp_code != '000000' else '111111'
+            return self.client.post('/api/payment/verify-otp/', json.dumps({
+                'payment_id': payment_id, 'otp_code': wrong,
+            }), content_type='application/json')
+
+        for _ in range(max_attempts - 1):
+            self.assertEqual(guess().status_code, 400)
+        # A retried checkout rotates the code but not the attempt count
+        self.assertEqual(self.checkout().json()['payment_id'], payment_id)
+        self.assertEqual(PaymentOTP.objects.get(payment_id=payment_id).attempts, max_attempts - 1)
+
+        self.assertEqual(guess().status_code, 400)
+        self.assertEqual(guess().status_code, 429)
+        self.assertNotEqual(self.checkout().json()['payment_id'], payment_id)
+
+    def test_resend_after_expiry(self):
+        payment_id = self.checkout().json()['payment_id']
+        expired = timezone.now() - timedelta(minutes=settings.PAYMENT_TIMEOUT_MINUTES + 1)
+        Payment.objects.filter(id=payment_id).update(created_at=expired)
+        self.assertEqual(self.resend(payment_id).status_code, 410)
+
+
+@override_settings(CIRCUIT_BREAKER={
+    'ENABLED': True, 'FAILURE_RATE': 0.5, 'MIN_CALLS': 4, 'SLOW_CALL_MS': 1000, 'WINDOW_SECONDS': 60, 'OPEN_SECONDS': 30,
+})
+class CircuitBreakerTests(TestCase):
+    """closed -> open -> half-open -> closed (or open again), all within one counting bucket"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Start of a bucket, so the whole test stays inside it
+        self.now = (int(time.time()) // 60) * 60 + 1.0
+        clock = mock.patch('core.circuit_breaker.time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = get_breaker('test_operation')
+
+    def trip(self):
+        for _ in range(4):
+            self.breaker.record_failure(10)
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.record_success(10)
+        self.breaker.record_failure(10)
+        self.breaker.record_failure(10)
+        self.assertEqual(self.breaker.state(), 'closed')
+        self.breaker.record_success(2000)  # Slow: counts as a failure
+        self.assertEqual(self.breaker.state(), 'open')
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_guarded_call_rejected_while_open(self):
+        calls = []
+        guarded = circuit_guarded('test_operation')(lambda: calls.append(1) or {'success': True})
+        self.trip()
+        self.assertEqual(guarded(), UNAVAILABLE_RESULT)
+        self.assertEqual(calls, [])
+
+    def test_half_open_allows_one_probe(self):
+        self.trip()
+        self.now += 31
+        self.assertEqual(self.breaker.state(), 'half_open')
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        self.trip()
+        self.now += 31
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure(10)
+        self.assertEqual(self.breaker.state(), 'open')
+
+    def test_successful_probe_closes_with_fresh_counts(self):
+        self.trip()
+        self.now += 31
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success(10)
+        self.assertEqual(self.breaker.state(), 'closed')
+        # Same bucket as the failures that opened it; one more failure must not re-open
+        self.breaker.record_failure(10)
+        self.assertEqual(self.breaker.state(), 'closed')
+        self.assertTrue(self.breaker.allow_request())
+
+
+    def test_state_shared_through_cache(self):
+        # Two workers' breakers for the same operation: one trips, both are open
+        worker_a, worker_b = CircuitBreaker('test_operation'), CircuitBreaker('test_operation')
+        for _ in range(4):
+            worker_a.record_failure(10)
+        self.assertEqual(worker_b.state(), 'open')
+        self.assertFalse(worker_b.allow_request())
+
+        self.now += 31
+        self.assertTrue(worker_b.allow_request())  # The one probe
+        self.assertFalse(worker_a.allow_request())
+        worker_b.record_success(10)
+        self.assertEqual(worker_a.state(), 'closed')
+
+    def test_default_cache_is_shared(self):
+        self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.db.DatabaseCache')
+        self.assertEqual(check_shared_cache(None), [])
+
+    def test_check_rejects_per_process_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['core.E001'])
+        with self.settings(CACHES=locmem, CIRCUIT_BREAKER={'ENABLED': False}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class GenerateLoadDataTests(TestCase):
+    """generate_load_data smoke test at a tiny scale"""
+
+    def generate(self, *args):
+        call_command(
+            'generate_load_data', '--registrations', '12', '--enrollments', '18', '--payments', '30',
+            '--batch-size', '5', '--proof-ratio', '0', *args, stdout=StringIO(),
+        )
+
+    def test_generates_and_flushes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.generate()
+        # The generated timestamps are written by the INSERT, not a second pass
+        self.assertFalse([q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')])
+        generated = Registration.objects.filter(email__endswith='@loadtest.invalid')
+        self.assertEqual(generated.count(), 12)
+        self.assertEqual(StudentCourseEnrollment.objects.filter(registration__in=generated).count(), 18)
+        self.assertEqual(Payment.objects.filter(registration__in=generated).count(), 30)
+        # Creation times are spread over --days, not the moment of the insert
+        oldest = generated.order_by('created_at').first()
+        self.assertLess(oldest.created_at, timezone.now() - timedelta(days=300))
+        self.assertEqual(oldest.updated_at, oldest.created_at)
+        self.assertLess(Payment.objects.filter(registration__in=generated).order_by('created_at').first().created_at,
+                        timezone.now() - timedelta(days=200))
+
+        with self.assertRaises(CommandError):
+            self.generate()
+        self.generate('--flush')
+        self.assertEqual(generated.count(), 12)
+        self.assertEqual(Payment.objects.filter(registration__in=generated).count(), 30)
+
+    def test_auto_timestamps_untouched(self):
+        self.generate()
+        # The model fields are not patched, so a normal save still stamps now()
+        registration = Registration.objects.create(name='Student', email='after@example.com', contact='555-0100')
+        self.assertGreater(registration.created_at, timezone.now() - timedelta(minutes=1))
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', OUTBOX_CLAIM_SECONDS=600)
+class OutboxTests(TestCase):
+    """send_queued_emails claims each batch before sending it"""
+
+    def setUp(self):
+        queue_emails([build_email(f'Message {i}', 'Body', [f'to{i}@example.com']) for i in range(4)])
+
+    def test_sends_and_releases(self):
+        self.assertEqual(send_queued_emails(batch_size=3), {'sent': 4, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertFalse(QueuedEmail.objects.exclude(status='sent').exists())
+        self.assertFalse(QueuedEmail.objects.exclude(claim_token='').exists())
+
+    def test_concurrent_run_sends_each_message_once(self):
+        from django.core.mail import EmailMessage
+
+        send = EmailMessage.send
+        concurrent = {}
+
+        def send_and_race(message, *args, **kwargs):
+            if 'started' not in concurrent:
+                # A second worker starts while the first batch is in flight
+                concurrent['started'] = True
+                concurrent['totals'] = send_queued_emails(batch_size=2)
+            return send(message, *args, **kwargs)
+
+        with mock.patch.object(EmailMessage, 'send', autospec=True, side_effect=send_and_race):
+            first = send_queued_emails(batch_size=2)
+
+        self.assertEqual(first, {'sent': 2, 'failed': 0})
+        self.assertEqual(concurrent['totals'], {'sent': 2, 'failed': 0})
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'to{i}@example.com' for i in range(4)])
+
+    def test_stale_claim_is_retried(self):
+        first, second = QueuedEmail.objects.order_by('id')[:2]
+        QueuedEmail.objects.filter(id=first.id).update(
+            status='sending', claim_token='dead', claimed_at=timezone.now() - timedelta(hours=1),
+        )
+        QueuedEmail.objects.filter(id=second.id).update(status='sending', claim_token='busy', claimed_at=timezone.now())
+
+        self.assertEqual(send_queued_emails(), {'sent': 3, 'failed': 0})
+        self.assertEqual(QueuedEmail.objects.get(id=first.id).status, 'sent')
+        self.assertEqual(QueuedEmail.objects.get(id=second.id).status, 'sending')
+
+    def test_failed_send_goes_back_to_pending(self):
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('refused')):
+            self.assertEqual(send_queued_emails(limit=1), {'sent': 0, 'failed': 1})
+        queued = QueuedEmail.objects.order_by('id').first()
+        self.assertEqual((queued.status, queued.attempts, queued.claim_token), ('pending', 1, ''))
+        self.assertEqual(queued.last_error, 'refused')
+
+    def test_connection_failure_releases_batch(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('no route')):
+            self.assertEqual(send_queued_emails(), {'sent': 0, 'failed': 0})
+        self.assertEqual(QueuedEmail.objects.filter(status='pending', claim_token='', attempts=0).count(), 4)
+
+
+class BatchRunnerTests(TestCase):
+    """core.batch.BatchRunner and the registration number commands built on it"""
+
+    def setUp(self):
+        self.students = [
+            Registration.objects.create(name=f'Student {i}', email=f'batch{i}@example.com', contact='555-0100')
+            for i in range(7)
+        ]
+        self.log = []
+
+    def runner(self, queryset=None, **kwargs):
+        queryset = Registration.objects.all() if queryset is None else queryset
+        return BatchRunner('test_job', queryset, batch_size=3, log=self.log.append, **kwargs)
+
+    def test_keyset_batches(self):
+        seen = []
+
+        def clear_password(batch):
+            seen.append([registration.pk for registration in batch])
+            for registration in batch:
+                registration.student_password = f'reset{registration.pk}'
+            return batch
+
+        # The queryset shrinks as rows are fixed; keyset paging still visits each row once
+        with CaptureQueriesContext(connection) as queries:
+            result = self.runner(Registration.objects.exclude(student_password__startswith='reset')).run(
+                clear_password, update_fields=['student_password'],
+            )
+
+        ids = sorted(registration.pk for registration in self.students)
+        self.assertEqual(seen, [ids[0:3], ids[3:6], ids[6:7]])
+        self.assertEqual((result['processed'], result['changed']), (7, 7))
+        self.assertEqual(Registration.objects.filter(student_password__startswith='reset').count(), 7)
+        reads = [q['sql'] for q in queries.captured_queries if 'LIMIT 3' in q['sql']]
+        self.assertTrue(reads and all('"id" >' in sql for sql in reads))
+        self.assertFalse(BatchCheckpoint.objects.filter(job='test_job').exists())
+
+    def test_resumes_from_checkpoint(self):
+        def rename(batch):
+            for registration in batch:
+                registration.name = 'Renamed'
+            return batch
+
+        calls = []
+
+        def crash_on_second_batch(batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError('interrupted')
+            return rename(batch)
+
+        with self.assertRaises(RuntimeError):
+            self.runner().run(crash_on_second_batch, update_fields=['name'])
+        ids = sorted(registration.pk for registration in self.students)
+        checkpoint = BatchCheckpoint.objects.get(job='test_job')
+        self.assertEqual((checkpoint.last_id, checkpoint.processed), (ids[2], 3))
+
+        seen = []
+        result = self.runner().run(lambda batch: seen.extend(r.pk for r in batch) or rename(batch), update_fields=['name'])
+        self.assertEqual(seen, ids[3:])
+        self.assertEqual(result['processed'], 4)
+        self.assertTrue(any('Resuming test_job' in line for line in self.log))
+        self.assertEqual(Registration.objects.filter(name='Renamed').count(), 7)
+        self.assertFalse(BatchCheckpoint.objects.filter(job='test_job').exists())
+
+    def test_dry_run_writes_nothing(self):
+        def rename(batch):
+            for registration in batch:
+                registration.name = 'Renamed'
+            return batch
+
+        result = self.runner(dry_run=True).run(rename, update_fields=['name'])
+        self.assertEqual(result['changed'], 7)
+        self.assertFalse(Registration.objects.filter(name='Renamed').exists())
+        self.assertFalse(BatchCheckpoint.objects.exists())
+
+    def numbers(self):
+        return dict(Registration.objects.values_list('id', 'registration_number'))
+
+    def test_regenerate_registration_numbers(self):
+        before = self.numbers()
+        out = StringIO()
+        call_command('regenerate_registration_numbers', '--dry-run', '--batch-size', '3', stdout=out)
+        self.assertIn('[dry-run] Updated: 7', out.getvalue())
+        self.assertEqual(self.numbers(), before)
+
+        call_command('regenerate_registration_numbers', '--noinput', '--batch-size', '3', stdout=StringIO())
+        after = self.numbers()
+        self.assertEqual(len(set(after.values())), 7)
+        self.assertTrue(all(after[pk] != before[pk] for pk in before))
+        year_prefix = f'ON{str(timezone.now().year)[-2:]}-'
+        self.assertTrue(all(number.startswith(year_prefix) for number in after.values()))
+
+    def test_update_existing_registrations(self):
+        # Both columns are unique, so at most one row can hold each blank value
+        first, second = self.students[:2]
+        Registration.objects.filter(pk=first.pk).update(registration_number='')
+        Registration.objects.filter(pk=second.pk).update(registration_number='ON26-0000', student_password='')
+        untouched = Registration.objects.get(pk=self.students[2].pk)
+
+        out = StringIO()
+        call_command('update_existing_registrations', '--dry-run', stdout=out)
+        self.assertIn('[dry-run] Updated: 2 | Processed: 2', out.getvalue())
+        self.assertEqual(Registration.objects.get(pk=first.pk).registration_number, '')
+
+        call_command('update_existing_registrations', '--numbers-only', '--noinput', stdout=StringIO())
+        second.refresh_from_db()
+        self.assertNotIn(Registration.objects.get(pk=first.pk).registration_number, ('', 'ON26-0000'))
+        self.assertNotIn(second.registration_number, ('', 'ON26-0000'))
+        self.assertEqual(second.student_password, '')
+
+        call_command('update_existing_registrations', '--noinput', stdout=StringIO())
+        second.refresh_from_db()
+        self.assertEqual(len(second.student_password), 10)
+        self.assertEqual(len(set(Registration.objects.values_list('registration_number', flat=True))), 7)
+        refreshed = Registration.objects.get(pk=untouched.pk)
+        self.assertEqual(
+            (refreshed.registration_number, refreshed.student_password),
+            (untouched.registration_number, untouched.student_password),
+        )
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ADMIN_EMAIL='')
+class StudentImportTests(TestCase):
+    """Bulk CSV import: chunked lookups, bulk inserts and queued welcome emails"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.oec = Course.objects.create(course_name='Course IMP', course_code='IMP', price_cad=Decimal('1000.00'))
+        cls.met = Course.objects.create(course_name='Course IMQ', course_code='IMQ', price_cad=Decimal('1000.00'))
+        cls.existing = [
+            Registration.objects.create(name=f'Existing {i}', email=f'existing{i}@example.com', contact='555-0100')
+            for i in range(3)
+        ]
+        StudentCourseEnrollment.objects.create(registration=cls.existing[0], course=cls.oec, course_name=cls.oec.course_name)
+
+    CSV = (
+        'Name,Email,Contact,Course\n'
+        'Existing Zero,EXISTING0@Example.com,555-0100,IMP\n'  # Already enrolled
+        'Existing One, Existing1@example.COM ,555-0100,IMP\n'
+        'Existing Two,existing2@example.com,555-0100,Course IMQ\n'
+        'New One,new1@example.com,555-0101,IMP\n'
+        'New One,NEW1@example.com,555-0101,imp\n'  # Repeats the row above
+        'New One,new1@example.com,555-0101,IMQ\n'
+        'New Two,new2@example.com,555-0102,IMP\n'
+        'Bad,not-an-email,555-0103,IMP\n'
+    )
+
+    def test_import(self):
+        with mock.patch('core.student_import.LOOKUP_CHUNK_SIZE', 2), \
+                mock.patch('django.core.mail.EmailMessage.send') as send, \
+                CaptureQueriesContext(connection) as queries:
+            result = import_students(self.CSV)
+
+        summary = result['summary']
+        self.assertEqual(
+            {key: summary[key] for key in ('rows', 'created', 'enrolled', 'skipped', 'errors')},
+            {'rows': 8, 'created': 2, 'enrolled': 3, 'skipped': 2, 'errors': 1},
+        )
+        statuses = [(row['email'], row['status']) for row in result['rows']]
+        self.assertEqual(statuses[:2], [('existing0@example.com', 'skipped'), ('existing1@example.com', 'enrolled')])
+        self.assertEqual(result['rows'][4]['message'], 'Duplicate row in file')
+
+        # Five emails looked up two at a time: three IN queries, no per-row lookups
+        email_lookups = [q['sql'] for q in queries.captured_queries
+                         if q['sql'].startswith('SELECT') and '"core_registration"."email" IN' in q['sql']]
+        self.assertEqual(len(email_lookups), 3)
+
+        self.assertEqual(Registration.objects.count(), 5)
+        new = Registration.objects.filter(email__startswith='new')
+        self.assertEqual(len({student.registration_number for student in new}), 2)
+        self.assertTrue(all(student.registration_number and student.student_password for student in new))
+        self.assertEqual(StudentCourseEnrollment.objects.filter(registration__in=new).count(), 3)
+        self.assertEqual(StudentCourseEnrollment.objects.filter(registration=self.existing[1]).count(), 1)
+
+        # One welcome email per new enrollment, queued rather than sent
+        send.assert_not_called()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(summary['emails_queued'], 5)
+        self.assertEqual(QueuedEmail.objects.filter(to='new1@example.com').count(), 2)
+        self.assertEqual(QueuedEmail.objects.filter(to='new2@example.com').count(), 1)
+
+    def test_dry_run_writes_nothing(self):
+        result = import_students(self.CSV, dry_run=True)
+        self.assertEqual(result['summary']['created'], 2)
+        self.assertEqual(Registration.objects.count(), 3)
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write(self.CSV)
+        self.addCleanup(os.remove, csv_file.name)
+        out = StringIO()
+        call_command('import_students', csv_file.name, '--no-email', stdout=out, stderr=StringIO())
+        self.assertIn('Created: 2 | Enrolled: 3 | Skipped: 2 | Errors: 1 | Emails queued: 0', out.getvalue())
+
+    def test_admin_endpoint_is_staff_only(self):
+        url = '/api/admin/registrations/import/'
+
+        def upload():
+            return SimpleUploadedFile('students.csv', self.CSV.encode(), content_type='text/csv')
+
+        response = self.client.post(url, {'file': upload()})
+        self.assertEqual(response.status_code, 302)
+        User.objects.create_user('student', password='pw')
+        self.client.login(username='student', password='pw')
+        response = self.client.post(url, {'file': upload()})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Registration.objects.count(), 3)
+
+        User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.login(username='staff', password='pw')
+        response = self.client.post(url, {'file': upload()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary']['created'], 2)
+        self.assertEqual(Registration.objects.count(), 5)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ADMIN_EMAIL='')
+class EmailNormalizationTests(TestCase):
+    """Emails that differ only in case or surrounding spaces belong to one student"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(course_name='Course NRM', course_code='NRM', price_cad=Decimal('1000.00'))
+
+    def register(self, email, course):
+        return self.client.post('/api/register/', {
+            'name': 'Student', 'email': email, 'contact': '555-0100', 'course': course, 'hasQualification': 'no',
+        })
+
+    def test_register_verify_and_import(self):
+        first = self.register('Foo@X.com', 'Course NRM').json()
+        second = self.register('foo@x.com ', 'Course Other').json()
+        self.assertEqual(second['status'], 'ok')
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual(Registration.objects.get().email, 'foo@x.com')
+
+        response = self.client.post(
+            '/api/payment/verify-student/', json.dumps({'student_id': ' FOO@x.COM'}), content_type='application/json'
+        )
+        self.assertEqual(response.json()['student']['id'], first['id'])
+
+        result = import_students('name,email,contact,course\nStudent, fOO@X.com ,555-0100,NRM\n', notify=False)
+        self.assertEqual(result['rows'][0]['status'], 'skipped')
+        self.assertEqual(result['rows'][0]['message'], 'Already enrolled in this course')
+        self.assertEqual(Registration.objects.count(), 1)
+
+    def test_constraint_rejects_case_variant(self):
+        Registration.objects.create(name='Student', email='foo@x.com', contact='555-0100')
+        other = Registration.objects.create(name='Other', email='other@x.com', contact='555-0100')
+        # update() skips save(), so only the database constraint stands in the way
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Registration.objects.filter(id=other.id).update(email='FOO@X.COM')
+
+    def run_email_migration(self):
+        migration = importlib.import_module('core.migrations.0015_normalize_registration_emails')
+        migration.lowercase_emails(apps, mock.Mock(connection=connection))
+
+    def test_migration_refuses_collisions(self):
+        Registration.objects.create(name='Student', email='foo@x.com', contact='555-0100')
+        other = Registration.objects.create(name='Other', email='other@x.com', contact='555-0100')
+        # Lower-cased the two are distinct, trimmed as well they collide
+        Registration.objects.filter(id=other.id).update(email=' Foo@X.com')
+        with self.assertRaisesMessage(RuntimeError, 'merge_duplicate_students'):
+            self.run_email_migration()
+        self.assertEqual(Registration.objects.get(id=other.id).email, ' Foo@X.com')
+
+    def test_migration_normalizes(self):
+        student = Registration.objects.create(name='Student', email='foo@x.com', contact='555-0100')
+        Registration.objects.filter(id=student.id).update(email=' Foo@X.com ')
+        self.run_email_migration()
+        self.assertEqual(Registration.objects.get(id=student.id).email, 'foo@x.com')
+
+
+@override_settings(**FAKE_CHECKOUT_SETTINGS)
+class SweeperTests(TestCase):
+    """Expired OTPs are deleted and abandoned pending payments cancelled, at the gateway too"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(course_name='Course SWP', course_code='SWP', price_cad=Decimal('1000.00'))
+        cls.student = Registration.objects.create(name='Student', email='sweep@example.com', contact='555-0100')
+        cls.enrollment = StudentCourseEnrollment.objects.create(
+            registration=cls.student, course=course, course_name=course.course_name
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.now = timezone.now()
+        self.stale = self.now - timedelta(minutes=settings.PAYMENT_TIMEOUT_MINUTES + 5)
+
+    def payment(self, status='pending', created_at=None, with_intent=True):
+        intent_id = None
+        if with_intent:
+            intent_id = get_payment_gateway().create_payment_intent(
+                Decimal('105.00'), self.student.email, self.student.name, 'Course SWP',
+            )['payment_intent_id']
+        payment = Payment.objects.create(
+            registration=self.student,
+            enrollment=self.enrollment,
+            student_id=self.student.registration_number,
+            course_name='Course SWP',
+            total_price_cad=Decimal('1000.00'),
+            payment_amount_cad=Decimal('100.00'),
+            final_amount_cad=Decimal('105.00'),
+            status=status,
+            stripe_payment_intent_id=intent_id,
+        )
+        if created_at is not None:
+            Payment.objects.filter(id=payment.id).update(created_at=created_at)
+        return payment
+
+    def otp(self, expires_in_minutes, verified=False):
+        return PaymentOTP.objects.create(
+            payment=self.payment(with_intent=False), otp_code='123456',
+            expires_at=self.now + timedelta(minutes=expires_in_minutes), is_verified=verified,
+        )
+
+    def test_deletes_only_expired_unverified_otps(self):
+        expired = [self.otp(-10) for _ in range(5)]
+        verified = self.otp(-10, verified=True)
+        fresh = self.otp(10)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(delete_expired_otps(batch_size=2, now=self.now), 5)
+        deletes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('DELETE FROM "core_paymentotp"')]
+        self.assertEqual(len(deletes), 3)
+
+        self.assertFalse(PaymentOTP.objects.filter(id__in=[otp.id for otp in expired]).exists())
+        self.assertEqual(set(PaymentOTP.objects.values_list('id', flat=True)), {verified.id, fresh.id})
+
+    def test_cancels_stale_pending_payments(self):
+        gateway = get_payment_gateway()
+        stale = [self.payment(created_at=self.stale) for _ in range(3)]
+        no_intent = self.payment(created_at=self.stale, with_intent=False)
+        paid_meanwhile = self.payment(created_at=self.stale)
+        gateway.confirm_payment(paid_meanwhile.stripe_payment_intent_id)
+        fresh = self.payment()
+        completed = self.payment(status='completed', created_at=self.stale)
+
+        result = cancel_stale_payments(batch_size=2, workers=2, now=self.now)
+
+        self.assertEqual(result, {'cancelled': 4, 'skipped': 1})
+        for payment in stale:
+            self.assertEqual(Payment.objects.get(id=payment.id).status, 'cancelled')
+            self.assertEqual(gateway.retrieve_payment_intent(payment.stripe_payment_intent_id)['status'], 'canceled')
+        self.assertEqual(Payment.objects.get(id=no_intent.id).status, 'cancelled')
+        # The intent succeeded after all: left for reconcile_payments
+        self.assertEqual(Payment.objects.get(id=paid_meanwhile.id).status, 'pending')
+        self.assertEqual(Payment.objects.get(id=fresh.id).status, 'pending')
+        self.assertEqual(
+            gateway.retrieve_payment_intent(fresh.stripe_payment_intent_id)['status'], 'requires_confirmation'
+        )
+        self.assertEqual(Payment.objects.get(id=completed.id).status, 'completed')
+
+    def test_dry_run_changes_nothing(self):
+        payment = self.payment(created_at=self.stale)
+        self.otp(-10)
+        self.assertEqual(cancel_stale_payments(now=self.now, dry_run=True)['cancelled'], 1)
+        self.assertEqual(delete_expired_otps(now=self.now, dry_run=True), 1)
+        self.assertEqual(Payment.objects.get(id=payment.id).status, 'pending')
+        self.assertEqual(PaymentOTP.objects.count(), 1)
+
+    def test_lock_allows_one_sweep_per_period(self):
+        stale = self.payment(created_at=self.stale)
+        self.assertEqual(sweep_unless_locked(60)['payments_cancelled'], 1)
+
+        # Another worker inside the same period does nothing
+        another = self.payment(created_at=self.stale)
+        with mock.patch('core.sweeper.sweep') as sweep:
+            self.assertIsNone(sweep_unless_locked(60))
+        sweep.assert_not_called()
+        self.assertEqual(Payment.objects.get(id=another.id).status, 'pending')
+
+        cache.delete('payment_sweeper_lock')  # The period ran out
+        self.assertEqual(sweep_unless_locked(60)['payments_cancelled'], 1)
+        self.assertEqual(Payment.objects.get(id=stale.id).status, 'cancelled')
+
+
+class IncompleteGateway(PaymentGateway):
+    """A gateway written before cancel/update existed"""
+
+    def create_payment_intent(self, amount_cad, email, student_name, course_name, payment_id=None, payment_method_id=None):
+        return {'success': True}
+
+
+class PaymentGatewayTests(TestCase):
+    """PaymentGateway is abstract: an incomplete backend fails when it is loaded"""
+
+    def test_incomplete_gateway_fails_at_load(self):
+        with self.settings(PAYMENT_GATEWAY='core.tests.IncompleteGateway'):
+            with self.assertRaisesMessage(TypeError, 'cancel_payment_intent'):
+                get_payment_gateway()
+
+    def test_shipped_gateways_are_complete(self):
+        for path in ('core.fake_gateway.FakePaymentGateway', 'core.stripe_processor.StripePaymentProcessor'):
+            with self.settings(PAYMENT_GATEWAY=path):
+                self.assertIsNotNone(get_payment_gateway())
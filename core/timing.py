@@ -0,0 +1,111 @@
+"""
+Per-Request Timing for OncoOne Education
+Splits a request's time into database, Stripe, email, PDF and template
+rendering, for the Server-Timing header and the per-request log line
+Version: 1.0
+
+RequestTimingMiddleware starts a RequestTimings for each request; the hooks
+(timed() blocks, the DB execute_wrapper, the gateway proxy) add to it. Outside
+a timed request - or with REQUEST_TIMING_ENABLED off - a hook costs one
+ContextVar lookup. Email, PDF and render durations also feed the /metrics
+histograms (core/metrics.py), inside a request or not, and open a span when
+the request is traced (core/tracing.py).
+"""
+
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+from django import shortcuts
+
+from . import metrics, tracing
+
+# Categories in the order they are reported
+CATEGORIES = ('db', 'stripe', 'email', 'pdf', 'render')
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Milliseconds and call counts per category for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ms = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, category: str, ms: float) -> None:
+        self.ms[category] += ms
+        self.counts[category] += 1
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. db;dur=12.4;desc="9 queries", total;dur=40.1"""
+        parts = []
+        for category in CATEGORIES:
+            if category in self.counts:
+                desc = f'{self.counts[category]} queries' if category == 'db' else f'{self.counts[category]} calls'
+                parts.append(f'{category};dur={self.ms[category]:.1f};desc="{desc}"')
+        parts.append(f'total;dur={self.total_ms():.1f}')
+        return ', '.join(parts)
+
+    def summary(self) -> str:
+        """One log line: queries=9 db=12ms stripe=0ms email=0ms pdf=0ms render=8ms"""
+        return f'queries={self.counts["db"]} ' + ' '.join(
+            f'{category}={self.ms[category]:.0f}ms' for category in CATEGORIES
+        )
+
+
+def start_request() -> contextvars.Token:
+    return _current.set(RequestTimings())
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def current() -> RequestTimings:
+    """The timings of the request being handled, or None"""
+    return _current.get()
+
+
+@contextmanager
+def timed(category: str):
+    """Add the block's duration to `category` of the current request (decorator or with-block)"""
+    timings = _current.get()
+    histogram = metrics.TIMED_HISTOGRAMS.get(category) if metrics.enabled() else None
+    span_name = tracing.TIMED_SPANS.get(category) if tracing.current_span() is not None else None
+    if timings is None and histogram is None and span_name is None:
+        yield
+        return
+    started = time.perf_counter()
+    with tracing.span(span_name) if span_name else nullcontext():
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if timings is not None:
+                timings.add(category, elapsed * 1000)
+            if histogram is not None:
+                metrics.observe(histogram, elapsed)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook: time every query under 'db'"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', (time.perf_counter() - started) * 1000)
+
+
+def render(*args, **kwargs):
+    """django.shortcuts.render, timed under 'render'"""
+    with timed('render'):
+        return shortcuts.render(*args, **kwargs)
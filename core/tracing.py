@@ -0,0 +1,255 @@
+"""
+Request Tracing for OncoOne Education
+OpenTelemetry-compatible spans for requests, ORM queries, payment gateway
+calls, SMTP sends and PDF rendering, exported locally as OTLP/JSON
+Version: 1.0
+
+RequestTimingMiddleware starts a trace per sampled request (continuing a W3C
+`traceparent` header if the caller sent one); the hooks open child spans under
+it. A finished trace is written as one line of OTLP/JSON
+(ExportTraceServiceRequest) to TRACING_FILE or to the console, so it can be
+read with `python manage.py show_traces` or replayed into Jaeger/Tempo by an
+OpenTelemetry Collector (otlpjsonfile receiver) - no tracing service needed.
+
+annotate(payment_id=..., enrollment_id=...) tags the whole trace, so every
+span of a checkout carries the ids it was about.
+
+Settings: TRACING_EXPORTER ('' = off, 'file', 'console'), TRACING_FILE,
+TRACING_SAMPLE_RATE (0..1, per trace), TRACING_SLOW_MS (only export traces at
+least this long) and TRACING_MAX_SPANS (per trace; the rest are counted, not kept).
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('core.performance')
+
+SERVICE_NAME = 'oncoone'
+SCOPE_NAME = 'core.tracing'
+STATEMENT_MAX_CHARS = 1000
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# timing.timed() categories that open a span, and the span's name
+TIMED_SPANS = {
+    'email': 'smtp.send',
+    'pdf': 'invoice.render_pdf',
+    'render': 'template.render',
+}
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_write_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, 'TRACING_EXPORTER', ''))
+
+
+class Trace:
+    """The spans of one trace, buffered until its root span ends"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List['Span'] = []
+        self.attributes: Dict[str, object] = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span: 'Span') -> bool:
+        with self._lock:
+            if len(self.spans) >= getattr(settings, 'TRACING_MAX_SPANS', 1000):
+                self.dropped += 1
+                return False
+            self.spans.append(span)
+            return True
+
+
+class Span:
+    """One timed operation; field names follow the OpenTelemetry data model"""
+
+    def __init__(self, trace: Trace, name: str, kind: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.error = message
+
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict:
+        attributes = {**self.attributes, **self.trace.attributes}
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': f'SPAN_KIND_{self.kind}',
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_otlp_attribute(key, value) for key, value in sorted(attributes.items())],
+            'status': {'code': 'STATUS_CODE_ERROR', 'message': self.error} if self.error else {'code': 'STATUS_CODE_UNSET'},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace.trace_id if span is not None else None
+
+
+def annotate(**attributes) -> None:
+    """Tag every span of the current trace: annotate(payment_id=42) sets payment.id=42"""
+    span = _current_span.get()
+    if span is not None:
+        for key, value in attributes.items():
+            if value is not None:
+                span.trace.attributes[key.replace('_', '.')] = value
+
+
+def _sampled(traceparent: Optional[str]):
+    """(trace_id, parent_span_id) for a new trace, or None when this one is not sampled"""
+    match = TRACEPARENT.match(traceparent or '')
+    if match:
+        # The caller already decided; follow its sampled flag
+        if not int(match.group(3), 16) & 1:
+            return None
+        return match.group(1), match.group(2)
+    if random.random() >= getattr(settings, 'TRACING_SAMPLE_RATE', 1.0):
+        return None
+    return f'{random.getrandbits(128):032x}', None
+
+
+@contextmanager
+def start_trace(name: str, kind: str = 'SERVER', traceparent: Optional[str] = None, **attributes):
+    """
+    Root span of a new trace (a request, a batch job); yields the Span, or None
+    when tracing is off or the trace was not sampled. Exports the trace on exit.
+    """
+    sampled = _sampled(traceparent) if enabled() else None
+    if sampled is None:
+        yield None
+        return
+    trace_id, remote_parent = sampled
+    trace = Trace(trace_id)
+    root = Span(trace, name, kind, remote_parent, attributes)
+    trace.add(root)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except Exception as exc:
+        root.set_error(f'{type(exc).__name__}: {exc}')
+        raise
+    finally:
+        _current_span.reset(token)
+        root.end_ns = time.time_ns()
+        if root.duration_ms() >= getattr(settings, 'TRACING_SLOW_MS', 0):
+            export(trace)
+
+
+@contextmanager
+def span(name: str, kind: str = 'INTERNAL', **attributes):
+    """Child span of the current one; yields None (and costs a ContextVar lookup) outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, kind, parent.span_id, attributes)
+    if not parent.trace.add(child):
+        yield None
+        return
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as exc:
+        child.set_error(f'{type(exc).__name__}: {exc}')
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end_ns = time.time_ns()
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook: one CLIENT span per query (statement only, never params)"""
+    if _current_span.get() is None:
+        return execute(sql, params, many, context)
+    connection = context['connection']
+    with span('db.query', kind='CLIENT', **{
+        'db.system': connection.vendor,
+        'db.name': connection.alias,
+        'db.operation': sql.split(None, 1)[0].upper() if sql else None,
+        'db.statement': sql[:STATEMENT_MAX_CHARS],
+    }):
+        return execute(sql, params, many, context)
+
+
+def export(trace: Trace) -> None:
+    """Write the trace as one OTLP/JSON line to the configured exporter"""
+    if trace.dropped:
+        trace.spans[0].set_attribute('oncoone.dropped_spans', trace.dropped)
+    payload = {'resourceSpans': [{
+        'resource': {'attributes': [
+            _otlp_attribute('service.name', SERVICE_NAME),
+            _otlp_attribute('process.pid', os.getpid()),
+        ]},
+        'scopeSpans': [{
+            'scope': {'name': SCOPE_NAME},
+            'spans': [span.to_otlp() for span in trace.spans if span.end_ns is not None],
+        }],
+    }]}
+    line = json.dumps(payload, separators=(',', ':'), default=str) + '\n'
+
+    exporter = getattr(settings, 'TRACING_EXPORTER', '')
+    try:
+        if exporter == 'console':
+            with _write_lock:
+                sys.stderr.write(line)
+        elif exporter == 'file':
+            path = getattr(settings, 'TRACING_FILE', 'traces.jsonl')
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            # One O_APPEND write per trace, so lines from several workers never interleave
+            with _write_lock:
+                descriptor = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+                try:
+                    os.write(descriptor, line.encode())
+                finally:
+                    os.close(descriptor)
+    except OSError as e:
+        logger.warning(f'Could not export trace {trace.trace_id}: {e}')
@@ -6,11 +6,14 @@ urlpatterns = [
     path('admin/registrations/', views.registrations_list, name='admin-registrations-list'),
     path('admin/registrations/<int:pk>/', views.registration_detail, name='admin-registrations-detail'),
     path('admin/registrations/<int:pk>/download/', views.download_proof, name='admin-registrations-download'),
+    path('admin/registrations/import/', views.admin_import_students, name='admin-registrations-import'),
     
     # Admin pages
     path('admin/students/', views.admin_students_page, name='admin-students-page'),
     path('admin/courses/', views.admin_courses_page, name='admin-courses-page'),
     path('admin/payments-page/', views.admin_payments_page, name='admin-payments-page'),
+    path('admin/query-report/', views.admin_query_report, name='admin-query-report'),
+    path('admin/profiles/<str:profile_id>/<str:artifact>/', views.admin_download_profile, name='admin-download-profile'),
     
     # Admin API endpoints
     path('admin/payments/', views.admin_payments_list, name='admin-payments-list'),
@@ -44,5 +47,6 @@ urlpatterns = [
     path('payment/process/', views.process_payment, name='api-payment-process'),
     path('payment/create-and-send-otp/', views.create_payment_and_send_otp, name='api-create-payment-otp'),
     path('payment/verify-otp/', views.verify_payment_otp, name='api-verify-payment-otp'),
+    path('payment/resend-otp/', views.resend_payment_otp, name='api-resend-payment-otp'),
 ]
 
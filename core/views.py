@@ -4,19 +4,31 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.core.mail import EmailMessage
 from django.core.files.base import ContentFile
 from django.conf import settings
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.utils import timezone
+from django.core.cache import cache
+from datetime import timedelta
 from decimal import Decimal
-from django.db.models import Sum
+from django.db import IntegrityError
+from django.db.models import Count, Sum
 import json
+import os
 import uuid
 import logging
 
-from .models import Registration, StudentCourseEnrollment, Payment, Course, PaymentInvoice, PaymentOTP
-from .stripe_processor import StripePaymentProcessor
+from . import metrics, profiling, query_log, tracing
+from .db_limits import db_limits
+from .db_router import replica_reads
+from .models import Registration, StudentCourseEnrollment, Payment, Course, PaymentInvoice, PaymentOTP, QueuedEmail
+from .numbering import allocate_invoice_number
+from .outbox import welcome_email_content
+from .payment_gateway import get_payment_gateway
 from .payment_security import OTPSecurityManager, PaymentSecurityValidator
+from .sqlite_profile import immediate_atomic
+from .student_import import ImportFileError, import_students
+from .timing import render, timed
 
 # Initialize loggers
 logger = logging.getLogger('core.payment')
@@ -34,6 +46,17 @@ def no_cache(view_func):
     return wrapped_view
 
 
+def _payments_unavailable_response(gateway_result):
+    """503 returned while the payment gateway circuit breaker is open"""
+    response = JsonResponse({
+        'status': 'error',
+        'error': gateway_result['error'],
+        'error_type': gateway_result['error_type'],
+    }, status=503)
+    response['Retry-After'] = str(getattr(settings, 'CIRCUIT_BREAKER', {}).get('OPEN_SECONDS', 30))
+    return response
+
+
 @csrf_exempt
 def register_view(request):
     """Handle course registration - supports multiple courses per student"""
@@ -42,7 +65,7 @@ def register_view(request):
 
     try:
         name = request.POST.get('name', '').strip()
-        email = request.POST.get('email', '').strip()
+        email = Registration.normalize_email(request.POST.get('email', ''))
         contact = request.POST.get('contact', '').strip()
         course_name = request.POST.get('course', '').strip() or 'Course'
         has_prerequisite = request.POST.get('hasQualification', 'yes').lower() in ('yes', '1', 'true')
@@ -77,32 +100,34 @@ def register_view(request):
             except Exception:
                 proof_bytes = None
 
-        # Get or create registration for this email
-        reg, created = Registration.objects.get_or_create(
-            email=email,
-            defaults={
-                'name': name,
-                'contact': contact,
-            }
-        )
-
-        # Check if already enrolled in this course
-        if StudentCourseEnrollment.objects.filter(registration=reg, course_name=course_name).exists():
-            return JsonResponse({
-                'status': 'error',
-                'error': f'You are already registered for {course_name}. Please choose a different course or contact support.'
-            }, status=400)
+        # One short write transaction; the notification emails go out after it commits
+        with immediate_atomic():
+            # Get or create registration for this email
+            reg, created = Registration.objects.get_or_create(
+                email=email,
+                defaults={
+                    'name': name,
+                    'contact': contact,
+                }
+            )
 
-        # Create course enrollment
-        enrollment = StudentCourseEnrollment.objects.create(
-            registration=reg,
-            course_name=course_name,
-            has_prerequisite=has_prerequisite,
-            proof=proof if proof else None,
-            proof_name=proof_name,
-            proof_mime=proof_mime,
-            proof_data=proof_bytes,
-        )
+            # Check if already enrolled in this course
+            if StudentCourseEnrollment.objects.filter(registration=reg, course_name=course_name).exists():
+                return JsonResponse({
+                    'status': 'error',
+                    'error': f'You are already registered for {course_name}. Please choose a different course or contact support.'
+                }, status=400)
+
+            # Create course enrollment
+            enrollment = StudentCourseEnrollment.objects.create(
+                registration=reg,
+                course_name=course_name,
+                has_prerequisite=has_prerequisite,
+                proof=proof if proof else None,
+                proof_name=proof_name,
+                proof_mime=proof_mime,
+                proof_data=proof_bytes,
+            )
 
         # Send admin notification
         admin_email = getattr(settings, 'ADMIN_EMAIL', '')
@@ -122,33 +147,17 @@ def register_view(request):
                 if proof:
                     proof.seek(0)
                     email_msg.attach(proof_name, proof.read(), proof_mime)
-                email_msg.send(fail_silently=True)
+                with timed('email'):
+                    email_msg.send(fail_silently=True)
             except Exception as exc:
                 print(f"Admin email failed: {exc}")
 
         # Send confirmation to student
         if reg.email:
             try:
-                user_subject = f"Welcome to OncoOne - Registration Number: {reg.registration_number}"
-                user_body = (
-                    f"Hi {reg.name},\n\n"
-                    f"Thank you for registering for {course_name}!\n\n"
-                    f"═══════════════════════════════════════\n"
-                    f"YOUR REGISTRATION NUMBER: {reg.registration_number}\n"
-                    f"═══════════════════════════════════════\n\n"
-                    f"Please save this registration number. You will need it to:\n"
-                    f"• Make payments through our payment portal\n"
-                    f"• Access your student account\n"
-                    f"• Track your course progress\n\n"
-                    f"Student Details:\n"
-                    f"Name: {reg.name}\n"
-                    f"Email: {reg.email}\n"
-                    f"Course: {course_name}\n\n"
-                    f"Payment Portal: Use your registration number ({reg.registration_number}) to make payments\n\n"
-                    f"If you have any questions, please contact us.\n\n"
-                    f"– OncoOne Team"
-                )
-                EmailMessage(user_subject, user_body, settings.DEFAULT_FROM_EMAIL, [reg.email]).send(fail_silently=True)
+                user_subject, user_body = welcome_email_content(reg.name, reg.email, reg.registration_number, course_name)
+                with timed('email'):
+                    EmailMessage(user_subject, user_body, settings.DEFAULT_FROM_EMAIL, [reg.email]).send(fail_silently=True)
             except Exception:
                 pass
 
@@ -167,6 +176,7 @@ def register_view(request):
 
 # Admin API: list, edit, delete registrations (development use only)
 @csrf_exempt
+@replica_reads
 def registrations_list(request):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
@@ -283,6 +293,7 @@ def registration_detail(request, pk):
     return HttpResponseNotAllowed(['GET', 'PUT', 'PATCH', 'DELETE'])
 
 
+@db_limits('export')
 @staff_member_required
 def download_proof_db(request, pk):
     enrollment = get_object_or_404(StudentCourseEnrollment, pk=pk)
@@ -295,6 +306,7 @@ def download_proof_db(request, pk):
     return resp
 
 
+@db_limits('export')
 @staff_member_required
 def download_proof(request, pk):
     """Serve attached proof whether stored in DB (`proof_data`) or on disk (`proof`)."""
@@ -321,6 +333,32 @@ def download_proof(request, pk):
     return HttpResponse(status=404)
 
 
+@db_limits('export')
+@staff_member_required
+def admin_import_students(request):
+    """Bulk-import students from an uploaded CSV ('file'); emails are queued, not sent"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    csv_file = request.FILES.get('file')
+    if not csv_file:
+        return HttpResponseBadRequest('CSV file is required')
+
+    dry_run = request.POST.get('dry_run', '').lower() in ('yes', '1', 'true')
+    try:
+        result = import_students(csv_file, dry_run=dry_run)
+    except ImportFileError as e:
+        return JsonResponse({'status': 'error', 'error': str(e)}, status=400)
+    except IntegrityError:
+        # A student registered through the site while the import ran; nothing was written
+        return JsonResponse({
+            'status': 'error',
+            'error': 'A student in this file registered while the import was running. Please retry.',
+        }, status=409)
+
+    return JsonResponse({'status': 'ok', **result})
+
+
 @staff_member_required
 def admin_students_page(request):
     """Render the admin students page (served from Django so admin session authenticates downloads)."""
@@ -340,6 +378,33 @@ def admin_payments_page(request):
 
 
 @staff_member_required
+def admin_query_report(request):
+    """Slow queries and N+1 patterns from the query log, worst first (?format=json for the raw rows)."""
+    rows = query_log.report()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'enabled': query_log.enabled(), 'rows': rows})
+    return render(request, 'admin/query-report.html', {
+        'enabled': query_log.enabled(),
+        'rows': rows,
+        'slow_ms': settings.QUERY_LOG_SLOW_MS,
+        'n_plus_one_threshold': settings.QUERY_LOG_N_PLUS_ONE_THRESHOLD,
+    })
+
+
+@staff_member_required
+def admin_download_profile(request, profile_id, artifact):
+    """Download a saved request profile: collapsed (folded stacks), prof (cProfile) or alloc (tracemalloc)."""
+    path = profiling.artifact_path(profile_id, artifact)
+    if path is None or not os.path.exists(path):
+        return HttpResponse('Profile not found', status=404)
+    with open(path, 'rb') as f:
+        response = HttpResponse(f.read(), content_type=profiling.ARTIFACTS[artifact][1])
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(path)}"'
+    return response
+
+
+@staff_member_required
+@replica_reads
 def admin_payments_list(request):
     """API endpoint to get all payments with student details."""
 
@@ -390,6 +455,7 @@ def admin_payments_list(request):
         }, status=500)
 
 
+@db_limits('export')
 @staff_member_required
 def admin_download_invoice(request, payment_id):
     """Download invoice PDF for a payment."""
@@ -402,7 +468,7 @@ def admin_download_invoice(request, payment_id):
             if payment.status == 'completed':
                 if not payment.invoice_number:
                     payment.generate_invoice_number()
-                    payment.save()
+                    payment.save(update_fields=['invoice_number', 'updated_at'])
                 
                 invoice, _created = PaymentInvoice.objects.get_or_create(payment=payment)
                 pdf_bytes = generate_invoice_pdf(payment)
@@ -496,7 +562,7 @@ def payment_verify_student(request):
         
         # Try by email
         if not registration:
-            registration = Registration.objects.filter(email=student_id).first()
+            registration = Registration.objects.filter(email=Registration.normalize_email(student_id)).first()
         
         if not registration:
             return JsonResponse({'error': 'Student not found. Please check your Registration Number (ON26-XXXXXX) or email.'}, status=404)
@@ -619,6 +685,7 @@ def payment_amount(request, student_id):
         enrollment = StudentCourseEnrollment.objects.get(id=int(enrollment_id), registration=registration)
     except (ValueError, StudentCourseEnrollment.DoesNotExist):
         return redirect('payment-portal-home')
+    tracing.annotate(enrollment_id=enrollment.id)
     
     # Get course price
     course_price = Course.objects.filter(course_name=enrollment.course_name).first()
@@ -720,6 +787,7 @@ def payment_summary(request, student_id):
         enrollment = registration.course_enrollments.first()
         if not enrollment:
             return redirect('payment-portal-home')
+    tracing.annotate(enrollment_id=enrollment.id)
     
     # Get values from session or query params
     payment_amount = request.GET.get('amount', '0')
@@ -778,6 +846,7 @@ def payment_card_entry(request, student_id):
         enrollment = registration.course_enrollments.first()
         if not enrollment:
             return redirect('payment-portal-home')
+    tracing.annotate(enrollment_id=enrollment.id)
     
     # Get course price
     course_price = Course.objects.filter(course_name=enrollment.course_name).first()
@@ -885,13 +954,10 @@ def process_payment(request):
             card_holder_name=card_holder,
             card_last_four=card_last_four,
             transaction_id=str(uuid.uuid4()),
+            invoice_number=allocate_invoice_number(),
             completed_at=timezone.now()
         )
         
-        # Generate invoice number
-        payment.generate_invoice_number()
-        payment.save()
-        
         # Create invoice record
         invoice_html = f"""
         <html>
@@ -1050,7 +1116,8 @@ Thank you for your payment!
                         'application/pdf'
                     )
                 
-                email_msg.send(fail_silently=True)
+                with timed('email'):
+                    email_msg.send(fail_silently=True)
             except Exception as e:
                 print(f"Email send failed: {e}")
         
@@ -1188,6 +1255,7 @@ def payment_invoice_download(request, payment_id):
         return HttpResponse(f'Error generating PDF: {str(e)}', status=500)
 
 
+@timed('pdf')
 def generate_invoice_pdf(payment):
     """Generate a minimal PDF invoice for a payment (stable fallback)."""
     from reportlab.lib.pagesizes import letter
@@ -1231,6 +1299,107 @@ def generate_invoice_pdf(payment):
     return buffer.getvalue()
 
 
+def _find_reusable_payment(enrollment):
+    """Return an unexpired pending Stripe payment for this enrollment that can take a new OTP"""
+    cutoff = timezone.now() - timedelta(minutes=settings.PAYMENT_TIMEOUT_MINUTES)
+    payment = (
+        Payment.objects
+        .filter(enrollment=enrollment, status='pending', created_at__gte=cutoff)
+        .exclude(stripe_payment_intent_id__isnull=True)
+        .exclude(stripe_payment_intent_id='')
+        .order_by('-created_at')
+        .first()
+    )
+    # Never hand a fresh code to a payment that is locked out after failed attempts
+    if payment and OTPSecurityManager.is_locked_out(f'payment_{payment.id}')[0]:
+        return None
+    return payment
+
+
+def _issue_payment_otp(payment, ip_address):
+    """
+    Create the payment's OTP, or rotate the code on the existing row
+
+    Failed attempts carry over to the new code, so re-posting checkout or
+    resending cannot reset the count that leads to the lockout.
+    """
+    otp_expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
+    with immediate_atomic():
+        otp, _created = PaymentOTP.objects.update_or_create(
+            payment=payment,
+            defaults={
+                'otp_code': OTPSecurityManager.generate_otp_code(),
+                'is_verified': False,
+                'verified_at': None,
+                'expires_at': timezone.now() + timedelta(minutes=otp_expiry_minutes),
+                'ip_address': ip_address,
+            },
+        )
+    payment.otp = otp
+    logger.info(f'✅ OTP generated for payment {payment.id} | Student: {payment.registration.email}')
+    return otp
+
+
+def _send_payment_otp_email(payment):
+    """Email the payment's current OTP code to the student. Returns True when sent."""
+    registration = payment.registration
+    otp = payment.otp
+    otp_expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
+    try:
+        subject = f'🔐 Payment Verification Code - {settings.BUSINESS_NAME}'
+        message = f"""
+Dear {registration.name},
+
+Thank you for choosing {settings.BUSINESS_NAME}.
+
+To complete your secure payment, please verify your transaction with the following One-Time Password (OTP):
+
+╔═══════════════════════════╗
+║   OTP CODE: {otp.otp_code}        ║
+╚═══════════════════════════╝
+
+This code is valid for {otp_expiry_minutes} minutes and can be used only once.
+
+📋 PAYMENT SUMMARY
+─────────────────────────────────
+Course:          {payment.course_name}
+Payment Amount:  CAD ${payment.payment_amount_cad:.2f}
+Tax ({settings.TAX_NAME}):         CAD ${payment.tax_amount:.2f}
+Total Amount:    CAD ${payment.final_amount_cad:.2f}
+─────────────────────────────────
+Payment Method:  {(payment.payment_method or '').upper()} ending in {payment.card_last_four}
+Cardholder:      {payment.card_holder_name}
+
+🔒 SECURITY NOTICE:
+• Do not share this code with anyone
+• Our staff will never ask for your OTP
+• You have {settings.OTP_MAX_ATTEMPTS} verification attempts
+
+If you did not initiate this payment, please contact us immediately at {settings.BUSINESS_EMAIL}
+
+Thank you for your trust,
+{settings.BUSINESS_NAME} Team
+{settings.BUSINESS_EMAIL}
+{settings.BUSINESS_PHONE}
+            """
+        
+        email_obj = EmailMessage(
+            subject=subject,
+            body=message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[registration.email],
+            reply_to=[settings.BUSINESS_EMAIL]
+        )
+        with timed('email'):
+            email_obj.send(fail_silently=False)
+        logger.info(f'✅ OTP email sent successfully to {registration.email}')
+        return True
+    except Exception as e:
+        logger.error(f'❌ FAILED to send OTP email to {registration.email}: {str(e)} | Type: {type(e).__name__}', exc_info=True)
+        # Don't fail the request if email fails
+        return False
+
+
 @csrf_exempt
 def create_payment_and_send_otp(request):
     """Create payment record with Stripe and send OTP for verification (Production-Ready)"""
@@ -1285,132 +1454,163 @@ def create_payment_and_send_otp(request):
             enrollment = StudentCourseEnrollment.objects.get(id=int(enrollment_id), registration=registration)
         except (ValueError, StudentCourseEnrollment.DoesNotExist):
             return JsonResponse({'error': 'Invalid enrollment'}, status=404)
+        tracing.annotate(enrollment_id=enrollment.id)
         
         # Get course price
         course_price_obj = Course.objects.filter(course_name=enrollment.course_name).first()
         if not course_price_obj:
             return JsonResponse({'error': 'Course price not found'}, status=404)
         
-        # Create Stripe Payment Intent
-        stripe_result = StripePaymentProcessor.create_payment_intent(
-            amount_cad=total_amount,
-            email=email,
-            student_name=registration.name,
-            course_name=enrollment.course_name,
-            payment_id=None,  # We'll update after creating Payment
-            payment_method_id=payment_method_id
-        )
+        gateway = get_payment_gateway()
+        reused = False
+        
+        # Reuse an unexpired pending payment for this enrollment instead of
+        # creating a new PaymentIntent, Payment, PaymentInvoice and PaymentOTP on every retry
+        payment = _find_reusable_payment(enrollment)
+        if payment:
+            # Attach the newly entered card, and the new amount only if it changed
+            amount_changed = payment.final_amount_cad != total_amount
+            stripe_result = gateway.update_payment_intent(
+                payment.stripe_payment_intent_id,
+                amount_cad=total_amount if amount_changed else None,
+                payment_method_id=payment_method_id,
+            )
+            if stripe_result['success']:
+                stripe_client_secret = stripe_result.get('client_secret')
+            elif stripe_result.get('error_type') == 'service_unavailable':
+                return _payments_unavailable_response(stripe_result)
+            else:
+                # The intent can no longer be modified - fall back to a fresh one
+                payment = None
+            if payment:
+                reused = True
+                payment.payment_amount_cad = payment_amount
+                payment.tax_amount = tax_amount
+                payment.final_amount_cad = total_amount
+                payment.total_price_cad = course_price_obj.price_cad
+                payment.payment_method = card_type
+                payment.card_holder_name = card_holder
+                payment.card_last_four = card_last_four
+                payment.save(update_fields=[
+                    'payment_amount_cad', 'tax_amount', 'final_amount_cad', 'total_price_cad',
+                    'payment_method', 'card_holder_name', 'card_last_four', 'updated_at',
+                ])
+                logger.info(f'Reusing pending payment {payment.id} for enrollment {enrollment.id}')
+        
+        if not payment:
+            # Create Stripe Payment Intent
+            stripe_result = gateway.create_payment_intent(
+                amount_cad=total_amount,
+                email=email,
+                student_name=registration.name,
+                course_name=enrollment.course_name,
+                payment_id=None,  # We'll update after creating Payment
+                payment_method_id=payment_method_id
+            )
+            
+            if not stripe_result['success']:
+                if stripe_result.get('error_type') == 'service_unavailable':
+                    return _payments_unavailable_response(stripe_result)
+                return JsonResponse({'error': f'Payment processing error: {stripe_result["error"]}'}, status=400)
+            
+            stripe_client_secret = stripe_result['client_secret']
+            stripe_payment_intent_id = stripe_result['payment_intent_id']
+            
+            # Create payment record with 'pending' status (waiting for OTP verification)
+            with immediate_atomic():
+                payment = Payment.objects.create(
+                    registration=registration,
+                    enrollment=enrollment,
+                    student_id=str(student_id),
+                    course_name=enrollment.course_name,
+                    total_price_cad=course_price_obj.price_cad,
+                    payment_amount_cad=payment_amount,
+                    tax_amount=tax_amount,
+                    final_amount_cad=total_amount,
+                    status='pending',  # Waiting for OTP verification
+                    payment_method=card_type,
+                    card_holder_name=card_holder,
+                    card_last_four=card_last_four,
+                    transaction_id=str(uuid.uuid4()),
+                    stripe_payment_intent_id=stripe_payment_intent_id,
+                    stripe_customer_id=None  # Will be set after OTP verification
+                )
+            
+                # Create PaymentInvoice record (will be filled after payment confirmation)
+                PaymentInvoice.objects.create(payment=payment)
         
-        if not stripe_result['success']:
-            return JsonResponse({'error': f'Payment processing error: {stripe_result["error"]}'}, status=400)
+        tracing.annotate(payment_id=payment.id)
+        # Issue a fresh OTP code (rotates the existing row when the payment is reused)
+        payment.registration = registration
+        payment.enrollment = enrollment
+        _issue_payment_otp(payment, request.META.get('REMOTE_ADDR'))
         
-        stripe_client_secret = stripe_result['client_secret']
-        stripe_payment_intent_id = stripe_result['payment_intent_id']
+        email_sent = _send_payment_otp_email(payment)
         
-        # Create payment record with 'pending' status (waiting for OTP verification)
-        payment = Payment.objects.create(
-            registration=registration,
-            enrollment=enrollment,
-            student_id=str(student_id),
-            course_name=enrollment.course_name,
-            total_price_cad=course.price_cad,
-            payment_amount_cad=payment_amount,
-            tax_amount=tax_amount,
-            final_amount_cad=total_amount,
-            status='pending',  # Waiting for OTP verification
-            payment_method=card_type,
-            card_holder_name=card_holder,
-            card_last_four=card_last_four,
-            transaction_id=str(uuid.uuid4()),
-            stripe_payment_intent_id=stripe_payment_intent_id,
-            stripe_customer_id=None  # Will be set after OTP verification
-        )
+        return JsonResponse({
+            'success': True,
+            'payment_id': payment.id,
+            'stripe_client_secret': stripe_client_secret,
+            'email_sent': email_sent,
+            'reused': reused,
+            'message': f'Payment created. OTP {"sent to " + registration.email if email_sent else "generation failed - please try again."}'
+        })
+    
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        print(f"Error creating payment: {e}")
+        return JsonResponse({'error': f'An error occurred: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+def resend_payment_otp(request):
+    """Rotate the OTP code of a pending payment and email it again (no Stripe call)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        payment_id = data.get('payment_id')
+        if not payment_id:
+            return JsonResponse({'error': 'Missing payment ID'}, status=400)
         
-        # Create PaymentInvoice record (will be filled after payment confirmation)
-        PaymentInvoice.objects.create(payment=payment)
+        try:
+            payment = Payment.objects.select_related('registration', 'enrollment').get(id=int(payment_id), status='pending')
+        except (ValueError, Payment.DoesNotExist):
+            return JsonResponse({'error': 'Payment not found or already completed'}, status=404)
+        tracing.annotate(payment_id=payment.id, enrollment_id=payment.enrollment_id)
         
-        # Create OTP with security settings
-        from datetime import timedelta
-        otp_expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
+        cutoff = timezone.now() - timedelta(minutes=settings.PAYMENT_TIMEOUT_MINUTES)
+        if payment.created_at < cutoff:
+            return JsonResponse({'error': 'This payment session has expired. Please start a new payment.'}, status=410)
         
-        otp = PaymentOTP.objects.create(
-            payment=payment,
-            expires_at=timezone.now() + timedelta(minutes=otp_expiry_minutes),
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
-        otp.generate_otp()
-        otp.save()
+        identifier = f'payment_{payment.id}'
+        is_locked, seconds_remaining = OTPSecurityManager.is_locked_out(identifier)
+        if is_locked:
+            return JsonResponse({
+                'error': f'Account temporarily locked due to multiple failed attempts. Please try again in {seconds_remaining // 60} minutes.'
+            }, status=429)
         
-        logger.info(f'✅ OTP generated for payment {payment.id} | Student: {email} | Code: {otp.otp_code}')
+        cooldown = getattr(settings, 'OTP_RESEND_COOLDOWN_SECONDS', 60)
+        if not cache.add(f'otp_resend_{payment.id}', 1, timeout=cooldown):
+            return JsonResponse({'error': f'Please wait {cooldown} seconds before requesting another code.'}, status=429)
         
-        # Send professional OTP email
-        email_sent = False
-        try:
-            subject = f'🔐 Payment Verification Code - {settings.BUSINESS_NAME}'
-            message = f"""
-Dear {registration.name},
-
-Thank you for choosing {settings.BUSINESS_NAME}.
-
-To complete your secure payment, please verify your transaction with the following One-Time Password (OTP):
-
-╔═══════════════════════════╗
-║   OTP CODE: {otp.otp_code}        ║
-╚═══════════════════════════╝
-
-This code is valid for {otp_expiry_minutes} minutes and can be used only once.
-
-📋 PAYMENT SUMMARY
-─────────────────────────────────
-Course:          {enrollment.course_name}
-Payment Amount:  CAD ${payment_amount:.2f}
-Tax ({settings.TAX_NAME}):         CAD ${tax_amount:.2f}
-Total Amount:    CAD ${total_amount:.2f}
-─────────────────────────────────
-Payment Method:  {card_type.upper()} ending in {card_last_four}
-Cardholder:      {card_holder}
-
-🔒 SECURITY NOTICE:
-• Do not share this code with anyone
-• Our staff will never ask for your OTP
-• You have {settings.OTP_MAX_ATTEMPTS} verification attempts
-
-If you did not initiate this payment, please contact us immediately at {settings.BUSINESS_EMAIL}
-
-Thank you for your trust,
-{settings.BUSINESS_NAME} Team
-{settings.BUSINESS_EMAIL}
-{settings.BUSINESS_PHONE}
-            """
-            
-            email_obj = EmailMessage(
-                subject=subject,
-                body=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[registration.email],
-                reply_to=[settings.BUSINESS_EMAIL]
-            )
-            email_obj.send(fail_silently=False)
-            email_sent = True
-            logger.info(f'✅ OTP email sent successfully to {email}')
-        except Exception as e:
-            logger.error(f'❌ FAILED to send OTP email to {email}: {str(e)} | Type: {type(e).__name__}', exc_info=True)
-            # Don't fail the request if email fails
-            pass
+        _issue_payment_otp(payment, request.META.get('REMOTE_ADDR'))
+        email_sent = _send_payment_otp_email(payment)
         
         return JsonResponse({
             'success': True,
             'payment_id': payment.id,
-            'stripe_client_secret': stripe_client_secret,
             'email_sent': email_sent,
-            'message': f'Payment created. OTP {"sent to " + registration.email if email_sent else "generation failed - please try again."}'
+            'expires_in_seconds': getattr(settings, 'OTP_EXPIRY_MINUTES', 10) * 60,
         })
     
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     except Exception as e:
-        print(f"Error creating payment: {e}")
-        return JsonResponse({'error': f'An error occurred: {str(e)}'}, status=500)
+        logger.error(f'Error resending OTP: {e}', exc_info=True)
+        return JsonResponse({'error': 'An error occurred. Please try again.'}, status=500)
 
 
 @csrf_exempt
@@ -1428,25 +1628,30 @@ def verify_payment_otp(request):
         # Input validation
         if not all([payment_id, otp_code]):
             security_logger.warning('OTP verification attempted with missing data')
+            metrics.inc('oncoone_otp_verifications_total', outcome='malformed')
             return JsonResponse({'error': 'Missing payment ID or OTP code'}, status=400)
         
         # Validate OTP format before database query
         if not OTPSecurityManager.validate_otp_format(otp_code):
             security_logger.warning(f'Invalid OTP format attempted for payment {payment_id}')
+            metrics.inc('oncoone_otp_verifications_total', outcome='malformed')
             return JsonResponse({'error': 'Invalid OTP format'}, status=400)
         
         # Get payment and OTP
         try:
             payment = Payment.objects.select_related('registration', 'enrollment', 'otp').get(id=payment_id)
+            tracing.annotate(payment_id=payment.id, enrollment_id=payment.enrollment_id)
             otp = payment.otp
-            logger.info(f'OTP Verification Attempt: Payment {payment_id} | DB OTP Code: {otp.otp_code} (length={len(otp.otp_code)}) | Attempts: {otp.attempts}/{settings.OTP_MAX_ATTEMPTS} | Verified: {otp.is_verified}')
+            logger.info(f'OTP Verification Attempt: Payment {payment_id} | Attempts: {otp.attempts}/{settings.OTP_MAX_ATTEMPTS} | Verified: {otp.is_verified}')
         except Payment.DoesNotExist:
             logger.error(f'❌ OTP verification: Payment {payment_id} not found')
             security_logger.warning(f'OTP verification attempted for non-existent payment: {payment_id}')
+            metrics.inc('oncoone_otp_verifications_total', outcome='not_found')
             return JsonResponse({'error': 'Payment not found'}, status=404)
         except PaymentOTP.DoesNotExist:
             logger.error(f'❌ OTP verification: No OTP record for payment {payment_id}')
             security_logger.error(f'Missing OTP for payment: {payment_id}')
+            metrics.inc('oncoone_otp_verifications_total', outcome='not_found')
             return JsonResponse({'error': 'OTP not found. Please request a new code'}, status=404)
         
         # Check for lockout
@@ -1455,6 +1660,7 @@ def verify_payment_otp(request):
         
         if is_locked:
             security_logger.warning(f'🔒 Locked out payment OTP verification: {payment_id}')
+            metrics.inc('oncoone_otp_verifications_total', outcome='locked')
             minutes_remaining = seconds_remaining // 60
             return JsonResponse({
                 'error': f'Account temporarily locked due to multiple failed attempts. Please try again in {minutes_remaining} minutes.'
@@ -1463,10 +1669,11 @@ def verify_payment_otp(request):
         # Verify OTP with enhanced security
         success, message = otp.verify_otp(otp_code)
         
-        logger.info(f'OTP Verification Result: Entered={otp_code} | Success={success} | Message={message}')
+        logger.info(f'OTP Verification Result: Payment {payment_id} | Success={success} | Message={message}')
         
         if not success:
             security_logger.warning(f'❌ Failed OTP verification for payment {payment_id}: {message}')
+            metrics.inc('oncoone_otp_verifications_total', outcome='invalid')
             
             # Check if should lock out
             if otp.attempts >= settings.OTP_MAX_ATTEMPTS:
@@ -1475,13 +1682,14 @@ def verify_payment_otp(request):
             return JsonResponse({'error': message}, status=400)
         
         logger.info(f'✅ OTP verified successfully for payment {payment.id}')
+        metrics.inc('oncoone_otp_verifications_total', outcome='verified')
         
         if success:
             # Confirm Stripe Payment Intent
             if payment.stripe_payment_intent_id:
                 try:
                     # Retrieve and confirm the intent using the attached payment method from metadata
-                    stripe_result = StripePaymentProcessor.confirm_payment(payment.stripe_payment_intent_id)
+                    stripe_result = get_payment_gateway().confirm_payment(payment.stripe_payment_intent_id)
                     
                     if stripe_result['success']:
                         # Get charge id from confirm result; fallback to first charge
@@ -1496,18 +1704,16 @@ def verify_payment_otp(request):
                         if charge_id:
                             payment.stripe_charge_id = charge_id
                         
-                        # Update payment status to completed
-                        payment.status = 'completed'
-                        payment.completed_at = timezone.now()
-                        payment.save()
-                        
-                        # Generate invoice number and create invoice
-                        payment.generate_invoice_number()
-                        payment.save()
-                        
-                        # Ensure invoice record exists
-                        if not hasattr(payment, 'invoice'):
-                            PaymentInvoice.objects.create(payment=payment)
+                        # Mark completed and assign the invoice number in a single write
+                        with immediate_atomic():
+                            payment.status = 'completed'
+                            payment.completed_at = timezone.now()
+                            payment.generate_invoice_number()
+                            payment.save()
+                            
+                            # Ensure invoice record exists
+                            if not hasattr(payment, 'invoice'):
+                                PaymentInvoice.objects.create(payment=payment)
 
                         # Generate and save PDF invoice safely
                         try:
@@ -1557,7 +1763,8 @@ info@oncoesthetics.ca
                                 'application/pdf'
                             )
                             
-                            email_obj.send(fail_silently=True)
+                            with timed('email'):
+                                email_obj.send(fail_silently=True)
                         except Exception as e:
                             logger.error(f"Failed to send confirmation email: {e}")
                         
@@ -1567,6 +1774,8 @@ info@oncoesthetics.ca
                             'invoice_number': payment.invoice_number,
                             'message': 'Payment verified and confirmed successfully!'
                         })
+                    elif stripe_result.get('error_type') == 'service_unavailable':
+                        return _payments_unavailable_response(stripe_result)
                     else:
                         # If 3DS or further action is required, surface info to client
                         logger.error(f"Stripe confirmation failed: {stripe_result}")
@@ -1586,9 +1795,11 @@ info@oncoesthetics.ca
                     }, status=500)
             else:
                 # Fallback for non-Stripe payments
-                payment.status = 'completed'
-                payment.completed_at = timezone.now()
-                payment.save()
+                with immediate_atomic():
+                    payment.status = 'completed'
+                    payment.completed_at = timezone.now()
+                    payment.generate_invoice_number()
+                    payment.save()
                 
                 return JsonResponse({
                     'status': 'success',
@@ -1829,6 +2040,7 @@ def download_payment_invoice(request, payment_id):
         return HttpResponse('Invoice not found', status=404)
 
 
+@db_limits('export')
 @staff_member_required
 def admin_generate_invoice(request, payment_id):
     """Generate and persist an invoice (PDF + HTML) for an existing payment.
@@ -1846,7 +2058,7 @@ def admin_generate_invoice(request, payment_id):
     # Ensure invoice number exists
     if not payment.invoice_number:
         payment.generate_invoice_number()
-        payment.save()
+        payment.save(update_fields=['invoice_number', 'updated_at'])
 
     # Create or get invoice record
     invoice, _created = PaymentInvoice.objects.get_or_create(payment=payment)
@@ -1862,3 +2074,27 @@ def admin_generate_invoice(request, payment_id):
 
     return HttpResponse(f'Invoice generated for {payment.invoice_number}', status=200)
 
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint (text exposition format)
+
+    Open to staff sessions and to the addresses in METRICS_ALLOWED_IPS
+    (the Prometheus server); everyone else gets a 403. Requests over
+    gunicorn's unix socket carry no client address and match 'unix'.
+    """
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    remote_addr = request.META.get('REMOTE_ADDR') or 'unix'
+    user = getattr(request, 'user', None)
+    if not (user is not None and user.is_staff) and remote_addr not in allowed_ips:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    if not metrics.enabled():
+        return HttpResponse('Metrics are disabled', status=404, content_type='text/plain')
+
+    # The queue depth is a gauge (it goes down), so it is read now instead of summed across workers
+    depth = {(('status', status),): 0 for status in ('pending', 'sending', 'failed')}
+    for row in QueuedEmail.objects.filter(status__in=['pending', 'sending', 'failed']).order_by().values('status').annotate(count=Count('id')):
+        depth[(('status', row['status']),)] = row['count']
+
+    body = metrics.render_text(gauges={'oncoone_email_queue_depth': depth})
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
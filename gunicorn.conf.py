@@ -0,0 +1,30 @@
+"""
+Gunicorn settings, read automatically when gunicorn starts in this directory
+
+GUNICORN_WORKERS and GUNICORN_THREADS are also read by backend/settings.py to
+size the per-process database pool, so set them in .env rather than on the
+command line.
+"""
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).resolve().parent / '.env')
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '3'))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+
+# Workers write their metrics here and /metrics merges them (core/metrics.py).
+# Set before the workers fork so they all inherit it; cleared at startup so a
+# restart starts counting from zero, as Prometheus expects.
+os.environ.setdefault('METRICS_DIR', os.path.join(os.getenv('TMPDIR', '/tmp'), f'oncoone-metrics-{os.getuid()}'))
+
+
+def on_starting(server):
+    metrics_dir = Path(os.environ['METRICS_DIR'])
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    for stale in metrics_dir.glob('metrics-*.json'):
+        stale.unlink()